@@ -1,5 +1,6 @@
 #include <PS2X_lib.h>
 #include <ESP32Servo.h> 
+#include "binary_frame.h"
 
 // khai báo servo
 Servo srv1;
@@ -65,6 +66,14 @@ bool pcCommandReady = false;   // Cờ đánh dấu nhận đủ lệnh
 bool pcControlActive = false;  // Đang điều khiển từ PC
 unsigned long pcStopTime = 0;  // Thời điểm nhận lệnh D# từ PC
 bool waitingAfterPCStop = false; // Đang chờ 1s sau khi PC gửi D#
+BinaryFrameDecoder pcFrameDecoder;  // Decoder frame nhị phân từ PC
+bool pcBinaryMode = false;     // PC đang gửi frame nhị phân → trả lời bằng frame
+uint8_t pcTxSeq = 0;           // Seq frame gửi lên PC
+const int PC_SEQ_HISTORY = 8;  // Số seq vừa thực hiện được nhớ (lệnh gửi lại trùng chỉ ACK)
+int pcSeqHistory[PC_SEQ_HISTORY];
+uint8_t pcSeqHistoryIndex = 0;
+int lastPCMotionSeq = -1;      // Seq T#/D# mới nhất đã thực hiện (T# cũ hơn đến trễ → NAK)
+enum PCSeqStatus { PC_SEQ_NEW, PC_SEQ_DUPLICATE, PC_SEQ_STALE };
 
 // Biến cho harvest automation
 enum HarvestState {
@@ -87,6 +96,7 @@ void setup() {
   Serial2.begin(9600, SERIAL_8N1, RXD2, TXD2); // Serial2 để truyền sang Nano_2
   
   pcCommandBuffer.reserve(50);  // Dự trữ bộ nhớ cho buffer PC
+  resetPCSeq();
   nano1Buffer.reserve(20);       // Dự trữ bộ nhớ cho buffer Nano_1
   
   Serial.println("Khoi tao tay cam PS2...");
@@ -184,8 +194,18 @@ void loop() {
 void readPCCommand() {
   // Đọc dữ liệu từ Serial (USB - PC)
   while (Serial.available() > 0) {
-    char inChar = (char)Serial.read();
+    uint8_t inByte = Serial.read();
     
+    // Frame nhị phân (bắt đầu bằng 0xAA) - lệnh ASCII không bao giờ có byte này
+    if (bf_busy(pcFrameDecoder) || inByte == BF_SYNC) {
+      if (bf_feed(pcFrameDecoder, inByte)) {
+        pcBinaryMode = true;
+        handlePCFrame(pcFrameDecoder.frame);
+      }
+      continue;
+    }
+    
+    char inChar = (char)inByte;
     if (inChar == '#') {
       pcCommandReady = true;
       break;
@@ -203,50 +223,42 @@ void readPCCommand() {
   }
   // Xử lý lệnh khi nhận đủ
   if (pcCommandReady) {
+    pcBinaryMode = false;  // PC dùng ASCII → trả lời bằng text
     pcCommandBuffer.trim();
     pcCommandBuffer.toUpperCase();
     
+    // Lệnh có seq ("D@12") → trả "ACK:12" ngay (lệnh gửi lại trùng seq thì chỉ ACK),
+    // T# cũ hơn T#/D# đã thực hiện thì trả "NAK:12" và bỏ qua
+    int seqIndex = pcCommandBuffer.indexOf('@');
+    PCSeqStatus seqStatus = PC_SEQ_NEW;
+    if (seqIndex >= 0) {
+      int cmdSeq = pcCommandBuffer.substring(seqIndex + 1).toInt();
+      pcCommandBuffer = pcCommandBuffer.substring(0, seqIndex);
+      seqStatus = checkPCSeq(cmdSeq, pcCommandBuffer.charAt(0));
+      Serial.print(seqStatus == PC_SEQ_STALE ? "NAK:" : "ACK:");
+      Serial.println(cmdSeq);
+    }
+    
     Serial.print("[PC] Received: ");
     Serial.println(pcCommandBuffer);
     
-    if (pcCommandBuffer == "T") {
-      // Lệnh TIEN - bật PC control mode
-      pcControlActive = true;
-      waitingAfterPCStop = false;
-      pcControlStartTime = millis();  // Lưu thời điểm bắt đầu
-      pcControlPhase = 1;              // Bắt đầu phase 1: initial forward
+    if (seqStatus == PC_SEQ_DUPLICATE) {
+      Serial.println("[PC] Duplicate command - ignored");
       
-      Serial.println("[PC] TIEN mode activated - PS2 disabled, starting smooth ramp-up");
-      
-    } else if (pcCommandBuffer == "D") {
-      // Lệnh DUNG - tắt PC control mode và gửi dừng
-      pcControlActive = false;
+    } else if (seqStatus == PC_SEQ_STALE) {
+      Serial.println("[PC] Stale command - rejected");
       
-      // Gửi lệnh dừng xuống Nano_2
-      String wheelString = "0,0,0,0#";
-      Serial2.print(wheelString);
+    } else if (pcCommandBuffer == "R") {
+      resetPCSeq();
+      Serial.println("[PC] Seq history reset");
       
-      // Bắt đầu chờ 1s
-      pcStopTime = millis();
-      waitingAfterPCStop = true;
+    } else if (pcCommandBuffer == "T") {
+      pcCmdTien();
       
-      Serial.println("[PC] DUNG - Sent stop, waiting 1s before PS2 control");
+    } else if (pcCommandBuffer == "D") {
+      pcCmdDung();
       
     } else if (pcCommandBuffer.startsWith("G")) {
-      // Lệnh tọa độ Gz,y# - chuyển tiếp xuống Nano_1 và bắt đầu harvest sequence
-      
-      // KIỂM TRA: Chỉ chấp nhận lệnh G# khi KHÔNG đang harvest
-      if (harvestState != HARVEST_IDLE) {
-        Serial.println("[PC] ERROR: Cannot start new harvest - Already harvesting!");
-        Serial.print("[PC] Current state: ");
-        Serial.println(harvestState);
-        
-        // Reset buffer nhưng không xử lý
-        pcCommandBuffer = "";
-        pcCommandReady = false;
-        return;  // Bỏ qua lệnh này
-      }
-      
       String coordStr = pcCommandBuffer.substring(1);  // Bỏ chữ "G"
       
       // Parse Z và Y
@@ -254,28 +266,7 @@ void readPCCommand() {
       if (commaIndex > 0) {
         float z = coordStr.substring(0, commaIndex).toFloat();
         float y = coordStr.substring(commaIndex + 1).toFloat();
-        
-        // Lưu Z hiện tại để dùng cho về khay
-        currentZ = z;
-        
-        // Tạo lệnh gửi xuống Nano_1 (format: z,y#)
-        String cmd = String(z, 1) + "," + String(y, 1) + "#";
-        Serial1.print(cmd);
-        
-        // Mở gắp ra trước khi bắt đầu (giống R2)
-        performRelease();
-        Serial.println("[AUTO] Opening gripper before movement");
-        
-        // Chuyển sang state chờ di chuyển
-        harvestState = HARVEST_WAIT_MOVE1;
-        
-        Serial.print("[PC] COORD sent to Nano_1: ");
-        Serial.print(cmd);
-        Serial.print(" (Z=");
-        Serial.print(z);
-        Serial.print(", Y=");
-        Serial.print(y);
-        Serial.println(") - Waiting for DONE#");
+        pcCmdCoord(z, y);
       } else {
         Serial.println("[PC] Invalid coordinate format!");
       }
@@ -290,6 +281,151 @@ void readPCCommand() {
   }
 }
 
+// PC mới kết nối (R#): seq của phiên trước không còn ý nghĩa
+void resetPCSeq() {
+  for (int i = 0; i < PC_SEQ_HISTORY; i++) {
+    pcSeqHistory[i] = -1;
+  }
+  pcSeqHistoryIndex = 0;
+  lastPCMotionSeq = -1;
+}
+
+// Phân loại lệnh có seq và ghi nhận lệnh mới (kind: 'T', 'D', 'G'):
+// - seq nằm trong lịch sử gần đây → lệnh gửi lại của lệnh đã chạy (chỉ ACK)
+// - T# cũ hơn T#/D# đã chạy (so sánh quay vòng 0-255) → đến trễ, không được chạy lại
+// - D# và G luôn chạy, lệnh khác loại đến lệch thứ tự không bị bỏ
+PCSeqStatus checkPCSeq(int seq, char kind) {
+  seq &= 0xFF;
+  for (int i = 0; i < PC_SEQ_HISTORY; i++) {
+    if (pcSeqHistory[i] == seq) {
+      return PC_SEQ_DUPLICATE;
+    }
+  }
+  bool motion = (kind == 'T' || kind == 'D');
+  bool newer = lastPCMotionSeq < 0 || (int8_t)((uint8_t)seq - (uint8_t)lastPCMotionSeq) > 0;
+  if (kind == 'T' && !newer) {
+    return PC_SEQ_STALE;
+  }
+  pcSeqHistory[pcSeqHistoryIndex] = seq;
+  pcSeqHistoryIndex = (pcSeqHistoryIndex + 1) % PC_SEQ_HISTORY;
+  if (motion && newer) {
+    lastPCMotionSeq = seq;
+  }
+  return PC_SEQ_NEW;
+}
+
+void handlePCFrame(const BinaryFrame &frame) {
+  // Frame nhị phân từ PC - payload cố định, không cần parse chuỗi/float
+  Serial.print("[PC] Received frame type ");
+  Serial.print(frame.type);
+  Serial.print(" seq ");
+  Serial.println(frame.seq);
+  
+  if (frame.type == BF_SEQ_RESET) {
+    resetPCSeq();
+    Serial.println("[PC] Seq history reset");
+    return;
+  }
+  
+  // Xác nhận frame ngay (frame gửi lại trùng seq thì chỉ ACK), T# đến trễ thì NAK
+  char kind = frame.type == BF_TIEN ? 'T' : (frame.type == BF_DUNG ? 'D' : 'G');
+  PCSeqStatus seqStatus = checkPCSeq(frame.seq, kind);
+  uint8_t ack[2] = {frame.seq, frame.type};
+  bf_send(Serial, seqStatus == PC_SEQ_STALE ? BF_NAK : BF_ACK, ++pcTxSeq, ack, 2);
+  if (seqStatus == PC_SEQ_DUPLICATE) {
+    Serial.println("[PC] Duplicate frame - ignored");
+    return;
+  }
+  if (seqStatus == PC_SEQ_STALE) {
+    Serial.println("[PC] Stale frame - rejected");
+    return;
+  }
+  
+  switch (frame.type) {
+    case BF_TIEN:
+      pcCmdTien();
+      break;
+    case BF_DUNG:
+      pcCmdDung();
+      break;
+    case BF_COORD:
+      // int16 z*10, int16 y*10
+      pcCmdCoord(bf_get_i16(frame.payload) / 10.0, bf_get_i16(frame.payload + 2) / 10.0);
+      break;
+    default:
+      Serial.println("[PC] Unknown frame type!");
+      break;
+  }
+}
+
+void sendToPC(uint8_t frameType, const char *text) {
+  // Trả lời PC theo giao thức PC đang dùng
+  if (pcBinaryMode) {
+    bf_send(Serial, frameType, ++pcTxSeq, NULL, 0);
+  } else {
+    Serial.println(text);
+  }
+}
+
+void pcCmdTien() {
+  // Lệnh TIEN - bật PC control mode
+  pcControlActive = true;
+  waitingAfterPCStop = false;
+  pcControlStartTime = millis();  // Lưu thời điểm bắt đầu
+  pcControlPhase = 1;              // Bắt đầu phase 1: initial forward
+  
+  Serial.println("[PC] TIEN mode activated - PS2 disabled, starting smooth ramp-up");
+}
+
+void pcCmdDung() {
+  // Lệnh DUNG - tắt PC control mode và gửi dừng
+  pcControlActive = false;
+  
+  // Gửi lệnh dừng xuống Nano_2
+  String wheelString = "0,0,0,0#";
+  Serial2.print(wheelString);
+  
+  // Bắt đầu chờ 1s
+  pcStopTime = millis();
+  waitingAfterPCStop = true;
+  
+  Serial.println("[PC] DUNG - Sent stop, waiting 1s before PS2 control");
+}
+
+void pcCmdCoord(float z, float y) {
+  // Lệnh tọa độ Gz,y# - chuyển tiếp xuống Nano_1 và bắt đầu harvest sequence
+  
+  // KIỂM TRA: Chỉ chấp nhận lệnh G# khi KHÔNG đang harvest
+  if (harvestState != HARVEST_IDLE) {
+    Serial.println("[PC] ERROR: Cannot start new harvest - Already harvesting!");
+    Serial.print("[PC] Current state: ");
+    Serial.println(harvestState);
+    return;  // Bỏ qua lệnh này
+  }
+  
+  // Lưu Z hiện tại để dùng cho về khay
+  currentZ = z;
+  
+  // Tạo lệnh gửi xuống Nano_1 (format: z,y#)
+  String cmd = String(z, 1) + "," + String(y, 1) + "#";
+  Serial1.print(cmd);
+  
+  // Mở gắp ra trước khi bắt đầu (giống R2)
+  performRelease();
+  Serial.println("[AUTO] Opening gripper before movement");
+  
+  // Chuyển sang state chờ di chuyển
+  harvestState = HARVEST_WAIT_MOVE1;
+  
+  Serial.print("[PC] COORD sent to Nano_1: ");
+  Serial.print(cmd);
+  Serial.print(" (Z=");
+  Serial.print(z);
+  Serial.print(", Y=");
+  Serial.print(y);
+  Serial.println(") - Waiting for DONE#");
+}
+
 void readNano1Response() {
   // Đọc phản hồi từ Nano_1 (Serial1)
   while (Serial1.available() > 0) {
@@ -426,7 +562,7 @@ void handleHarvestSequence() {
           Serial.println("[HARVEST] ✅ RETURNED TO WAIT POSITION - HARVEST COMPLETE!");
           
           // Gửi thông báo về PC (bây giờ mới gửi)
-          Serial.println("HARVEST_DONE#");
+          sendToPC(BF_HARVEST_DONE, "HARVEST_DONE#");
           
           // Reset state
           harvestState = HARVEST_IDLE;
@@ -551,7 +687,7 @@ void read_PS2() {
       Serial2.print(wheelString);
       
       // Gửi STOP lên PC
-      Serial.println("STOP");
+      sendToPC(BF_STOP, "STOP");
       
       Serial.println("[EMERGENCY] SELECT pressed - PC control stopped, sent STOP to PC");
       delay(500);  // Debounce
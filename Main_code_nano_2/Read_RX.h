@@ -2,6 +2,7 @@
 #define READ_RX_H
 
 #include <Arduino.h>
+#include "binary_frame.h"
 
 // Biến lưu trữ dữ liệu nhận được
 int L_dir = 0;         // Hướng động cơ trái (0=dừng, 1=thuận, 2=nghịch)
@@ -11,6 +12,7 @@ int R_rpm = 0;         // RPM động cơ bên phải
 
 String inputString = "";     // Chuỗi nhận được
 bool stringComplete = false; // Đánh dấu nhận đủ chuỗi
+BinaryFrameDecoder rxFrameDecoder; // Decoder frame nhị phân (BF_WHEELS)
 
 // Biến timeout để bảo vệ an toàn
 unsigned long lastDataTime = 0;  // Thời gian nhận dữ liệu cuối cùng
@@ -25,13 +27,33 @@ void setup_RX() {
   lastDataTime = millis();
 }
 
+// Cập nhật giá trị bánh xe (đã giới hạn) và thời gian nhận
+void apply_RX(int ldir, int lrpm, int rdir, int rrpm) {
+  L_dir = constrain(ldir, 0, 2);
+  R_dir = constrain(rdir, 0, 2);
+  L_rpm = constrain(lrpm, 0, 500);
+  R_rpm = constrain(rrpm, 0, 500);
+  lastDataTime = millis();
+}
+
 // Hàm đọc dữ liệu từ UART
 // Format: "dir_L,rpm_L,dir_R,rpm_R#"
 // Ví dụ: "1,100,2,50#" = Trái thuận 100rpm, Phải nghịch 50rpm
+// Hoặc frame nhị phân BF_WHEELS (xem binary_frame.h)
 void read_RX() {
   while (Serial.available() > 0) {
-    char inChar = (char)Serial.read();
+    uint8_t inByte = Serial.read();
     
+    // Frame nhị phân bắt đầu bằng 0xAA
+    if (bf_busy(rxFrameDecoder) || inByte == BF_SYNC) {
+      if (bf_feed(rxFrameDecoder, inByte) && rxFrameDecoder.frame.type == BF_WHEELS) {
+        const uint8_t *p = rxFrameDecoder.frame.payload;
+        apply_RX(p[0], bf_get_u16(p + 1), p[3], bf_get_u16(p + 4));
+      }
+      continue;
+    }
+    
+    char inChar = (char)inByte;
     if (inChar == '#') {
       stringComplete = true;
       break; // Thoát ngay khi nhận đủ chuỗi
@@ -55,19 +77,10 @@ void read_RX() {
     int thirdComma = inputString.indexOf(',', secondComma + 1);
     
     if (firstComma > 0 && secondComma > firstComma && thirdComma > secondComma) {
-      L_dir = inputString.substring(0, firstComma).toInt();
-      L_rpm = inputString.substring(firstComma + 1, secondComma).toInt();
-      R_dir = inputString.substring(secondComma + 1, thirdComma).toInt();
-      R_rpm = inputString.substring(thirdComma + 1).toInt();
-      
-      // Giới hạn giá trị hợp lệ
-      L_dir = constrain(L_dir, 0, 2);
-      R_dir = constrain(R_dir, 0, 2);
-      L_rpm = constrain(L_rpm, 0, 500);
-      R_rpm = constrain(R_rpm, 0, 500);
-      
-      // Cập nhật thời gian nhận dữ liệu
-      lastDataTime = millis();
+      apply_RX(inputString.substring(0, firstComma).toInt(),
+               inputString.substring(firstComma + 1, secondComma).toInt(),
+               inputString.substring(secondComma + 1, thirdComma).toInt(),
+               inputString.substring(thirdComma + 1).toInt());
     }
     
     // Xóa buffer và cờ
@@ -0,0 +1,141 @@
+#ifndef BINARY_FRAME_H
+#define BINARY_FRAME_H
+
+#include <Arduino.h>
+
+// Frame nhị phân PC <-> MCU (little-endian), khớp với XLA/binary_protocol.py:
+//   [0xAA][VER][TYPE][SEQ][LEN][PAYLOAD (LEN byte)][CRC16 lo][CRC16 hi]
+// CRC16-CCITT (poly 0x1021, init 0xFFFF) tính trên VER..PAYLOAD.
+// Lệnh ASCII không bao giờ chứa byte 0xAA nên 2 chế độ dùng chung 1 cổng.
+
+#define BF_SYNC     0xAA
+#define BF_VERSION  1
+#define BF_MAX_PAYLOAD 8
+
+// PC -> MCU
+#define BF_TIEN          0x01  // T#
+#define BF_DUNG          0x02  // D#
+#define BF_COORD         0x03  // G z,y#  - int16 z*10, int16 y*10
+#define BF_WHEELS        0x04  // L_dir,L_rpm,R_dir,R_rpm# - uint8, uint16, uint8, uint16
+// MCU -> PC
+#define BF_HARVEST_DONE  0x10  // HARVEST_DONE#
+#define BF_STOP          0x11  // STOP
+#define BF_ACK           0x12  // uint8 seq, uint8 type
+
+struct BinaryFrame {
+  uint8_t type;
+  uint8_t seq;
+  uint8_t len;
+  uint8_t payload[BF_MAX_PAYLOAD];
+};
+
+struct BinaryFrameDecoder {
+  uint8_t state;   // 0 = chờ sync, 1..4 = header, 5 = payload, 6..7 = CRC
+  uint8_t index;
+  uint16_t crc;
+  uint16_t rxCrc;
+  BinaryFrame frame;
+};
+
+// Độ dài payload cố định theo type, -1 nếu type không hợp lệ
+inline int bf_payload_size(uint8_t type) {
+  switch (type) {
+    case BF_TIEN: case BF_DUNG: case BF_HARVEST_DONE: case BF_STOP: return 0;
+    case BF_COORD: return 4;
+    case BF_WHEELS: return 6;
+    case BF_ACK: return 2;
+    default: return -1;
+  }
+}
+
+inline uint16_t bf_crc16_update(uint16_t crc, uint8_t b) {
+  crc ^= (uint16_t)b << 8;
+  for (uint8_t i = 0; i < 8; i++) {
+    crc = (crc & 0x8000) ? (uint16_t)((crc << 1) ^ 0x1021) : (uint16_t)(crc << 1);
+  }
+  return crc;
+}
+
+inline void bf_reset(BinaryFrameDecoder &d) {
+  d.state = 0;
+  d.index = 0;
+  d.crc = 0xFFFF;
+}
+
+// Đang giữa 1 frame (byte tiếp theo phải đưa vào bf_feed)
+inline bool bf_busy(const BinaryFrameDecoder &d) {
+  return d.state != 0;
+}
+
+// Đưa 1 byte vào decoder, trả về true khi nhận xong 1 frame hợp lệ (d.frame)
+inline bool bf_feed(BinaryFrameDecoder &d, uint8_t b) {
+  switch (d.state) {
+    case 0:  // Sync
+      if (b == BF_SYNC) {
+        d.crc = 0xFFFF;
+        d.state = 1;
+      }
+      return false;
+    case 1:  // Version
+      if (b != BF_VERSION) { bf_reset(d); return false; }
+      d.crc = bf_crc16_update(d.crc, b);
+      d.state = 2;
+      return false;
+    case 2:  // Type
+      d.frame.type = b;
+      d.crc = bf_crc16_update(d.crc, b);
+      d.state = 3;
+      return false;
+    case 3:  // Seq
+      d.frame.seq = b;
+      d.crc = bf_crc16_update(d.crc, b);
+      d.state = 4;
+      return false;
+    case 4:  // Len - phải đúng độ dài cố định của type
+      if (bf_payload_size(d.frame.type) != (int)b) { bf_reset(d); return false; }
+      d.frame.len = b;
+      d.crc = bf_crc16_update(d.crc, b);
+      d.index = 0;
+      d.state = (b > 0) ? 5 : 6;
+      return false;
+    case 5:  // Payload
+      d.frame.payload[d.index++] = b;
+      d.crc = bf_crc16_update(d.crc, b);
+      if (d.index >= d.frame.len) d.state = 6;
+      return false;
+    case 6:  // CRC lo
+      d.rxCrc = b;
+      d.state = 7;
+      return false;
+    case 7: {  // CRC hi
+      d.rxCrc |= (uint16_t)b << 8;
+      bool ok = (d.rxCrc == d.crc);
+      bf_reset(d);
+      return ok;
+    }
+  }
+  bf_reset(d);
+  return false;
+}
+
+inline int16_t bf_get_i16(const uint8_t *p) {
+  return (int16_t)((uint16_t)p[0] | ((uint16_t)p[1] << 8));
+}
+
+inline uint16_t bf_get_u16(const uint8_t *p) {
+  return (uint16_t)p[0] | ((uint16_t)p[1] << 8);
+}
+
+// Gửi 1 frame ra stream (Serial)
+inline void bf_send(Stream &out, uint8_t type, uint8_t seq, const uint8_t *payload, uint8_t len) {
+  uint8_t header[5] = {BF_SYNC, BF_VERSION, type, seq, len};
+  uint16_t crc = 0xFFFF;
+  for (uint8_t i = 1; i < 5; i++) crc = bf_crc16_update(crc, header[i]);
+  for (uint8_t i = 0; i < len; i++) crc = bf_crc16_update(crc, payload[i]);
+  out.write(header, 5);
+  if (len > 0) out.write(payload, len);
+  out.write((uint8_t)(crc & 0xFF));
+  out.write((uint8_t)(crc >> 8));
+}
+
+#endif // BINARY_FRAME_H
@@ -0,0 +1,386 @@
+import os
+import csv
+import glob
+import time
+import queue
+import argparse
+import threading
+import contextlib
+from collections import namedtuple, Counter
+from concurrent.futures import ThreadPoolExecutor
+
+import cv2
+import numpy as np
+
+from harvest_engine import HarvestEngine
+from detector_worker import DetectionResult
+from box_geometry import extract_boxes
+import box_geometry
+import model_backends
+
+
+# Chạy detector + logic zone / tọa độ của HarvestEngine trên ảnh và video đã quay
+# (không cần camera): giải mã song song ở thread pool, inference theo batch,
+# ghi kết quả từng frame / từng box ra file dạng cột (.npz hoặc .csv).
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.bmp', '.tif', '.tiff', '.webp')
+VIDEO_EXTENSIONS = ('.mp4', '.avi', '.mov', '.mkv', '.m4v', '.wmv')
+
+# Quyết định harvest của 1 frame (như process_detection + test_cut_strawberry trong test mode)
+DECISION_NONE = "none"                # Không có dâu Ripe trong zone - xe đi tiếp
+DECISION_CUT = "cut"                  # Ripe trong zone, tool với tới → D# rồi G
+DECISION_UNREACHABLE = "unreachable"  # Ripe trong zone nhưng ngoài hành trình tool → bỏ qua
+DECISION_NO_DISTANCE = "no_distance"  # Ripe trong zone nhưng không tính được khoảng cách
+DECISION_SKIP_UNRIPE = "skip_unripe"  # Chỉ có Unripe trong zone - xe đi tiếp
+
+# 1 frame đã giải mã + tiền xử lý (flip / độ sáng như DetectorWorker)
+FrameItem = namedtuple('FrameItem', ['source', 'index', 'frame', 'decode_time'])
+
+_END = object()
+
+
+def collect_files(paths):
+    """File ảnh / video từ danh sách file, thư mục hoặc glob (giữ thứ tự, sort trong thư mục)"""
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            names = sorted(os.listdir(path))
+            candidates = [os.path.join(path, name) for name in names]
+        elif any(char in path for char in '*?['):
+            candidates = sorted(glob.glob(path))
+        else:
+            candidates = [path]
+        for candidate in candidates:
+            if candidate.lower().endswith(IMAGE_EXTENSIONS + VIDEO_EXTENSIONS) and os.path.isfile(candidate):
+                files.append(candidate)
+            elif candidate == path:
+                print(f"[WARNING] Skipping {path}: not an image or video file")
+    return files
+
+
+class FrameSource:
+    """Iterator FrameItem theo đúng thứ tự file, giải mã trước tối đa `prefetch` frame
+
+    Ảnh: mỗi ảnh là 1 task trong thread pool (cv2.imread nhả GIL nên chạy song
+    song thật). Video: đọc tuần tự ở thread producer (decoder FFmpeg của OpenCV
+    tự chia thread), mỗi frame tiền xử lý ở pool. Queue có giới hạn nên decode
+    chỉ chạy trước inference vừa đủ, không đọc hết video vào RAM.
+    """
+
+    def __init__(self, paths, transform=None, workers=None, prefetch=64, video_stride=1):
+        self.files = collect_files(paths)
+        self.transform = transform
+        self.workers = workers or os.cpu_count() or 1
+        self.video_stride = max(1, int(video_stride))
+        self.queue = queue.Queue(maxsize=max(1, prefetch))
+        self.pool = None
+        self.thread = None
+        self.running = False
+        self.failed = []   # File không đọc được
+
+    def __iter__(self):
+        self.running = True
+        self.pool = ThreadPoolExecutor(self.workers, thread_name_prefix="decode")
+        self.thread = threading.Thread(target=self._produce, daemon=True)
+        self.thread.start()
+        try:
+            while True:
+                item = self.queue.get()
+                if item is _END:
+                    break
+                item = item.result()
+                if item.frame is None:
+                    self.failed.append(item.source)
+                    continue
+                yield item
+        finally:
+            self.close()
+
+    def close(self):
+        self.running = False
+        # Rút bớt queue để producer đang chờ put() thoát được
+        while self.thread is not None and self.thread.is_alive():
+            try:
+                self.queue.get(timeout=0.05)
+            except queue.Empty:
+                pass
+        self.thread = None
+        if self.pool is not None:
+            self.pool.shutdown(wait=True, cancel_futures=True)
+            self.pool = None
+
+    def _put(self, item):
+        while self.running:
+            try:
+                self.queue.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _produce(self):
+        try:
+            for path in self.files:
+                if path.lower().endswith(IMAGE_EXTENSIONS):
+                    if not self._put(self.pool.submit(self._load_image, path)):
+                        return
+                elif not self._produce_video(path):
+                    return
+        finally:
+            self._put(_END)
+
+    def _produce_video(self, path):
+        cap = cv2.VideoCapture(path)
+        if not cap.isOpened():
+            print(f"[WARNING] Cannot open video {path}")
+            self.failed.append(path)
+            return True
+        try:
+            index = 0
+            while self.running:
+                start = time.perf_counter()
+                ok, frame = cap.read()
+                if not ok:
+                    break
+                if index % self.video_stride == 0:
+                    decode_time = time.perf_counter() - start
+                    if not self._put(self.pool.submit(self._prepare, path, index, frame, decode_time)):
+                        return False
+                index += 1
+        finally:
+            cap.release()
+        return True
+
+    def _load_image(self, path):
+        start = time.perf_counter()
+        frame = cv2.imread(path)
+        return self._prepare(path, 0, frame, time.perf_counter() - start)
+
+    def _prepare(self, path, index, frame, decode_time):
+        if frame is not None and self.transform is not None:
+            start = time.perf_counter()
+            frame = self.transform(frame)
+            decode_time += time.perf_counter() - start
+        return FrameItem(path, index, frame, decode_time)
+
+
+def batches(items, size):
+    batch = []
+    for item in items:
+        batch.append(item)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def harvest_decision(harvest_frame, boxes):
+    """(decision, Z_tool, Y_tool) cho 1 HarvestFrame - giống nhánh auto cut của engine"""
+    target = harvest_frame.target
+    if target < 0:
+        unripe_in_zone = bool((harvest_frame.in_zone & (boxes.cls != 0)).any())
+        return (DECISION_SKIP_UNRIPE if unripe_in_zone else DECISION_NONE), -1, -1
+    if harvest_frame.distance[target] <= 0:
+        return DECISION_NO_DISTANCE, -1, -1
+    Z_tool, Y_tool = (int(v) for v in box_geometry.tool_coordinates(harvest_frame.Y[target],
+                                                                     harvest_frame.Z[target]))
+    if not box_geometry.tool_reachable(Z_tool, Y_tool):
+        return DECISION_UNREACHABLE, Z_tool, Y_tool
+    return DECISION_CUT, Z_tool, Y_tool
+
+
+class BatchEvaluator:
+    """Inference theo batch bằng model của engine, rồi đúng logic zone / tọa độ của engine
+
+    Mỗi frame độc lập (ảnh rời, frame video cách nhau stride) nên dùng predict
+    không tracking - track_ids luôn -1. Kích thước ảnh lấy theo từng frame.
+    """
+
+    def __init__(self, engine, batch_size=8, imgsz=640):
+        self.engine = engine
+        self.batch_size = max(1, int(batch_size))
+        self.imgsz = imgsz
+        class_ids = sorted(engine.class_names)
+        self.class_ids = class_ids
+
+        self.frame_columns = {name: [] for name in (
+            'source', 'frame', 'width', 'height', 'boxes',
+            *(f'count_{engine.class_names[c]}' for c in class_ids),
+            'target', 'target_in_zone', 'target_X', 'target_Y', 'target_Z',
+            'Z_tool', 'Y_tool', 'decision', 'decode_ms', 'inference_ms')}
+        self.box_parts = []
+        self.frames = 0
+        self.decode_time = 0.0
+        self.inference_time = 0.0
+        self.decision_time = 0.0
+        self.wall_time = 0.0
+
+    def run(self, source):
+        """Đánh giá toàn bộ FrameSource, trả về self (kết quả trong frame_columns / box_parts)"""
+        start = time.perf_counter()
+        # process_detection in debug từng frame - tắt khi chạy batch
+        with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+            for batch in batches(source, self.batch_size):
+                self._run_batch(batch)
+        self.wall_time = time.perf_counter() - start
+        return self
+
+    def _run_batch(self, batch):
+        engine = self.engine
+        begin = time.perf_counter()
+        results = engine.model.predict([item.frame for item in batch],
+                                       imgsz=self.imgsz,
+                                       conf=engine.conf_threshold,
+                                       iou=engine.iou_threshold,
+                                       verbose=False)
+        elapsed = time.perf_counter() - begin
+        if len(results) != len(batch):
+            raise RuntimeError(f"Model returned {len(results)} results for a batch of {len(batch)}")
+        self.inference_time += elapsed
+        per_frame = elapsed / len(batch)
+
+        begin = time.perf_counter()
+        for item, result in zip(batch, results):
+            self._process(item, extract_boxes([result]), per_frame)
+        self.decision_time += time.perf_counter() - begin
+
+    def _process(self, item, boxes, inference_time):
+        engine = self.engine
+        height, width = item.frame.shape[:2]
+        engine.image_width, engine.image_height = width, height
+
+        self.frames += 1
+        self.decode_time += item.decode_time
+        detection = DetectionResult(self.frames, item.index, item.frame, boxes, 0.0, inference_time, 0.0, None)
+        harvest_frame = engine.process_detection(detection)
+        decision, Z_tool, Y_tool = harvest_decision(harvest_frame, boxes)
+
+        target = harvest_frame.target
+        row = self.frame_columns
+        row['source'].append(item.source)
+        row['frame'].append(item.index)
+        row['width'].append(width)
+        row['height'].append(height)
+        row['boxes'].append(len(boxes.cls))
+        for c in self.class_ids:
+            row[f'count_{engine.class_names[c]}'].append(int(np.count_nonzero(boxes.cls == c)))
+        row['target'].append(target)
+        row['target_in_zone'].append(harvest_frame.target_in_zone)
+        for axis, values in (('X', harvest_frame.X), ('Y', harvest_frame.Y), ('Z', harvest_frame.Z)):
+            row[f'target_{axis}'].append(float(values[target]) if target >= 0 else np.nan)
+        row['Z_tool'].append(Z_tool)
+        row['Y_tool'].append(Y_tool)
+        row['decision'].append(decision)
+        row['decode_ms'].append(item.decode_time * 1000)
+        row['inference_ms'].append(inference_time * 1000)
+
+        n = len(boxes.cls)
+        if n:
+            xyxy = boxes.xyxy
+            self.box_parts.append({
+                'frame_row': np.full(n, self.frames - 1),
+                'x1': xyxy[:, 0], 'y1': xyxy[:, 1], 'x2': xyxy[:, 2], 'y2': xyxy[:, 3],
+                'conf': boxes.conf,
+                'cls': boxes.cls,
+                'in_zone': harvest_frame.in_zone,
+                'is_target': np.arange(n) == target,
+                'distance': harvest_frame.distance,
+                'X': harvest_frame.X, 'Y': harvest_frame.Y, 'Z': harvest_frame.Z,
+            })
+
+    def frame_table(self):
+        """Cột kết quả từng frame (dict tên cột → np.ndarray)"""
+        return {name: np.asarray(values) for name, values in self.frame_columns.items()}
+
+    def box_table(self):
+        """Cột kết quả từng box, frame_row trỏ tới dòng trong frame_table()"""
+        names = ('frame_row', 'x1', 'y1', 'x2', 'y2', 'conf', 'cls', 'in_zone', 'is_target',
+                 'distance', 'X', 'Y', 'Z')
+        if not self.box_parts:
+            return {name: np.zeros(0) for name in names}
+        return {name: np.concatenate([part[name] for part in self.box_parts]) for name in names}
+
+    def summary(self):
+        frames = max(self.frames, 1)
+        table = self.frame_table()
+        lines = [
+            f"Frames: {self.frames} from {len(set(self.frame_columns['source']))} files in {self.wall_time:.2f}s "
+            f"= {self.frames / max(self.wall_time, 1e-9):.1f} frames/s "
+            f"({self.engine.active_backend}, batch {self.batch_size})",
+            f"Per frame: decode+preprocess {self.decode_time / frames * 1000:.1f}ms (decode pool), "
+            f"inference {self.inference_time / frames * 1000:.1f}ms, "
+            f"decision {self.decision_time / frames * 1000:.2f}ms",
+        ]
+        if self.frames:
+            counts = ", ".join(f"{self.engine.class_names[c]}={int(table[f'count_{self.engine.class_names[c]}'].sum())}"
+                               for c in self.class_ids)
+            lines.append(f"Detections: {int(table['boxes'].sum())} ({counts})")
+            decisions = Counter(self.frame_columns['decision'])
+            lines.append("Decisions: " + ", ".join(f"{name}={count}" for name, count in decisions.most_common()))
+        return "\n".join(lines)
+
+
+def write_columns_csv(path, columns):
+    names = list(columns)
+    with open(path, 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(names)
+        writer.writerows(zip(*(columns[name].tolist() for name in names)))
+
+
+def save_results(path, evaluator):
+    """.npz: 1 file, cột frame_* và box_*; .csv: bảng frame + <tên>_boxes.csv"""
+    frames = evaluator.frame_table()
+    boxes = evaluator.box_table()
+    if path.lower().endswith('.csv'):
+        write_columns_csv(path, frames)
+        boxes_path = os.path.splitext(path)[0] + "_boxes.csv"
+        write_columns_csv(boxes_path, boxes)
+        return [path, boxes_path]
+    arrays = {f"frame_{name}": values for name, values in frames.items()}
+    arrays.update({f"box_{name}": values for name, values in boxes.items()})
+    np.savez_compressed(path, **arrays)
+    return [path if path.lower().endswith('.npz') else path + '.npz']
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Run the strawberry detector and harvest decision logic over image folders and videos")
+    parser.add_argument("inputs", nargs="+", help="Image/video files, folders or glob patterns (e.g. 'capture_*.jpg')")
+    parser.add_argument("--weights", default="best.pt", help="YOLO weights file")
+    parser.add_argument("--config", default="strawberry_config.txt",
+                        help="Config file (zone, calibration, conf/iou, flip, brightness)")
+    parser.add_argument("--backend", default=None, choices=("auto",) + model_backends.BACKEND_PRIORITY,
+                        help="Inference backend (default: model_backend from config)")
+    parser.add_argument("--batch", type=int, default=8, help="Frames per inference batch")
+    parser.add_argument("--imgsz", type=int, default=640, help="Inference image size")
+    parser.add_argument("--conf", type=float, default=None, help="Confidence threshold (default: from config)")
+    parser.add_argument("--workers", type=int, default=None, help="Decode threads (default: CPU count)")
+    parser.add_argument("--prefetch", type=int, default=None, help="Decoded frames to buffer (default: 4 batches)")
+    parser.add_argument("--video-stride", type=int, default=1, help="Only evaluate every Nth video frame")
+    parser.add_argument("--output", default="batch_eval.npz", help="Columnar output file (.npz or .csv)")
+    args = parser.parse_args()
+
+    engine = HarvestEngine(weights=args.weights, config_file=args.config, backend=args.backend)
+    if args.conf is not None:
+        engine.conf_threshold = args.conf
+
+    prefetch = args.prefetch or 4 * args.batch
+    source = FrameSource(args.inputs, transform=engine.detector.preprocess, workers=args.workers,
+                         prefetch=prefetch, video_stride=args.video_stride)
+    if not source.files:
+        print("No image or video files found")
+        return
+    print(f"Evaluating {len(source.files)} files (batch {args.batch}, {source.workers} decode threads)...")
+
+    evaluator = BatchEvaluator(engine, batch_size=args.batch, imgsz=args.imgsz).run(source)
+    print(evaluator.summary())
+    if source.failed:
+        print(f"Unreadable: {', '.join(source.failed)}")
+    for path in save_results(args.output, evaluator):
+        print(f"Saved {path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,528 @@
+import os
+import sys
+import glob
+import json
+import time
+import platform
+import argparse
+import importlib.util
+import threading
+import contextlib
+import subprocess
+from importlib import metadata
+
+import cv2
+import numpy as np
+
+import binary_protocol
+import box_geometry
+import corridor
+import model_backends
+import simple_tracker
+from detector_worker import DetectionResult
+from display import FrameDisplay
+from overlay import StaticOverlay, draw_detections
+from serial_transport import SerialTransport, LineParser, tag_command
+
+
+# Benchmark các đoạn nóng của realtime_detect.py / HarvestEngine với input tổng hợp
+# hoặc đã ghi (ảnh capture_*.jpg, phiên .hvlog). Kết quả JSON kèm thông tin môi
+# trường để so giữa các build (--compare baseline.json báo regression).
+
+SUITES = ('inference', 'postprocess', 'tracking', 'decision', 'overlay', 'display', 'serial')
+BOX_COUNTS = (0, 5, 20, 100)
+
+# Gói ghi vào metadata (tên phân phối pip)
+PACKAGES = ('numpy', 'ultralytics', 'torch', 'onnxruntime', 'openvino',
+            'pyserial', 'Pillow')
+
+CLASS_NAMES = {0: 'Ripe', 1: 'Unripe'}
+CLASS_COLORS = {0: (0, 255, 0), 1: (0, 0, 255)}
+
+
+# ===== Đo thời gian =====
+
+def measure(func, min_time=0.5, min_runs=5, max_runs=10000, warmup=2):
+    """Chạy func() tới khi đủ min_time giây (ít nhất min_runs lần), trả về mảng giây/lần"""
+    for _ in range(warmup):
+        func()
+    samples = []
+    deadline = time.perf_counter() + min_time
+    while len(samples) < max_runs:
+        start = time.perf_counter()
+        func()
+        end = time.perf_counter()
+        samples.append(end - start)
+        if len(samples) >= min_runs and end >= deadline:
+            break
+    return np.asarray(samples)
+
+
+def summarize(suite, name, params, samples, items=1):
+    """dict kết quả: thời gian (ms) mỗi lần gọi, items = số phần tử xử lý mỗi lần (frame, lệnh...)"""
+    ms = samples * 1000.0
+    p50, p95 = np.percentile(ms, (50, 95))
+    return {"suite": suite, "name": name, "params": params, "runs": len(samples),
+            "mean_ms": float(ms.mean()), "p50_ms": float(p50), "p95_ms": float(p95),
+            "min_ms": float(ms.min()), "std_ms": float(ms.std()),
+            "per_second": float(items / max(samples.mean(), 1e-12))}
+
+
+def result_key(result):
+    params = ",".join(f"{k}={v}" for k, v in sorted(result["params"].items()))
+    return f"{result['suite']}/{result['name']}[{params}]"
+
+
+# ===== Môi trường =====
+
+def package_version(name):
+    try:
+        return metadata.version(name)
+    except metadata.PackageNotFoundError:
+        return None
+
+
+def git_revision():
+    """(commit, có thay đổi chưa commit) của repo chứa file này, None nếu không có git"""
+    cwd = os.path.dirname(os.path.abspath(__file__))
+    try:
+        commit = subprocess.run(["git", "rev-parse", "HEAD"], cwd=cwd, capture_output=True,
+                                text=True, timeout=5).stdout.strip()
+        dirty = subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"], cwd=cwd,
+                               capture_output=True, text=True, timeout=5).stdout.strip()
+    except (OSError, subprocess.SubprocessError):
+        return None, None
+    return commit or None, bool(dirty) if commit else None
+
+
+def environment():
+    commit, dirty = git_revision()
+    info = {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "host": platform.node(),
+        "platform": platform.platform(),
+        "machine": platform.machine(),
+        "processor": platform.processor(),
+        "cpu_count": os.cpu_count(),
+        "python": platform.python_version(),
+        "opencv": cv2.__version__,
+        "opencv_threads": cv2.getNumThreads(),
+        "packages": {name: package_version(name) for name in PACKAGES},
+        "git_commit": commit,
+        "git_dirty": dirty,
+    }
+    if package_version('torch'):
+        import torch
+        info["torch_threads"] = torch.get_num_threads()
+    return info
+
+
+# ===== Input =====
+
+def synthetic_frame(width=640, height=480, seed=0):
+    """Ảnh BGR cố định theo seed: nền nhiễu + vài hình tròn đỏ/xanh cỡ quả dâu"""
+    rng = np.random.default_rng(seed)
+    frame = rng.integers(0, 80, size=(height, width, 3), dtype=np.uint8)
+    for _ in range(8):
+        center = (int(rng.integers(40, width - 40)), int(rng.integers(40, height - 40)))
+        color = (0, 0, 220) if rng.random() < 0.6 else (0, 200, 0)
+        cv2.circle(frame, center, int(rng.integers(15, 40)), color, -1)
+    return frame
+
+
+def load_frames(pattern, width=640, height=480):
+    """Ảnh đã chụp (glob) hoặc 4 ảnh tổng hợp nếu không có pattern"""
+    if pattern:
+        frames = [cv2.imread(path) for path in sorted(glob.glob(pattern))]
+        frames = [frame for frame in frames if frame is not None]
+        if frames:
+            return frames, "recorded"
+        print(f"[WARNING] No readable images match {pattern} - using synthetic frames")
+    return [synthetic_frame(width, height, seed) for seed in range(4)], "synthetic"
+
+
+def synthetic_boxes(n, width=640, height=480, seed=0):
+    """BoxArrays N box ngẫu nhiên (cố định theo seed), ~1/2 nằm quanh giữa ảnh"""
+    rng = np.random.default_rng(seed)
+    size = rng.uniform(30, 120, n)
+    cx = rng.uniform(0, width, n)
+    cy = rng.uniform(size / 2, height - size / 2)
+    data = np.column_stack([cx - size / 2, cy - size / 2, cx + size / 2, cy + size / 2,
+                            rng.uniform(0.5, 1.0, n), rng.integers(0, 2, n)]).astype(np.float32)
+    return data
+
+
+def moving_scene(n, frames=60, speed=6.0, width=640, height=480, seed=0):
+    """Chuỗi (N, 6) của N quả trôi sang trái `speed` px/frame (robot đi sang phải)"""
+    data = synthetic_boxes(n, width, height, seed)
+    scene = []
+    for i in range(frames):
+        step = data.copy()
+        step[:, [0, 2]] = (step[:, [0, 2]] - speed * i) % width
+        step[:, 2] = np.maximum(step[:, 2], step[:, 0] + 10)
+        scene.append(step)
+    return scene
+
+
+def recorded_detections(session):
+    """DetectionResult của các frame trong phiên .hvlog (dùng cho suite decision)"""
+    from replay import load_session, detection_from_record, EVENT_DETECTION
+    events, _, _ = load_session(session)
+    return [detection_from_record(data) for _, kind, data in events if kind == EVENT_DETECTION]
+
+
+def make_detection(boxes, seq=1):
+    return DetectionResult(seq, seq, None, boxes, 0.0, 0.0, 0.0, None)
+
+
+@contextlib.contextmanager
+def quiet():
+    """Engine in debug mỗi frame - bỏ đi trong lúc đo"""
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        yield
+
+
+def make_engine(config):
+    from harvest_engine import HarvestEngine
+    with quiet():
+        engine = HarvestEngine(weights=None, config_file=config)
+    return engine
+
+
+# ===== Suites =====
+
+def bench_inference(args, frames, source):
+    """model.predict mỗi backend × imgsz, cùng với extract_boxes trên kết quả thật"""
+    if not os.path.exists(args.weights):
+        print(f"[inference] Skipped: weights {args.weights} not found")
+        return
+    backends = args.backends or [b for b in model_backends.BACKEND_PRIORITY if model_backends.backend_available(b)]
+    for backend in backends:
+        with quiet():
+            model, active = model_backends.load_model(args.weights, backend)
+        if active != backend:
+            print(f"[inference] Skipped {backend}: not loadable (fell back to {active})")
+            continue
+        for imgsz in args.imgsz:
+            if imgsz != 640 and backend not in model_backends.DYNAMIC_BACKENDS:
+                continue  # Export cố định 640
+            index = [0]
+
+            def predict():
+                frame = frames[index[0] % len(frames)]
+                index[0] += 1
+                return model.predict(frame, imgsz=imgsz, conf=0.25, iou=0.45, verbose=False)
+
+            params = {"backend": backend, "imgsz": imgsz, "input": source}
+            yield summarize("inference", "predict", params,
+                            measure(predict, args.min_time, warmup=3))
+
+            results = [predict() for _ in range(len(frames))]
+            index[0] = 0
+
+            def extract():
+                box_geometry.extract_boxes(results[index[0] % len(results)])
+                index[0] += 1
+
+            yield summarize("postprocess", "extract_boxes", params, measure(extract, args.min_time))
+
+
+def bench_postprocess(args, frames, source):
+    """(N, 6) → BoxArrays và hình học box (tâm, khoảng cách, tọa độ 3D) theo số box"""
+    for n in BOX_COUNTS:
+        data = synthetic_boxes(n)
+        boxes = corridor.boxes_from_data(data)
+        xyxy = boxes.xyxy.astype(int)
+        params = {"boxes": n}
+
+        yield summarize("postprocess", "boxes_from_data", params,
+                        measure(lambda: corridor.boxes_from_data(data), args.min_time))
+
+        def geometry():
+            center_x, center_y = box_geometry.box_centers(xyxy)
+            distance = box_geometry.calculate_distance(xyxy[:, 2] - xyxy[:, 0], 3.0, 615)
+            box_geometry.calculate_3d_coordinates(center_x, center_y, distance, 615, 640, 480)
+
+        yield summarize("postprocess", "geometry", params, measure(geometry, args.min_time))
+
+
+def bench_tracking(args, frames, source):
+    """Chi phí tracker mỗi frame (ngoài model): CentroidTracker và ByteTrack/BoT-SORT của ultralytics"""
+    frame = frames[0]
+    methods = ["centroid"]
+    try:
+        has_trackers = importlib.util.find_spec("ultralytics.trackers") is not None
+    except ImportError:
+        has_trackers = False
+    if has_trackers:
+        methods += list(corridor.CorridorTracker.TRACKER_FILES)
+    else:
+        print("[tracking] ultralytics trackers not available - only centroid")
+
+    for n in BOX_COUNTS[1:]:
+        scene = moving_scene(n)
+        for method in methods:
+            if method == "centroid":
+                tracker = simple_tracker.CentroidTracker(direction=-1)
+            else:
+                with quiet():
+                    tracker = corridor.CorridorTracker(method)
+            index = [0]
+
+            def update():
+                tracker.update(scene[index[0] % len(scene)], frame)
+                index[0] += 1
+
+            yield summarize("tracking", method, {"boxes": n}, measure(update, args.min_time))
+
+
+def bench_decision(args, frames, source):
+    """HarvestEngine.process_detection (zone, ưu tiên, auto stop) - tổng hợp và từ phiên đã ghi"""
+    engine = make_engine(args.config)
+    engine.auto_stop_enabled = True
+    engine.test_mode_active = True
+
+    for n in BOX_COUNTS:
+        detection = make_detection(corridor.boxes_from_data(synthetic_boxes(n)))
+        with quiet():
+            samples = measure(lambda: engine.process_detection(detection), args.min_time)
+        yield summarize("decision", "process_detection", {"boxes": n, "input": "synthetic"}, samples)
+
+    if args.session:
+        detections = recorded_detections(args.session)
+        if detections:
+            index = [0]
+
+            def step():
+                engine.process_detection(detections[index[0] % len(detections)])
+                index[0] += 1
+
+            with quiet():
+                samples = measure(step, args.min_time)
+            yield summarize("decision", "process_detection",
+                            {"input": "recorded", "frames": len(detections)}, samples)
+
+
+def bench_overlay(args, frames, source):
+    """StaticOverlay.apply (zone + trục) và draw_detections theo số box"""
+    engine = make_engine(args.config)
+    frame = frames[0]
+    height, width = frame.shape[:2]
+    engine.image_width, engine.image_height = width, height
+    overlay = StaticOverlay()
+    canvas = frame.copy()
+
+    def static():
+        np.copyto(canvas, frame)
+        overlay.apply(canvas, engine.x_line_left, engine.x_line_right, True)
+
+    yield summarize("overlay", "static", {"size": f"{width}x{height}", "input": source},
+                    measure(static, args.min_time))
+
+    for n in BOX_COUNTS:
+        with quiet():
+            harvest_frame = engine.process_detection(make_detection(
+                corridor.boxes_from_data(synthetic_boxes(n, width, height))))
+
+        def detections():
+            np.copyto(canvas, frame)
+            draw_detections(canvas, harvest_frame, CLASS_NAMES, CLASS_COLORS)
+
+        yield summarize("overlay", "draw_detections", {"boxes": n, "size": f"{width}x{height}"},
+                        measure(detections, args.min_time))
+
+
+def bench_display(args, frames, source):
+    """BGR → RGBA (resize 800x600) như FrameDisplay; thêm paste vào PhotoImage nếu có Tk"""
+    frame = frames[0]
+    height, width = frame.shape[:2]
+    display = FrameDisplay(None, 800, 600)
+    yield summarize("display", "convert", {"size": f"{width}x{height}", "target": "800x600"},
+                    measure(lambda: display.convert(frame), args.min_time))
+
+    try:
+        import tkinter as tk
+        root = tk.Tk()
+    except Exception as e:
+        print(f"[display] Tk paste skipped: {e}")
+        return
+    try:
+        root.withdraw()
+        label = tk.Label(root)
+        display = FrameDisplay(label, 800, 600)
+        yield summarize("display", "show", {"size": f"{width}x{height}", "target": "800x600"},
+                        measure(lambda: display.show(frame), args.min_time))
+    finally:
+        root.destroy()
+
+
+def bench_serial(args, frames, source):
+    """Mã hóa / giải mã lệnh và vòng lệnh → ACK qua ESP32Simulator (trong process, pty)"""
+    commands = ["T#", "D#", "G148,113#"]
+
+    def encode_ascii():
+        for i, cmd in enumerate(commands):
+            tag_command(cmd, i)
+
+    def encode_binary():
+        for i, cmd in enumerate(commands):
+            binary_protocol.encode_command(cmd, i)
+
+    yield summarize("serial", "encode", {"protocol": "ascii"}, measure(encode_ascii, args.min_time),
+                    items=len(commands))
+    yield summarize("serial", "encode", {"protocol": "binary"}, measure(encode_binary, args.min_time),
+                    items=len(commands))
+
+    # Luồng nhận: 100 dòng/frame liền nhau, cắt thành mẩu 7 byte như đọc serial
+    text_stream = b"".join(f"ACK:{i % 256}\r\nHARVEST_DONE#\r\n".encode() for i in range(50))
+    frame_stream = b"".join(binary_protocol.encode_frame(binary_protocol.MSG_ACK, i % 256, i % 256, 1)
+                            + binary_protocol.encode_frame(binary_protocol.MSG_HARVEST_DONE, i % 256)
+                            for i in range(50))
+    for protocol, stream in (("ascii", text_stream), ("binary", frame_stream)):
+        parser = binary_protocol.protocol_options(protocol).get('parser') or LineParser()
+        pieces = [stream[i:i + 7] for i in range(0, len(stream), 7)]
+
+        def decode():
+            for piece in pieces:
+                parser.feed(piece)
+
+        yield summarize("serial", "decode", {"protocol": protocol, "bytes": len(stream)},
+                        measure(decode, args.min_time), items=100)
+
+    for link in ("in_process", "pty"):
+        for protocol in binary_protocol.PROTOCOLS:
+            result = serial_round_trip(link, protocol, args.min_time)
+            if result is not None:
+                yield result
+
+
+def serial_round_trip(link, protocol, min_time):
+    """Gửi T# có seq, chờ ACK từ simulator - đo toàn bộ đường gửi / nhận của SerialTransport"""
+    from esp32_simulator import ESP32Simulator
+
+    simulator = ESP32Simulator(verbose=False)
+    try:
+        if link == "pty":
+            if os.name != 'posix':
+                return None
+            transport = SerialTransport(port=simulator.open_pty(), **binary_protocol.protocol_options(protocol))
+            transport.open()
+        else:
+            transport = SerialTransport(ser=simulator.serial(), **binary_protocol.protocol_options(protocol))
+            transport.start()
+    except Exception as e:
+        simulator.close()
+        print(f"[serial] {link} round trip skipped: {e}")
+        return None
+
+    acked = threading.Condition()
+    last_ack = [None]
+
+    def on_line(line, timestamp):
+        if line.startswith("ACK:"):
+            with acked:
+                last_ack[0] = int(line[4:])
+                acked.notify_all()
+
+    transport.subscribe(on_line)
+
+    def round_trip():
+        seq = transport.next_seq()
+        with acked:
+            transport.send_command("T#", seq=seq)
+            if not acked.wait_for(lambda: last_ack[0] == seq, timeout=1.0):
+                raise TimeoutError(f"No ACK for seq {seq}")
+
+    try:
+        samples = measure(round_trip, min_time, max_runs=2000)
+        return summarize("serial", "round_trip", {"link": link, "protocol": protocol}, samples)
+    except TimeoutError as e:
+        print(f"[serial] {link}/{protocol} round trip failed: {e}")
+        return None
+    finally:
+        transport.close()
+        simulator.close()
+
+
+BENCHMARKS = {
+    'inference': bench_inference,
+    'postprocess': bench_postprocess,
+    'tracking': bench_tracking,
+    'decision': bench_decision,
+    'overlay': bench_overlay,
+    'display': bench_display,
+    'serial': bench_serial,
+}
+
+
+# ===== Báo cáo =====
+
+def format_result(result):
+    params = ", ".join(f"{k}={v}" for k, v in result["params"].items())
+    return (f"{result['suite']:<12} {result['name']:<18} {params:<42} "
+            f"p50 {result['p50_ms']:9.3f}ms  p95 {result['p95_ms']:9.3f}ms  "
+            f"{result['per_second']:12.1f}/s  ({result['runs']} runs)")
+
+
+def compare(results, baseline_path, threshold):
+    """In thay đổi p50 so với baseline, trả về số kết quả chậm hơn quá threshold"""
+    with open(baseline_path) as f:
+        baseline = {result_key(r): r for r in json.load(f)["results"]}
+    regressions = 0
+    print(f"\nCompared with {baseline_path} (regression if p50 > +{threshold:.0%}):")
+    for result in results:
+        old = baseline.get(result_key(result))
+        if old is None or old["p50_ms"] <= 0:
+            continue
+        change = result["p50_ms"] / old["p50_ms"] - 1
+        flag = ""
+        if change > threshold:
+            flag = "  REGRESSION"
+            regressions += 1
+        print(f"  {result_key(result):<70} {old['p50_ms']:9.3f} → {result['p50_ms']:9.3f}ms "
+              f"({change:+.1%}){flag}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark detection, decision, drawing and serial hot paths")
+    parser.add_argument("--suite", action="append", choices=SUITES, default=None,
+                        help="Suite to run (repeatable, default: all)")
+    parser.add_argument("--weights", default="best.pt", help="YOLO weights for the inference suite")
+    parser.add_argument("--backend", dest="backends", action="append",
+                        choices=model_backends.BACKEND_PRIORITY, default=None,
+                        help="Inference backend (repeatable, default: all installed)")
+    parser.add_argument("--imgsz", type=int, nargs="+", default=[640, 480, 320], help="Inference sizes")
+    parser.add_argument("--images", default=None,
+                        help="Glob of recorded frames (e.g. 'capture_*.jpg'), default: synthetic frames")
+    parser.add_argument("--session", default=None, help="Recorded session (.hvlog) for the decision suite")
+    parser.add_argument("--config", default="strawberry_config.txt", help="Config file (zone, calibration)")
+    parser.add_argument("--min-time", type=float, default=0.5, help="Seconds to measure each benchmark")
+    parser.add_argument("--output", default=None, help="Write results + environment as JSON")
+    parser.add_argument("--compare", default=None, help="Baseline JSON to compare against")
+    parser.add_argument("--threshold", type=float, default=0.2, help="Relative p50 slowdown counted as regression")
+    args = parser.parse_args()
+
+    frames, source = load_frames(args.images)
+    env = environment()
+    print(f"{env['platform']} | Python {env['python']} | {env['cpu_count']} CPUs | "
+          f"commit {(env['git_commit'] or 'unknown')[:10]}{' (dirty)' if env['git_dirty'] else ''}")
+
+    results = []
+    for suite in args.suite or SUITES:
+        for result in BENCHMARKS[suite](args, frames, source):
+            print(format_result(result))
+            results.append(result)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({"environment": env, "args": vars(args), "results": results}, f, indent=2)
+        print(f"Results written to {args.output}")
+
+    if args.compare and compare(results, args.compare, args.threshold):
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,222 @@
+import struct
+from collections import namedtuple
+
+from serial_transport import LineParser
+
+
+# Frame nhị phân PC ↔ ESP32 (little-endian):
+#   [0xAA][VER][TYPE][SEQ][LEN][PAYLOAD (LEN byte, cố định theo TYPE)][CRC16 lo][CRC16 hi]
+# CRC16-CCITT (poly 0x1021, init 0xFFFF) tính trên VER..PAYLOAD.
+# Decoder C tương ứng: CODE_ESP32/binary_frame.h
+SYNC = 0xAA
+VERSION = 1
+HEADER_SIZE = 5   # sync, version, type, seq, len
+CRC_SIZE = 2
+
+# PC → MCU
+MSG_TIEN = 0x01          # T#
+MSG_DUNG = 0x02          # D#
+MSG_COORD = 0x03         # G z,y#  - int16 z*10, int16 y*10
+MSG_WHEELS = 0x04        # L_dir,L_rpm,R_dir,R_rpm# - uint8, uint16, uint8, uint16
+MSG_SEQ_RESET = 0x05     # R#  - PC mới kết nối, ESP32 xóa lịch sử seq
+# MCU → PC
+MSG_HARVEST_DONE = 0x10  # HARVEST_DONE#
+MSG_STOP = 0x11          # STOP (nút SELECT trên tay cầm PS2)
+MSG_ACK = 0x12           # uint8 seq, uint8 type của frame được xác nhận
+MSG_NAK = 0x13           # uint8 seq, uint8 type của frame bị bỏ (cũ hơn lệnh đã chạy)
+
+PAYLOAD_FORMATS = {
+    MSG_TIEN: '',
+    MSG_DUNG: '',
+    MSG_COORD: '<hh',
+    MSG_WHEELS: '<BHBH',
+    MSG_SEQ_RESET: '',
+    MSG_HARVEST_DONE: '',
+    MSG_STOP: '',
+    MSG_ACK: '<BB',
+    MSG_NAK: '<BB',
+}
+PAYLOAD_SIZES = {msg_type: struct.calcsize(fmt) if fmt else 0 for msg_type, fmt in PAYLOAD_FORMATS.items()}
+MAX_PAYLOAD = max(PAYLOAD_SIZES.values())
+
+# Frame đã decode: values là tuple giá trị payload (đã unpack)
+Frame = namedtuple('Frame', ['type', 'seq', 'values'])
+
+
+def _crc16_table():
+    table = []
+    for byte in range(256):
+        crc = byte << 8
+        for _ in range(8):
+            crc = ((crc << 1) ^ 0x1021) if crc & 0x8000 else (crc << 1)
+        table.append(crc & 0xFFFF)
+    return table
+
+
+CRC16_TABLE = _crc16_table()
+
+
+def crc16_ccitt(data, crc=0xFFFF):
+    for byte in data:
+        crc = ((crc << 8) & 0xFFFF) ^ CRC16_TABLE[((crc >> 8) ^ byte) & 0xFF]
+    return crc
+
+
+def encode_frame(msg_type, seq, *values):
+    """Đóng gói 1 frame (bytes)"""
+    fmt = PAYLOAD_FORMATS[msg_type]
+    payload = struct.pack(fmt, *values) if fmt else b''
+    body = bytes((VERSION, msg_type, seq & 0xFF, len(payload))) + payload
+    return bytes((SYNC,)) + body + struct.pack('<H', crc16_ccitt(body))
+
+
+def parse_command(cmd):
+    """Lệnh ASCII ("T#", "D#", "R#", "G195,-40#", "1,100,2,50#") → (type, values), None nếu không đổi được"""
+    text = cmd.strip().rstrip('#').strip().upper()
+    try:
+        if text == 'T':
+            return MSG_TIEN, ()
+        if text == 'D':
+            return MSG_DUNG, ()
+        if text == 'R':
+            return MSG_SEQ_RESET, ()
+        if text.startswith('G'):
+            z, y = (float(v) for v in text[1:].split(','))
+            return MSG_COORD, (int(round(z * 10)), int(round(y * 10)))
+        parts = text.split(',')
+        if len(parts) == 4:
+            l_dir, l_rpm, r_dir, r_rpm = (int(v) for v in parts)
+            return MSG_WHEELS, (l_dir, l_rpm, r_dir, r_rpm)
+    except (ValueError, struct.error):
+        pass
+    return None
+
+
+def encode_command(cmd, seq):
+    """Lệnh ASCII → frame nhị phân, None nếu lệnh không có dạng nhị phân"""
+    parsed = parse_command(cmd)
+    if parsed is None:
+        return None
+    msg_type, values = parsed
+    try:
+        return encode_frame(msg_type, seq, *values)
+    except struct.error:
+        return None  # Giá trị ngoài khoảng int16/uint16
+
+
+def frame_to_text(frame):
+    """Frame → dòng ASCII tương đương (để code xử lý dòng cũ dùng lại được)"""
+    if frame.type == MSG_HARVEST_DONE:
+        return "HARVEST_DONE#"
+    if frame.type == MSG_STOP:
+        return "STOP"
+    if frame.type == MSG_ACK:
+        return f"ACK:{frame.values[0]}"
+    if frame.type == MSG_NAK:
+        return f"NAK:{frame.values[0]}"
+    if frame.type == MSG_TIEN:
+        return "T#"
+    if frame.type == MSG_DUNG:
+        return "D#"
+    if frame.type == MSG_SEQ_RESET:
+        return "R#"
+    if frame.type == MSG_COORD:
+        return f"G{frame.values[0] / 10:.1f},{frame.values[1] / 10:.1f}#"
+    if frame.type == MSG_WHEELS:
+        return "{},{},{},{}#".format(*frame.values)
+    return f"FRAME:{frame.type}"
+
+
+class FrameDecoder:
+    """Tách frame nhị phân khỏi luồng byte có lẫn text debug
+
+    ESP32 vẫn in log text (Serial.println) xen giữa các frame. Byte không
+    thuộc frame hợp lệ được trả lại dưới dạng bytes để ghép thành dòng text.
+    Sai CRC / sai độ dài → bỏ byte sync đó và dò lại từ byte kế tiếp.
+    """
+
+    def __init__(self):
+        self.buffer = bytearray()
+        self.frames = 0
+        self.crc_errors = 0
+
+    def feed(self, data):
+        """Trả về list gồm Frame và bytes (đoạn text ngoài frame, theo đúng thứ tự)"""
+        self.buffer.extend(data)
+        items = []
+        buffer = self.buffer
+
+        while buffer:
+            start = buffer.find(SYNC)
+            if start < 0:
+                items.append(bytes(buffer))
+                buffer.clear()
+                break
+            if start > 0:
+                items.append(bytes(buffer[:start]))
+                del buffer[:start]
+
+            if len(buffer) < HEADER_SIZE:
+                break  # Chờ thêm byte
+            version, msg_type, seq, length = buffer[1], buffer[2], buffer[3], buffer[4]
+            if version != VERSION or PAYLOAD_SIZES.get(msg_type) != length:
+                items.append(bytes(buffer[:1]))  # Không phải frame - byte 0xAA của text
+                del buffer[:1]
+                continue
+
+            total = HEADER_SIZE + length + CRC_SIZE
+            if len(buffer) < total:
+                break
+            body = bytes(buffer[1:HEADER_SIZE + length])
+            crc = buffer[total - 2] | (buffer[total - 1] << 8)
+            if crc != crc16_ccitt(body):
+                self.crc_errors += 1
+                items.append(bytes(buffer[:1]))
+                del buffer[:1]
+                continue
+
+            fmt = PAYLOAD_FORMATS[msg_type]
+            values = struct.unpack(fmt, body[4:]) if fmt else ()
+            items.append(Frame(msg_type, seq, values))
+            self.frames += 1
+            del buffer[:total]
+
+        return items
+
+    def reset(self):
+        self.buffer.clear()
+
+
+class BinaryLineParser(LineParser):
+    """Parser cho SerialTransport ở chế độ binary: frame → dòng ASCII tương đương
+
+    Text debug vẫn được tách dòng như LineParser, frame được đổi sang
+    "HARVEST_DONE#", "STOP", "ACK:<seq>", "NAK:<seq>"... nên subscriber không cần đổi.
+    """
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.decoder = FrameDecoder()
+
+    def feed(self, data):
+        lines = []
+        for item in self.decoder.feed(data):
+            if isinstance(item, Frame):
+                lines.append(frame_to_text(item))
+            else:
+                lines.extend(super().feed(item))
+        return lines
+
+    def reset(self):
+        super().reset()
+        self.decoder.reset()
+
+
+PROTOCOLS = ('ascii', 'binary')
+
+
+def protocol_options(protocol):
+    """kwargs cho SerialTransport theo giao thức: 'ascii' (mặc định) hoặc 'binary'"""
+    if protocol == 'binary':
+        return {'parser': BinaryLineParser(), 'encoder': encode_command}
+    return {}
@@ -0,0 +1,94 @@
+import numpy as np
+
+
+class BlitPlotter:
+    """Vẽ đồ thị real-time bằng blitting: chỉ vẽ lại các đường, không vẽ lại cả figure
+
+    Nền tĩnh (trục, lưới, legend, nhãn) được cache sau mỗi lần vẽ đầy đủ
+    (draw_event - kể cả khi resize cửa sổ). Mỗi update chỉ restore nền +
+    vẽ các line + blit. Chỉ vẽ đầy đủ lại khi dữ liệu ra khỏi khung nhìn:
+    - Trục X nhảy trước x_lead * span (không set_xlim mỗi frame).
+    - Trục Y chỉ nới rộng (không co lại) khi dữ liệu vượt ra ngoài.
+    max_points(): số điểm nên lấy (2 điểm min/max mỗi pixel ngang) để chi phí
+    vẽ không phụ thuộc số mẫu trong cửa sổ.
+    """
+
+    def __init__(self, canvas, lines, x_lead=0.25, y_margin=0.1):
+        self.canvas = canvas
+        self.figure = canvas.figure
+        self.lines = list(lines)
+        self.axes = []
+        for line in self.lines:
+            line.set_animated(True)  # Không vẽ trong lần vẽ đầy đủ - vẽ riêng khi blit
+            if line.axes not in self.axes:
+                self.axes.append(line.axes)
+        self.x_lead = x_lead
+        self.y_margin = y_margin
+
+        self.background = None
+        self.full_redraws = 0
+        self.blits = 0
+        self.canvas.mpl_connect('draw_event', self._on_draw)
+
+    def max_points(self):
+        """Số điểm tối đa có ích cho mỗi đường: 2 (min/max) × số pixel ngang"""
+        width = max(ax.bbox.width for ax in self.axes)
+        return max(100, int(2 * width))
+
+    def update(self, times, values, span=None):
+        """Cập nhật dữ liệu: values[i] cho self.lines[i]; span: độ rộng trục X (giây)"""
+        if len(times) == 0:
+            return
+        for line, line_values in zip(self.lines, values):
+            line.set_data(times, line_values)
+
+        rescaled = self._rescale_x(times, span)
+        rescaled = self._rescale_y(values) or rescaled
+        if rescaled or self.background is None:
+            self.full_redraws += 1
+            self.canvas.draw()  # _on_draw cache lại nền và vẽ line
+            return
+
+        self.canvas.restore_region(self.background)
+        self._draw_lines()
+        self.canvas.blit(self.figure.bbox)
+        self.blits += 1
+
+    def _on_draw(self, event):
+        self.background = self.canvas.copy_from_bbox(self.figure.bbox)
+        self._draw_lines()
+
+    def _draw_lines(self):
+        for line in self.lines:
+            line.axes.draw_artist(line)
+
+    def _rescale_x(self, times, span):
+        t_first, t_last = float(times[0]), float(times[-1])
+        if span is None:
+            span = max(t_last - t_first, 1.0)
+        x_min, x_max = self.axes[0].get_xlim()
+        width = x_max - x_min
+        lead = self.x_lead * span
+        if x_min <= t_last <= x_max and span <= width <= span + 2 * lead:
+            return False
+
+        x_min = t_first if t_last - t_first < span else t_last - span
+        for ax in self.axes:
+            ax.set_xlim(x_min, x_min + span + lead)
+        return True
+
+    def _rescale_y(self, values):
+        rescaled = False
+        for ax in self.axes:
+            rows = [v for line, v in zip(self.lines, values) if line.axes is ax and len(v)]
+            if not rows:
+                continue
+            low = min(float(np.nanmin(v)) for v in rows)
+            high = max(float(np.nanmax(v)) for v in rows)
+            y_min, y_max = ax.get_ylim()
+            if low >= y_min and high <= y_max:
+                continue
+            margin = self.y_margin * max(high - low, y_max - y_min, 1.0)
+            ax.set_ylim(min(y_min, low - margin), max(y_max, high + margin))
+            rescaled = True
+        return rescaled
@@ -0,0 +1,115 @@
+import numpy as np
+from collections import namedtuple
+
+
+# Toàn bộ box của 1 frame dưới dạng NumPy array (1 lần copy GPU → CPU)
+BoxArrays = namedtuple('BoxArrays', [
+    'xyxy',       # (N, 4) float32 - x1, y1, x2, y2
+    'conf',       # (N,) float32
+    'cls',        # (N,) int
+    'track_ids'   # (N,) int hoặc None nếu không tracking
+])
+
+
+def empty_boxes():
+    return BoxArrays(np.zeros((0, 4), dtype=np.float32),
+                     np.zeros(0, dtype=np.float32),
+                     np.zeros(0, dtype=int),
+                     None)
+
+
+def extract_boxes(results):
+    """Chuyển result.boxes của YOLO sang NumPy 1 lần cho cả frame
+
+    boxes.data có dạng (N, 6) [x1, y1, x2, y2, conf, cls] hoặc
+    (N, 7) [x1, y1, x2, y2, id, conf, cls] khi tracking.
+    """
+    if len(results) == 0 or results[0].boxes is None or len(results[0].boxes) == 0:
+        return empty_boxes()
+
+    data = results[0].boxes.data.cpu().numpy()  # Chỉ 1 lần sync device → host
+
+    xyxy = np.ascontiguousarray(data[:, :4], dtype=np.float32)
+    conf = data[:, -2].astype(np.float32)
+    cls = data[:, -1].astype(int)
+    track_ids = data[:, 4].astype(int) if data.shape[1] == 7 else None
+
+    boxes = BoxArrays(xyxy, conf, cls, track_ids)
+    for arr in boxes:
+        if arr is not None:
+            arr.flags.writeable = False
+    return boxes
+
+
+def box_centers(xyxy_int):
+    """Tâm box (pixel, int) - giống int((x1 + x2) / 2)"""
+    center_x = ((xyxy_int[:, 0] + xyxy_int[:, 2]) / 2).astype(int)
+    center_y = ((xyxy_int[:, 1] + xyxy_int[:, 3]) / 2).astype(int)
+    return center_x, center_y
+
+
+def calculate_distance(pixel_width, real_width, focal_length):
+    """Distance = (Real_Width * Focal_Length) / Pixel_Width, 0 nếu không hợp lệ"""
+    pixel_width = np.asarray(pixel_width, dtype=np.float64)
+    if focal_length <= 0:
+        return np.zeros_like(pixel_width)
+    valid = pixel_width > 0
+    safe_width = np.where(valid, pixel_width, 1.0)
+    return np.where(valid, (real_width * focal_length) / safe_width, 0.0)
+
+
+def calculate_3d_coordinates(center_x, center_y, distance, focal_length, image_width, image_height):
+    """Tọa độ 3D (X, Y, Z) cm cho tất cả box, gốc ở tâm ảnh
+
+    - Z: depth (distance from camera)
+    - X: horizontal position (negative = left, positive = right)
+    - Y: vertical position (NEGATIVE = down, POSITIVE = up)
+    Box có distance <= 0 trả về (0, 0, 0).
+    """
+    distance = np.asarray(distance, dtype=np.float64)
+    if focal_length <= 0:
+        zeros = np.zeros_like(distance)
+        return zeros, zeros.copy(), zeros.copy()
+
+    valid = distance > 0
+    # Offset từ tâm ảnh (pixel)
+    offset_x = np.asarray(center_x, dtype=np.float64) - image_width / 2
+    offset_y = np.asarray(center_y, dtype=np.float64) - image_height / 2
+
+    # Real_Coordinate = (Pixel_Offset * Distance) / Focal_Length
+    X = np.where(valid, (offset_x * distance) / focal_length, 0.0)
+    # ĐẢO DẤU Y: trong ảnh Y tăng khi đi xuống, nhưng thực tế Y dương là đi lên
+    Y = np.where(valid, -(offset_y * distance) / focal_length, 0.0)
+    Z = np.where(valid, distance, 0.0)
+    return X, Y, Z
+
+
+# Giới hạn hành trình tool của Nano_1 (mm)
+TOOL_Z_MAX = 150
+TOOL_Y_MAX = 300
+
+
+def tool_coordinates(Y, Z):
+    """Tọa độ camera (cm) → tọa độ tool tuyệt đối (mm), scalar hoặc array
+
+    Tính từ vị trí mặc định Z=100mm, Y=10mm (cắt phần lẻ giống int()):
+    Y_cam → Z_tool = Y*10 + 195, Z_cam → Y_tool = Z*10 - 40 (offset cắt).
+    """
+    Z_tool = np.trunc(np.asarray(Y, dtype=np.float64) * 10 + 195).astype(int)
+    Y_tool = np.trunc(np.asarray(Z, dtype=np.float64) * 10 - 40).astype(int)
+    return Z_tool, Y_tool
+
+
+def tool_reachable(Z_tool, Y_tool):
+    """Tọa độ tool nằm trong hành trình [0, TOOL_Z_MAX] × [0, TOOL_Y_MAX]"""
+    return (Z_tool >= 0) & (Z_tool <= TOOL_Z_MAX) & (Y_tool >= 0) & (Y_tool <= TOOL_Y_MAX)
+
+
+def select_target(center_y, mask):
+    """Chọn quả thấp nhất (center_y lớn nhất) trong mask, -1 nếu không có
+
+    argmax trả về phần tử đầu tiên khi bằng nhau - giống sort ổn định.
+    """
+    if not mask.any():
+        return -1
+    return int(np.argmax(np.where(mask, center_y, np.iinfo(np.int64).min)))
@@ -0,0 +1,153 @@
+import cv2
+import time
+import threading
+import numpy as np
+
+
+class CameraCapture:
+    """Đọc camera trên thread riêng, luôn giữ frame mới nhất trong ring buffer
+
+    Thread grabber đọc liên tục từ cv2.VideoCapture nên buffer V4L2 không bị
+    dồn frame cũ. Consumer (GUI / detector) chỉ lấy frame mới nhất kèm
+    timestamp (time.monotonic) và sequence number; các frame bị bỏ qua
+    được đếm vào dropped_frames.
+    """
+
+    def __init__(self, camera_index=0, width=640, height=480, ring_size=3):
+        self.camera_index = camera_index
+        self.width = width
+        self.height = height
+        self.ring_size = max(2, ring_size)
+
+        self.cap = None
+        self.thread = None
+        self.running = False
+
+        # Ring buffer cấp phát trước - mỗi slot 1 frame BGR
+        self.frames = np.zeros((self.ring_size, height, width, 3), dtype=np.uint8)
+        self.timestamps = [0.0] * self.ring_size
+        self.seqs = [0] * self.ring_size
+        self.latest_slot = -1
+
+        self.lock = threading.Lock()
+        self.new_frame = threading.Condition(self.lock)
+
+        # Thống kê
+        self.seq = 0                # Số frame đã grab thành công
+        self.last_read_seq = 0      # Seq của frame consumer lấy gần nhất
+        self.dropped_frames = 0     # Frame bị ghi đè trước khi consumer kịp đọc
+        self.failed_reads = 0       # Số lần cap.read() thất bại
+        self.capture_fps = 0.0
+
+    def start(self):
+        """Mở camera và chạy thread grabber"""
+        if self.running:
+            return True
+
+        self.cap = cv2.VideoCapture(self.camera_index)
+        self.cap.set(cv2.CAP_PROP_FRAME_WIDTH, self.width)
+        self.cap.set(cv2.CAP_PROP_FRAME_HEIGHT, self.height)
+        # Giữ buffer driver nhỏ nhất có thể để frame luôn mới
+        self.cap.set(cv2.CAP_PROP_BUFFERSIZE, 1)
+
+        if not self.cap.isOpened():
+            print(f"[CAMERA] Cannot open camera {self.camera_index}")
+            self.cap.release()
+            self.cap = None
+            return False
+
+        self.running = True
+        self.thread = threading.Thread(target=self._grab_loop, daemon=True)
+        self.thread.start()
+        return True
+
+    def stop(self):
+        """Dừng thread grabber và giải phóng camera"""
+        self.running = False
+        with self.new_frame:
+            self.new_frame.notify_all()
+
+        if self.thread is not None:
+            self.thread.join(timeout=1.0)
+            self.thread = None
+
+        if self.cap is not None:
+            self.cap.release()
+            self.cap = None
+
+    def is_opened(self):
+        return self.running and self.cap is not None and self.cap.isOpened()
+
+    def _grab_loop(self):
+        last_fps_time = time.monotonic()
+        fps_count = 0
+
+        while self.running:
+            # Ghi vào slot kế tiếp - không bao giờ đụng tới slot mới nhất
+            slot = (self.latest_slot + 1) % self.ring_size
+
+            # Decode thẳng vào slot đã cấp phát (không tạo array mới mỗi frame)
+            ret, frame = self.cap.read(self.frames[slot])
+            timestamp = time.monotonic()
+
+            if not ret or frame is None:
+                self.failed_reads += 1
+                time.sleep(0.01)
+                continue
+
+            if not np.shares_memory(frame, self.frames[slot]):
+                # Camera không hỗ trợ độ phân giải yêu cầu
+                if frame.shape != self.frames[slot].shape:
+                    frame = cv2.resize(frame, (self.width, self.height))
+                np.copyto(self.frames[slot], frame)
+
+            with self.new_frame:
+                self.seq += 1
+                self.seqs[slot] = self.seq
+                self.timestamps[slot] = timestamp
+                self.latest_slot = slot
+                self.new_frame.notify_all()
+
+            fps_count += 1
+            if timestamp - last_fps_time >= 1.0:
+                self.capture_fps = fps_count / (timestamp - last_fps_time)
+                fps_count = 0
+                last_fps_time = timestamp
+
+    def read_latest(self, last_seq=0, timeout=0.0, out=None):
+        """Lấy frame mới nhất có seq > last_seq
+
+        Trả về (frame, timestamp, seq). Nếu hết timeout mà chưa có frame mới
+        thì trả về (None, 0.0, last_seq). Frame được copy ra `out` (nếu có)
+        nên consumer giữ bao lâu cũng được.
+        """
+        with self.new_frame:
+            if self.seq <= last_seq and timeout > 0:
+                self.new_frame.wait_for(lambda: self.seq > last_seq or not self.running,
+                                        timeout=timeout)
+
+            if self.seq <= last_seq or self.latest_slot < 0:
+                return None, 0.0, last_seq
+
+            slot = self.latest_slot
+            if out is None:
+                frame = self.frames[slot].copy()
+            else:
+                np.copyto(out, self.frames[slot])
+                frame = out
+
+            seq = self.seqs[slot]
+            if self.last_read_seq > 0 and seq - self.last_read_seq > 1:
+                self.dropped_frames += seq - self.last_read_seq - 1
+            self.last_read_seq = seq
+
+            return frame, self.timestamps[slot], seq
+
+    def stats(self):
+        """Thống kê capture (để log / hiển thị)"""
+        return {
+            "captured": self.seq,
+            "dropped": self.dropped_frames,
+            "failed_reads": self.failed_reads,
+            "capture_fps": self.capture_fps
+        }
@@ -0,0 +1,212 @@
+import heapq
+import itertools
+import threading
+import time
+
+from metrics import RollingHistogram
+
+
+# Mức ưu tiên (số nhỏ gửi trước)
+PRIORITY_STOP = 0       # D#, STOP - dừng xe càng sớm càng tốt
+PRIORITY_CONTROL = 1    # T#, G z,y# - lệnh điều khiển harvest
+PRIORITY_TELEMETRY = 2  # Lệnh bánh xe gửi định kỳ, lệnh khác
+
+
+def command_kind(cmd):
+    """Loại lệnh để thống kê latency: 'D', 'STOP', 'T', 'G', 'wheels', 'other'"""
+    if cmd.startswith("STOP"):
+        return "STOP"
+    if cmd.startswith("D#"):
+        return "D"
+    if cmd.startswith("T#"):
+        return "T"
+    if cmd.startswith("G"):
+        return "G"
+    if cmd.count(",") == 3:
+        return "wheels"  # "L_dir,L_rpm,R_dir,R_rpm#"
+    return "other"
+
+
+def command_priority(cmd):
+    kind = command_kind(cmd)
+    if kind in ("D", "STOP"):
+        return PRIORITY_STOP
+    if kind in ("T", "G"):
+        return PRIORITY_CONTROL
+    return PRIORITY_TELEMETRY
+
+
+# Lệnh cùng key đang chờ thì chỉ giữ bản mới nhất (G: tọa độ mới thay tọa độ cũ)
+COALESCE_KEYS = {"G": "G", "wheels": "wheels"}
+
+# Lệnh di chuyển bị hủy khi có D#/STOP (nếu không, T# đang chờ sẽ chạy sau D#)
+MOTION_KINDS = ("T", "wheels")
+
+
+class _Pending:
+    __slots__ = ('cmd', 'kind', 'priority', 'enqueue_time', 'key', 'on_sent', 'cancelled')
+
+    def __init__(self, cmd, kind, priority, key, on_sent):
+        self.cmd = cmd
+        self.kind = kind
+        self.priority = priority
+        self.enqueue_time = time.monotonic()
+        self.key = key
+        self.on_sent = on_sent
+        self.cancelled = False
+
+
+class CommandQueue:
+    """Hàng đợi lệnh serial có ưu tiên, chỉ 1 thread được ghi ra cổng
+
+    Mọi nơi (Tk, engine, thread đọc serial) chỉ submit() - thread writer lấy
+    lệnh ưu tiên cao nhất và ghi lần lượt, không còn ghi chồng từ nhiều thread.
+    - D#/STOP vượt lên trước T#/G, T#/G vượt trước lệnh bánh xe.
+    - Lệnh giống hệt đang chờ thì bỏ bản sau; G và lệnh bánh xe chỉ giữ bản
+      mới nhất (thay nội dung nhưng giữ chỗ trong hàng).
+    - D#/STOP hủy các lệnh di chuyển (T#, bánh xe) chưa gửi.
+    - Ghi lại latency enqueue → ghi xong ra cổng cho từng loại lệnh.
+    """
+
+    def __init__(self, transport, metrics=None, on_sent=None, on_error=None):
+        self.transport = transport
+        self.metrics = metrics
+        self.on_sent = on_sent      # callback(cmd, latency) sau khi ghi xong
+        self.on_error = on_error    # callback(cmd, exception) nếu ghi lỗi
+
+        self.lock = threading.Lock()
+        self.not_empty = threading.Condition(self.lock)
+        self.heap = []
+        self.pending_by_key = {}
+        self.counter = itertools.count()
+        self.in_flight = 0
+
+        self.latency = {}           # kind → RollingHistogram (ms)
+        self.sent_count = 0
+        self.coalesced_count = 0
+
+        self.running = True
+        self.thread = threading.Thread(target=self._write_loop, daemon=True)
+        self.thread.start()
+
+    def submit(self, cmd, priority=None, on_sent=None):
+        """Đưa lệnh vào hàng đợi, trả về False nếu bị gộp với lệnh đang chờ
+
+        on_sent(wire_time): gọi riêng cho lệnh này lúc ghi xong (time.monotonic).
+        """
+        kind = command_kind(cmd)
+        if priority is None:
+            priority = command_priority(cmd)
+        key = COALESCE_KEYS.get(kind, cmd)
+
+        with self.not_empty:
+            if not self.running:
+                return False
+
+            if priority == PRIORITY_STOP:
+                for other in list(self.pending_by_key.values()):
+                    if other.kind in MOTION_KINDS:
+                        other.cancelled = True
+                        del self.pending_by_key[other.key]
+
+            pending = self.pending_by_key.get(key)
+            if pending is not None and pending.priority == priority:
+                pending.cmd = cmd  # Bản mới nhất thắng, giữ nguyên chỗ & enqueue_time
+                if on_sent is not None:
+                    pending.on_sent = on_sent
+                self.coalesced_count += 1
+                return False
+
+            pending = _Pending(cmd, kind, priority, key, on_sent)
+            self.pending_by_key[key] = pending
+            heapq.heappush(self.heap, (priority, next(self.counter), pending))
+            self.not_empty.notify()
+            return True
+
+    def pending_count(self):
+        with self.lock:
+            return len(self.pending_by_key)
+
+    def flush(self, timeout=1.0):
+        """Chờ gửi hết lệnh đang chờ, trả về True nếu hàng đợi rỗng"""
+        deadline = time.monotonic() + timeout
+        with self.not_empty:
+            while self.heap or self.in_flight:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                self.not_empty.wait(min(remaining, 0.05))
+        return True
+
+    def clear(self):
+        """Bỏ toàn bộ lệnh chưa gửi"""
+        with self.lock:
+            for _, _, pending in self.heap:
+                pending.cancelled = True
+            self.heap.clear()
+            self.pending_by_key.clear()
+
+    def close(self, flush_timeout=0.0):
+        if flush_timeout > 0:
+            self.flush(flush_timeout)
+        with self.not_empty:
+            self.running = False
+            self.not_empty.notify_all()
+        self.clear()
+        if self.thread is not threading.current_thread():
+            self.thread.join(timeout=1.0)
+
+    def latency_summary(self):
+        """{kind: summary} latency enqueue → wire (ms)"""
+        with self.lock:
+            result = {}
+            for kind, hist in self.latency.items():
+                summary = hist.summary()
+                if summary is not None:
+                    result[kind] = summary
+            return result
+
+    def _write_loop(self):
+        while True:
+            with self.not_empty:
+                while self.running and not self.heap:
+                    self.not_empty.wait()
+                if not self.running:
+                    return
+                _, _, pending = heapq.heappop(self.heap)
+                if pending.cancelled:
+                    continue
+                if self.pending_by_key.get(pending.key) is pending:
+                    del self.pending_by_key[pending.key]
+                cmd = pending.cmd
+                self.in_flight += 1
+
+            try:
+                write_start = time.monotonic()
+                self.transport.send_command(cmd)
+                wire_time = time.monotonic()
+            except Exception as e:
+                with self.not_empty:
+                    self.in_flight -= 1
+                    self.not_empty.notify_all()
+                if self.on_error is not None:
+                    self.on_error(cmd, e)
+                continue
+
+            latency = wire_time - pending.enqueue_time
+            with self.not_empty:
+                self.in_flight -= 1
+                self.sent_count += 1
+                hist = self.latency.get(pending.kind)
+                if hist is None:
+                    hist = self.latency[pending.kind] = RollingHistogram()
+                hist.add(latency * 1000.0)
+                self.not_empty.notify_all()
+
+            if self.metrics is not None:
+                self.metrics.record('serial_write', wire_time - write_start)
+                self.metrics.record('serial_queue', latency)
+            if pending.on_sent is not None:
+                pending.on_sent(wire_time)
+            if self.on_sent is not None:
+                self.on_sent(cmd, latency)
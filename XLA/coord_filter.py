@@ -0,0 +1,117 @@
+import numpy as np
+
+
+# Lọc tọa độ 3D (X, Y, Z cm) của từng quả theo track ID qua nhiều frame.
+#
+# Z tính từ pixel_width của 1 frame nên box rung 1-2 px là Z nhảy vài mm, kéo
+# theo Y_tool. Mỗi track giữ 1 Kalman filter vị trí + vận tốc (constant velocity)
+# cho từng trục, nhiễu đo ước lượng thích nghi từ innovation. Sau D# xe còn trôi
+# / phanh nên quả vẫn dịch trong ảnh: chỉ coi là hội tụ khi vị trí ổn định VÀ vận
+# tốc ước lượng (cộng 1 độ lệch chuẩn) đủ nhỏ - quả đang trôi đều thì variance vị
+# trí vẫn có thể nhỏ nhưng vận tốc thì không.
+
+
+class TrackEstimate:
+    """Trạng thái lọc của 1 track theo X, Y, Z (mỗi mảng (3,))
+
+    mean / velocity: vị trí (cm) / vận tốc (cm/s); variance, covariance,
+    velocity_variance: ma trận hiệp phương sai 2x2 [pos, vel] của từng trục.
+    """
+
+    __slots__ = ('mean', 'velocity', 'variance', 'covariance', 'velocity_variance',
+                 'noise', 'samples', 'last_time')
+
+    def __init__(self, measurement, noise, velocity_noise, now):
+        self.mean = measurement.copy()
+        self.velocity = np.zeros(3)
+        self.variance = noise.copy()
+        self.covariance = np.zeros(3)
+        self.velocity_variance = velocity_noise.copy()
+        self.noise = noise.copy()   # Variance nhiễu đo (cm²), cập nhật theo innovation
+        self.samples = 1
+        self.last_time = now
+
+    @property
+    def std(self):
+        return np.sqrt(self.variance)
+
+    @property
+    def velocity_std(self):
+        return np.sqrt(self.velocity_variance)
+
+
+class CoordFilter:
+    """Kalman vị trí + vận tốc (độc lập X / Y / Z) cho từng track ID
+
+    process_noise: cm²/s³ - mật độ nhiễu gia tốc (xe phanh, lá rung)
+    initial_noise: cm² - nhiễu đo giả định cho frame đầu tiên của track
+    initial_speed: cm/s - độ lệch chuẩn vận tốc ban đầu (chưa biết quả có trôi không)
+    adapt: hệ số EMA khi cập nhật nhiễu đo từ innovation (0 = không thích nghi)
+    max_age: giây không thấy track thì bỏ
+    """
+
+    def __init__(self, process_noise=1.0, initial_noise=1.0, initial_speed=10.0, min_noise=0.01,
+                 adapt=0.3, max_age=2.0):
+        self.process_noise = process_noise
+        self.initial_noise = initial_noise
+        self.initial_speed = initial_speed
+        self.min_noise = min_noise
+        self.adapt = adapt
+        self.max_age = max_age
+        self.tracks = {}
+
+    def update(self, key, X, Y, Z, now):
+        """Thêm 1 phép đo cho track `key`, trả về TrackEstimate sau cập nhật"""
+        z = np.array((X, Y, Z), dtype=np.float64)
+        state = self.tracks.get(key)
+        if state is None:
+            state = TrackEstimate(z, np.full(3, self.initial_noise),
+                                  np.full(3, self.initial_speed ** 2), now)
+            self.tracks[key] = state
+            return state
+
+        # Predict: đi tiếp theo vận tốc, độ bất định tăng theo thời gian
+        dt = max(now - state.last_time, 0.0)
+        q = self.process_noise
+        state.mean += state.velocity * dt
+        state.variance += dt * (2 * state.covariance + dt * state.velocity_variance) + q * dt ** 3 / 3
+        state.covariance += dt * state.velocity_variance + q * dt ** 2 / 2
+        state.velocity_variance += q * dt
+
+        # Nhiễu đo thích nghi: innovation² lớn hơn variance dự đoán → đo nhiễu hơn giả định
+        innovation = z - state.mean
+        observed = np.maximum(innovation ** 2 - state.variance, self.min_noise)
+        state.noise = (1 - self.adapt) * state.noise + self.adapt * observed
+
+        # Update (chỉ đo vị trí)
+        total = state.variance + state.noise
+        gain = state.variance / total
+        velocity_gain = state.covariance / total
+        state.mean += gain * innovation
+        state.velocity += velocity_gain * innovation
+        state.velocity_variance -= velocity_gain * state.covariance
+        state.variance *= 1 - gain
+        state.covariance *= 1 - gain
+        state.samples += 1
+        state.last_time = now
+        return state
+
+    def get(self, key):
+        return self.tracks.get(key)
+
+    def converged(self, key, tolerance, min_samples=3, max_speed=1.0):
+        """Đủ min_samples phép đo, độ lệch chuẩn vị trí mọi trục <= tolerance (cm)
+        và |vận tốc| + 1 độ lệch chuẩn <= max_speed (cm/s) - quả đã đứng yên"""
+        state = self.tracks.get(key)
+        return (state is not None and state.samples >= min_samples
+                and bool((state.std <= tolerance).all())
+                and bool((np.abs(state.velocity) + state.velocity_std <= max_speed).all()))
+
+    def prune(self, now):
+        """Bỏ track không có phép đo quá max_age giây"""
+        stale = [key for key, state in self.tracks.items() if now - state.last_time > self.max_age]
+        for key in stale:
+            del self.tracks[key]
+
+    def reset(self):
+        self.tracks.clear()
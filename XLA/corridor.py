@@ -0,0 +1,113 @@
+import math
+import numpy as np
+
+from box_geometry import BoxArrays, empty_boxes
+
+
+def corridor_bounds(width, x_line_left, x_line_right, padding, lookahead, travel_direction):
+    """Cột [x0, x1) của crop quanh target zone
+
+    padding thêm 2 bên zone, lookahead thêm về phía robot đang đi tới
+    (travel_direction "left"/"right" theo hướng ảnh) để thấy quả sắp vào zone.
+    """
+    x0 = x_line_left - padding
+    x1 = x_line_right + 1 + padding
+    if travel_direction == "left":
+        x0 -= lookahead
+    elif travel_direction == "right":
+        x1 += lookahead
+    x0 = min(max(x0, 0), width)
+    x1 = min(max(x1, 0), width)
+    return x0, x1
+
+
+def corridor_imgsz(crop_width, crop_height, frame_width, frame_height, full_imgsz=640, stride=32):
+    """imgsz cho crop giữ nguyên tỉ lệ scale như khi chạy full frame ở full_imgsz
+
+    Quả trong crop có cùng kích thước pixel như full frame nên độ chính xác
+    không đổi, chỉ ít pixel hơn phải xử lý.
+    """
+    scale = full_imgsz / max(frame_width, frame_height)
+    size = max(crop_width, crop_height) * scale
+    return max(stride, int(math.ceil(size / stride)) * stride)
+
+
+def shift_boxes(data, x0, crop_width, frame_width, edge=2):
+    """Đưa box (N, 6+) từ tọa độ crop về full frame, bỏ box bị cắt ở mép crop
+
+    Box chạm mép crop (không phải mép ảnh) chỉ thấy 1 phần quả nên tâm bị lệch -
+    các box này nằm trong vùng padding, frame full tiếp theo sẽ thấy đủ.
+    """
+    keep = np.ones(len(data), dtype=bool)
+    if x0 > 0:
+        keep &= data[:, 0] > edge
+    if x0 + crop_width < frame_width:
+        keep &= data[:, 2] < crop_width - edge
+    data = data[keep].copy()
+    data[:, [0, 2]] += x0
+    return data
+
+
+class TrackerInput:
+    """Detection full-frame dạng ultralytics tracker cần (.conf, .xyxy, .cls)"""
+
+    def __init__(self, data):
+        self.xyxy = data[:, :4]
+        self.conf = data[:, 4]
+        self.cls = data[:, 5]
+
+    def __len__(self):
+        return len(self.conf)
+
+
+class CorridorTracker:
+    """ByteTrack / BoT-SORT chạy riêng trên tọa độ full frame
+
+    model.track() giữ tracker theo tọa độ của ảnh đầu vào nên không dùng được
+    khi xen kẽ crop và full frame. Ở corridor mode detector chạy predict, box
+    được dịch về full frame rồi mới đưa vào tracker này - track ID giữ nguyên
+    giữa pass crop và pass full.
+    """
+
+    TRACKER_FILES = {"bytetrack": "bytetrack.yaml", "deepsort": "botsort.yaml"}
+
+    def __init__(self, method):
+        from ultralytics.trackers.track import TRACKER_MAP
+        from ultralytics.utils import IterableSimpleNamespace, yaml_load
+        from ultralytics.utils.checks import check_yaml
+
+        cfg = IterableSimpleNamespace(**yaml_load(check_yaml(self.TRACKER_FILES[method])))
+        self.method = method
+        self.tracker = TRACKER_MAP[cfg.tracker_type](args=cfg, frame_rate=30)
+
+    def update(self, data, frame):
+        """data: (N, 6) [x1, y1, x2, y2, conf, cls] full frame → BoxArrays có track_ids"""
+        if len(data) == 0:
+            return empty_boxes()  # Giống ultralytics: frame rỗng không update tracker
+
+        tracks = self.tracker.update(TrackerInput(data), frame)
+        if len(tracks) == 0:
+            return empty_boxes()
+
+        # tracks: [x1, y1, x2, y2, id, score, cls, idx]
+        boxes = BoxArrays(np.ascontiguousarray(tracks[:, :4], dtype=np.float32),
+                          tracks[:, 5].astype(np.float32),
+                          tracks[:, 6].astype(int),
+                          tracks[:, 4].astype(int))
+        for arr in boxes:
+            arr.flags.writeable = False
+        return boxes
+
+
+def boxes_from_data(data):
+    """(N, 6) [x1, y1, x2, y2, conf, cls] → BoxArrays không tracking"""
+    if len(data) == 0:
+        return empty_boxes()
+    boxes = BoxArrays(np.ascontiguousarray(data[:, :4], dtype=np.float32),
+                      data[:, 4].astype(np.float32),
+                      data[:, 5].astype(int),
+                      None)
+    for arr in boxes:
+        if arr is not None:
+            arr.flags.writeable = False
+    return boxes
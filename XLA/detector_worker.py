@@ -0,0 +1,318 @@
+import cv2
+import time
+import threading
+from collections import namedtuple
+
+import numpy as np
+
+from box_geometry import extract_boxes
+import corridor
+import simple_tracker
+from model_backends import DYNAMIC_BACKENDS
+
+
+# Kết quả detect bất biến - GUI chỉ đọc, không sửa
+# frame: ảnh đã flip/chỉnh sáng (read-only), boxes: BoxArrays (NumPy, read-only)
+DetectionResult = namedtuple('DetectionResult', [
+    'seq',             # Số thứ tự kết quả (tăng liên tục, kể cả khi đổi camera)
+    'capture_seq',     # Seq của frame camera
+    'frame',           # Ảnh BGR đã tiền xử lý (writeable=False)
+    'boxes',           # BoxArrays - toàn bộ box của frame
+    'capture_time',    # time.monotonic() lúc grab frame
+    'inference_time',  # Thời gian chạy model (s)
+    'done_time',       # time.monotonic() lúc có kết quả
+    'roi'              # (x0, x1) cột đã detect ở corridor mode, None nếu full frame
+])
+
+
+def result_data(results):
+    """(N, 6) [x1, y1, x2, y2, conf, cls] từ kết quả predict"""
+    if len(results) == 0 or results[0].boxes is None:
+        return np.zeros((0, 6), dtype=np.float32)
+    return results[0].boxes.data.cpu().numpy()
+
+
+class DetectorWorker:
+    """Thread chạy YOLO tách khỏi Tk main loop
+
+    Lấy frame mới nhất từ CameraCapture, tiền xử lý, chạy model theo
+    tracking_method hiện tại và publish DetectionResult mới nhất. Camera,
+    detector và GUI chạy song song nên FPS chỉ bị giới hạn bởi stage chậm nhất.
+
+    settings: object có các thuộc tính conf_threshold, iou_threshold,
+    tracking_method, flip_horizontal, brightness, is_running và các
+    thuộc tính corridor_* (đọc mỗi frame).
+    """
+
+    def __init__(self, model, settings, capture=None, scheduler=None, metrics=None):
+        self.model = model
+        self.settings = settings
+        self.capture = capture
+        self.scheduler = scheduler  # DetectionScheduler (None = luôn full rate)
+        self.metrics = metrics      # StageMetrics (None = không đo)
+        self.tracking_time = None   # Thời gian tracker của frame vừa detect (s)
+        self.imgsz_scale = 1.0
+
+        self.thread = None
+        self.running = False
+
+        self.lock = threading.Lock()
+        self.new_result = threading.Condition(self.lock)
+        self.latest = None
+        self.result_seq = 0
+
+        self.fps = 0.0
+        self.inference_time = 0.0
+
+        # Corridor mode: tracker riêng + đếm frame để chạy full frame định kỳ
+        self.corridor_tracker = None
+        self.corridor_count = 0
+        # tracking_method "centroid": tracker NumPy, dùng chung cho full frame và corridor
+        self.centroid_tracker = None
+
+    def start(self):
+        if self.running:
+            return
+        self.running = True
+        self.thread = threading.Thread(target=self._detect_loop, daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.running = False
+        with self.new_result:
+            self.new_result.notify_all()
+        if self.thread is not None:
+            self.thread.join(timeout=2.0)
+            self.thread = None
+
+    def set_capture(self, capture):
+        """Đổi nguồn camera (khi đổi camera index)"""
+        self.capture = capture
+
+    def _detect_loop(self):
+        last_seq = 0
+        current_capture = None
+        last_done_time = 0
+
+        while self.running:
+            capture = self.capture
+            if capture is None or not capture.is_opened() or not getattr(self.settings, 'is_running', True):
+                time.sleep(0.05)
+                continue
+
+            if capture is not current_capture:
+                # Camera mới - seq bắt đầu lại từ 0
+                current_capture = capture
+                last_seq = 0
+                self.corridor_tracker = None
+                self.centroid_tracker = None
+
+            # Scheduler: tạm dừng / giảm tốc theo trạng thái robot
+            if self.scheduler is not None:
+                if not self.scheduler.ready():
+                    time.sleep(0.02)
+                    continue
+                self.imgsz_scale = self.scheduler.policy.imgsz_scale
+
+            frame, capture_time, seq = capture.read_latest(last_seq, timeout=0.1)
+            if frame is None:
+                continue
+            last_seq = seq
+
+            pick_time = time.monotonic()
+            frame = self.preprocess(frame)
+
+            start_time = time.monotonic()
+            if self.scheduler is not None:
+                self.scheduler.begin()
+            boxes, roi = self.detect(frame)
+            done_time = time.monotonic()
+            if self.scheduler is not None:
+                self.scheduler.record(done_time - start_time)
+            if self.metrics is not None:
+                self.record_metrics(capture_time, pick_time, start_time, done_time)
+
+            frame.flags.writeable = False
+            with self.new_result:
+                self.result_seq += 1
+                result = DetectionResult(self.result_seq, seq, frame, boxes, capture_time,
+                                         done_time - start_time, done_time, roi)
+                self.latest = result
+                self.inference_time = result.inference_time
+                if last_done_time > 0:
+                    self.fps = 1 / max(done_time - last_done_time, 1e-6)
+                last_done_time = done_time
+                self.new_result.notify_all()
+
+    def record_metrics(self, capture_time, pick_time, start_time, done_time):
+        """capture = tuổi frame khi detector lấy, inference không gồm tracker"""
+        metrics = self.metrics
+        metrics.record('capture', pick_time - capture_time)
+        metrics.record('preprocess', start_time - pick_time)
+        tracking_time = self.tracking_time or 0.0
+        metrics.record('inference', max(done_time - start_time - tracking_time, 0.0))
+        if self.tracking_time is not None:
+            metrics.record('tracking', self.tracking_time)
+
+    def preprocess(self, frame):
+        # Flip horizontal (mirror mode) nếu được bật
+        if self.settings.flip_horizontal:
+            frame = cv2.flip(frame, 1)
+
+        # Điều chỉnh độ sáng
+        if self.settings.brightness != 0:
+            frame = cv2.convertScaleAbs(frame, alpha=1, beta=self.settings.brightness)
+
+        return frame
+
+    def detect(self, frame):
+        """Chạy model trên full frame hoặc corridor, trả về (BoxArrays, roi)"""
+        self.tracking_time = None
+        if not self.settings.corridor_mode:
+            self.corridor_tracker = None
+            if self.settings.tracking_method == "centroid":
+                return self.track_centroid(result_data(self.run_model(frame)), frame), None
+            start = time.perf_counter()
+            results = self.run_model(frame)
+            if self.settings.tracking_method != "none" and len(results) > 0:
+                # model.track chạy tracker trong callback sau postprocess, speed của
+                # ultralytics không tính phần này → tracking ≈ tổng - speed
+                model_time = sum(v or 0.0 for v in results[0].speed.values()) / 1000.0
+                self.tracking_time = max(time.perf_counter() - start - model_time, 0.0)
+            return extract_boxes(results), None
+        return self.run_corridor(frame)
+
+    def run_corridor(self, frame):
+        """Detect trên crop quanh target zone, box đưa về tọa độ full frame
+
+        Cứ corridor_full_frame_interval frame thì chạy 1 lần full frame để
+        tracker vẫn thấy toàn cảnh. Tracking dùng CorridorTracker (predict +
+        tracker riêng) vì model.track không xen kẽ được crop và full frame.
+        """
+        settings = self.settings
+        height, width = frame.shape[:2]
+
+        interval = settings.corridor_full_frame_interval
+        full_pass = interval <= 1 or self.corridor_count % interval == 0
+        self.corridor_count += 1
+
+        if full_pass:
+            x0, x1 = 0, width
+        else:
+            x0, x1 = corridor.corridor_bounds(width, settings.x_line_left, settings.x_line_right,
+                                              settings.corridor_padding, settings.corridor_lookahead,
+                                              settings.travel_direction)
+            if x1 - x0 <= 0:
+                x0, x1 = 0, width
+
+        roi = None
+        imgsz = self.scaled_imgsz(self.full_imgsz())
+        crop = frame
+        if (x0, x1) != (0, width):
+            roi = (x0, x1)
+            crop = np.ascontiguousarray(frame[:, x0:x1])
+            if self.dynamic_imgsz():
+                imgsz = self.scaled_imgsz(settings.corridor_imgsz or
+                                          corridor.corridor_imgsz(x1 - x0, height, width, height,
+                                                                  self.full_imgsz()))
+
+        results = self.model.predict(crop,
+                                     imgsz=imgsz,
+                                     conf=settings.conf_threshold,
+                                     iou=settings.iou_threshold,
+                                     verbose=False)
+        data = result_data(results)
+        if roi is not None:
+            data = corridor.shift_boxes(data, x0, x1 - x0, width)
+
+        if settings.tracking_method == "none":
+            self.corridor_tracker = None
+            return corridor.boxes_from_data(data), roi
+        if settings.tracking_method == "centroid":
+            self.corridor_tracker = None
+            return self.track_centroid(data, frame), roi
+
+        if self.corridor_tracker is None or self.corridor_tracker.method != settings.tracking_method:
+            self.corridor_tracker = corridor.CorridorTracker(settings.tracking_method)
+        start = time.perf_counter()
+        boxes = self.corridor_tracker.update(data, frame)
+        self.tracking_time = time.perf_counter() - start
+        return boxes, roi
+
+    def track_centroid(self, data, frame):
+        """Gán track ID bằng CentroidTracker, đo tracking_time như CorridorTracker"""
+        if self.centroid_tracker is None:
+            self.centroid_tracker = simple_tracker.CentroidTracker()
+        self.centroid_tracker.direction = simple_tracker.flow_direction(
+            getattr(self.settings, 'travel_direction', None))
+        start = time.perf_counter()
+        boxes = self.centroid_tracker.update(data, frame)
+        self.tracking_time = time.perf_counter() - start
+        return boxes
+
+    def dynamic_imgsz(self):
+        """Backend có chạy được imgsz khác 640 không (TorchScript export cố định)"""
+        return getattr(self.settings, 'active_backend', 'pytorch') in DYNAMIC_BACKENDS
+
+    def full_imgsz(self):
+        """imgsz khi detect full frame (settings.imgsz, backend export cố định thì luôn 640)"""
+        if not self.dynamic_imgsz():
+            return 640
+        return getattr(self.settings, 'imgsz', 640)
+
+    def reset_tracking(self):
+        """Xóa trạng thái tracker (track ID bắt đầu lại) - khi đổi sang cảnh / clip khác"""
+        self.corridor_tracker = None
+        self.centroid_tracker = None
+        self.corridor_count = 0
+        predictor = getattr(self.model, 'predictor', None)
+        for tracker in getattr(predictor, 'trackers', None) or []:
+            reset = getattr(tracker, 'reset', None)
+            if reset is not None:
+                reset()
+
+    def scaled_imgsz(self, imgsz, stride=32):
+        """imgsz nhân với imgsz_scale của scheduler, làm tròn theo stride"""
+        if self.imgsz_scale == 1.0 or not self.dynamic_imgsz():
+            return imgsz
+        return max(stride, int(round(imgsz * self.imgsz_scale / stride)) * stride)
+
+    def run_model(self, frame):
+        """Detect với tracking method đã chọn"""
+        settings = self.settings
+        imgsz = self.scaled_imgsz(self.full_imgsz())
+
+        if settings.tracking_method == "bytetrack":
+            return self.model.track(frame,
+                                    imgsz=imgsz,
+                                    conf=settings.conf_threshold,
+                                    iou=settings.iou_threshold,
+                                    persist=True,  # Giữ track ID giữa các frame
+                                    tracker="bytetrack.yaml",  # ByteTrack tracker
+                                    verbose=False)
+        elif settings.tracking_method == "deepsort":
+            return self.model.track(frame,
+                                    imgsz=imgsz,
+                                    conf=settings.conf_threshold,
+                                    iou=settings.iou_threshold,
+                                    persist=True,  # Giữ track ID giữa các frame
+                                    tracker="botsort.yaml",  # BotSORT (DeepSORT-based)
+                                    verbose=False)
+        else:  # tracking_method "none" / "centroid" (CentroidTracker chạy sau predict)
+            return self.model.predict(frame,
+                                      imgsz=imgsz,
+                                      conf=settings.conf_threshold,
+                                      iou=settings.iou_threshold,
+                                      verbose=False)
+
+    def get_latest(self, last_seq=0, timeout=0.0):
+        """Lấy kết quả mới nhất có seq > last_seq, None nếu chưa có"""
+        with self.new_result:
+            if timeout > 0 and (self.latest is None or self.latest.seq <= last_seq):
+                self.new_result.wait_for(
+                    lambda: (self.latest is not None and self.latest.seq > last_seq) or not self.running,
+                    timeout=timeout)
+
+            if self.latest is None or self.latest.seq <= last_seq:
+                return None
+            return self.latest
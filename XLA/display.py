@@ -0,0 +1,105 @@
+import cv2
+import time
+import numpy as np
+from PIL import Image, ImageTk
+
+
+class FrameDisplay:
+    """Hiển thị frame BGR lên tk.Label với buffer cấp phát sẵn
+
+    - Resize bằng cv2.resize INTER_LINEAR vào buffer có sẵn (bỏ qua nếu
+      frame đã đúng kích thước hiển thị), đổi màu BGR → RGBA tại chỗ.
+    - Ảnh PIL trỏ thẳng vào buffer đó, chỉ có 1 PhotoImage RGBA dùng suốt
+      (paste cập nhật tại chỗ, không tạo PhotoImage mới mỗi frame).
+    - PhotoImage.paste chỉ dùng thẳng ảnh khi cùng mode và là 1 block liền,
+      ảnh frombuffer thì không → nó sẽ cấp phát block mới + convert mỗi frame.
+      Nên giữ 1 block RGBA cố định, mỗi frame chỉ copy buffer vào đó. Việc này
+      cần API nội bộ của Pillow (new_block / convert2): bản Pillow không có thì
+      paste thẳng self.image (public API, đúng nhưng cấp phát mỗi frame).
+    - Nếu Tk bị chậm (paste tốn nhiều thời gian) thì bỏ bớt frame hiển
+      thị - inference chạy ở thread khác nên không bị ảnh hưởng.
+    """
+
+    def __init__(self, label, width=800, height=600, max_duty=0.5):
+        self.label = label
+        self.width = width
+        self.height = height
+        self.max_duty = max_duty  # Tỉ lệ thời gian Tk tối đa dành cho hiển thị
+
+        self.resized = np.empty((height, width, 3), dtype=np.uint8)
+        self.rgba = np.empty((height, width, 4), dtype=np.uint8)
+        # Image PIL dùng chung bộ nhớ với self.rgba (RGBA mới share được buffer)
+        self.image = Image.frombuffer('RGBA', (width, height), self.rgba, 'raw', 'RGBA', 0, 1)
+        # label=None: chỉ dùng convert() (benchmark / không có Tk)
+        self.photo = None
+        self.block_image = None
+        if label is not None:
+            self.photo = ImageTk.PhotoImage('RGBA', (width, height))
+            self.block_image = self._new_block()
+            self.label.imgtk = self.photo
+            self.label.configure(image=self.photo)
+
+        self.paste_cost = 0.0    # Thời gian hiển thị 1 frame (EMA, s)
+        self.last_show_time = 0.0
+        self.shown_frames = 0
+        self.dropped_frames = 0
+        self.showing_blank = False
+
+    def ready(self):
+        """False nếu nên bỏ frame này để Tk kịp xử lý sự kiện khác"""
+        now = time.perf_counter()
+        if self.paste_cost > 0 and now - self.last_show_time < self.paste_cost / self.max_duty:
+            return False
+        return True
+
+    def drop(self):
+        self.dropped_frames += 1
+
+    def show(self, frame):
+        """Hiển thị frame BGR (bất kỳ kích thước nào)"""
+        start = time.perf_counter()
+
+        self.convert(frame)
+        if self.block_image is not None:
+            block = self.block_image.im
+            block.convert2(block, self.image.im)  # RGBA → RGBA: chỉ copy, không cấp phát
+            self.photo.paste(self.block_image)
+        else:
+            self.photo.paste(self.image)
+
+        end = time.perf_counter()
+        cost = end - start
+        self.paste_cost = cost if self.paste_cost == 0 else 0.9 * self.paste_cost + 0.1 * cost
+        self.last_show_time = end
+        self.shown_frames += 1
+        self.showing_blank = False
+
+    def _new_block(self):
+        """Block RGBA cố định cho show(), None nếu Pillow không có API nội bộ cần dùng"""
+        try:
+            block_image = Image.Image()._new(self.image.im.new_block('RGBA', (self.width, self.height)))
+            block_image.im.convert2(block_image.im, self.image.im)  # Thử copy 1 lần
+        except (AttributeError, TypeError, ValueError):
+            return None
+        return block_image
+
+    def convert(self, frame):
+        """Resize + BGR → RGBA vào buffer dùng chung với self.image (không cần Tk)"""
+        height, width = frame.shape[:2]
+        if (width, height) == (self.width, self.height):
+            src = frame
+        else:
+            cv2.resize(frame, (self.width, self.height), dst=self.resized, interpolation=cv2.INTER_LINEAR)
+            src = self.resized
+        cv2.cvtColor(src, cv2.COLOR_BGR2RGBA, dst=self.rgba)
+        return self.rgba
+
+    def show_blank(self, text):
+        """Màn hình đen kèm thông báo (chỉ vẽ lại khi chưa hiển thị)"""
+        if self.showing_blank:
+            return
+        blank = np.zeros((self.height, self.width, 3), dtype=np.uint8)
+        cv2.putText(blank, text, (150, self.height // 2),
+                    cv2.FONT_HERSHEY_SIMPLEX, 1, (255, 255, 255), 2)
+        self.show(blank)
+        self.showing_blank = True
@@ -0,0 +1,486 @@
+import os
+import math
+import time
+import random
+import argparse
+import threading
+from collections import deque
+
+import binary_protocol
+
+
+# Tên cổng đặc biệt: engine / GUI dùng simulator thay cho ESP32 thật
+SIM_PORT = "SIM"
+
+# Giống enum HarvestState trong CODE_ESP32.ino
+HARVEST_IDLE = "IDLE"
+HARVEST_WAIT_MOVE1 = "WAIT_MOVE1"    # Nano_1 di chuyển tới tọa độ dâu
+HARVEST_CUT = "CUT"                  # Servo cắt
+HARVEST_WAIT_MOVE2 = "WAIT_MOVE2"    # Nano_1 di chuyển về khay
+HARVEST_RELEASE = "RELEASE"          # Servo thả
+HARVEST_WAIT_RETURN = "WAIT_RETURN"  # Nano_1 về vị trí chờ
+
+TRAY_Y = 10.0                 # Về khay: "z_current,10#"
+WAIT_POSITION = (100.0, 10.0)  # Vị trí chờ: "100,10#"
+PC_SEQ_HISTORY = 8            # Số seq vừa thực hiện được nhớ (lệnh gửi lại trùng chỉ ACK)
+
+# Giống enum PCSeqStatus: lệnh mới / gửi lại đã thực hiện (ACK) / đến trễ (NAK)
+SEQ_NEW = "NEW"
+SEQ_DUPLICATE = "DUPLICATE"
+SEQ_STALE = "STALE"
+
+
+def trapezoid_time(distance, speed, accel):
+    """Thời gian chạy hết distance (mm) với profile hình thang (speed mm/s, accel mm/s²)"""
+    distance = abs(distance)
+    if distance == 0:
+        return 0.0
+    if accel <= 0:
+        return distance / speed
+    if distance < speed * speed / accel:
+        return 2 * math.sqrt(distance / accel)  # Không kịp đạt speed (profile tam giác)
+    return distance / speed + speed / accel
+
+
+class SimulatedSerial:
+    """Đầu PC của cổng serial giả lập (giống serial.Serial: read/write/in_waiting/close)"""
+
+    def __init__(self, device, timeout=0.1):
+        self.device = device
+        self.timeout = timeout
+        self.buffer = bytearray()
+        self.ready = threading.Condition()
+        self.is_open = True
+        self.cancelled = False
+
+    @property
+    def in_waiting(self):
+        with self.ready:
+            return len(self.buffer)
+
+    def feed(self, data):
+        """Byte từ thiết bị → PC"""
+        with self.ready:
+            self.buffer.extend(data)
+            self.ready.notify_all()
+
+    def read(self, size=1):
+        with self.ready:
+            if not self.buffer and self.is_open:
+                self.ready.wait_for(lambda: self.buffer or self.cancelled or not self.is_open, self.timeout)
+            self.cancelled = False
+            data = bytes(self.buffer[:size])
+            del self.buffer[:size]
+            return data
+
+    def write(self, data):
+        if not self.is_open:
+            raise IOError("Simulated port is closed")
+        self.device.receive(bytes(data))
+        return len(data)
+
+    def cancel_read(self):
+        with self.ready:
+            self.cancelled = True
+            self.ready.notify_all()
+
+    def reset_input_buffer(self):
+        with self.ready:
+            self.buffer.clear()
+
+    def close(self):
+        with self.ready:
+            self.is_open = False
+            self.ready.notify_all()
+        self.device.detach(self)
+
+
+class ESP32Simulator:
+    """Giả lập ESP32 (CODE_ESP32.ino) + Nano_1 để chạy app không cần phần cứng
+
+    - Cùng cú pháp lệnh: "T#", "D#", "Gz,y#" (mm), có "@seq" thì trả "ACK:<seq>"
+      ("NAK:<seq>" nếu T# đến trễ sau lệnh mới hơn), "R#" xóa lịch sử seq;
+      frame nhị phân (binary_protocol) thì trả lời bằng frame như firmware.
+    - State machine harvest giống firmware: WAIT_MOVE1 → CUT → WAIT_MOVE2 →
+      RELEASE → WAIT_RETURN → "HARVEST_DONE#". Thời gian di chuyển tính từ
+      tốc độ/gia tốc stepper của Nano_1 (2 trục chạy song song), hoặc cố định
+      bằng move_time.
+    - time_scale > 1 chạy nhanh hơn thời gian thật (load test).
+    - drop_rate: tỉ lệ lệnh bị "mất" (test ACK / gửi lại).
+    - clock: đồng hồ ngoài (vd. đồng hồ ảo của replay) - khi đó không chạy thread,
+      người gọi tự đẩy state machine bằng poll() tại next_deadline().
+    Nối vào app bằng serial() (cùng process) hoặc open_pty() (cổng thật trên POSIX).
+    """
+
+    def __init__(self, move_time=None, cut_time=2.5, release_time=2.5,
+                 y_speed=300.0, y_accel=150.0, z_speed=10.0, z_accel=3.0,
+                 time_scale=1.0, drop_rate=0.0, verbose=True, clock=None):
+        self.move_time = move_time
+        self.cut_time = cut_time
+        self.release_time = release_time
+        self.y_speed = y_speed
+        self.y_accel = y_accel
+        self.z_speed = z_speed
+        self.z_accel = z_accel
+        self.time_scale = time_scale
+        self.drop_rate = drop_rate
+        self.verbose = verbose
+        self.clock = clock or time.monotonic
+
+        self.lock = threading.RLock()
+        self.changed = threading.Condition(self.lock)
+        self.endpoints = []          # SimulatedSerial đang nối
+        self.pty_fds = []            # Master fd của pty
+        self.command_buffer = ""
+        self.frame_decoder = binary_protocol.FrameDecoder()
+        self.binary_mode = False
+        self.tx_seq = 0
+        self.seq_history = deque(maxlen=PC_SEQ_HISTORY)
+        self.last_motion_seq = None   # Seq T#/D# mới nhất đã thực hiện
+
+        self.harvest_state = HARVEST_IDLE
+        self.state_deadline = None
+        self.position = WAIT_POSITION  # (z, y) mm
+        self.move_target = None
+        self.current_z = 0.0
+        self.pc_control_active = False
+        self.stop_time = None         # Chờ 1s sau D# trước khi PS2 điều khiển lại
+
+        self.commands = 0
+        self.dropped = 0
+        self.harvests = 0
+
+        self.running = True
+        self.thread = None
+        if clock is None:
+            self.thread = threading.Thread(target=self._state_loop, daemon=True)
+            self.thread.start()
+
+    # ===== Kết nối =====
+
+    def serial(self, timeout=0.1):
+        """Cổng serial giả lập trong cùng process (truyền vào SerialTransport(ser=...))"""
+        endpoint = SimulatedSerial(self, timeout)
+        with self.lock:
+            self.endpoints.append(endpoint)
+        return endpoint
+
+    def open_pty(self):
+        """Mở cặp pty, trả về tên cổng cho app khác mở (chỉ POSIX)"""
+        import pty
+        import tty
+        master, slave = pty.openpty()
+        tty.setraw(slave)
+        with self.lock:
+            self.pty_fds.append(master)
+        threading.Thread(target=self._pty_loop, args=(master,), daemon=True).start()
+        return os.ttyname(slave)
+
+    def detach(self, endpoint):
+        with self.lock:
+            if endpoint in self.endpoints:
+                self.endpoints.remove(endpoint)
+
+    def close(self):
+        with self.changed:
+            self.running = False
+            self.changed.notify_all()
+            fds, self.pty_fds = self.pty_fds, []
+        for fd in fds:
+            try:
+                os.close(fd)
+            except OSError:
+                pass
+        if self.thread is not None:
+            self.thread.join(timeout=1.0)
+
+    def _pty_loop(self, fd):
+        while self.running:
+            try:
+                data = os.read(fd, 256)
+            except OSError:
+                break
+            if data:
+                self.receive(data)
+
+    # ===== Gửi lên PC =====
+
+    def _write(self, data):
+        with self.lock:
+            for endpoint in self.endpoints:
+                endpoint.feed(data)
+            for fd in self.pty_fds:
+                try:
+                    os.write(fd, data)
+                except OSError:
+                    pass
+
+    def println(self, text):
+        if self.verbose or not text.startswith("["):
+            self._write(text.encode('utf-8') + b"\r\n")
+
+    def send_to_pc(self, msg_type, text):
+        """Như sendToPC(): trả frame nếu PC đang dùng binary, ngược lại text"""
+        if self.binary_mode:
+            self.tx_seq = (self.tx_seq + 1) & 0xFF
+            self._write(binary_protocol.encode_frame(msg_type, self.tx_seq))
+        else:
+            self.println(text)
+
+    # ===== Nhận lệnh =====
+
+    def receive(self, data):
+        """Byte từ PC → ESP32 (giống readPCCommand)"""
+        with self.changed:
+            for item in self.frame_decoder.feed(data):
+                if isinstance(item, binary_protocol.Frame):
+                    self._handle_frame(item)
+                    continue
+                for char in item.decode('utf-8', errors='ignore'):
+                    if char == '#':
+                        command, self.command_buffer = self.command_buffer, ""
+                        self._handle_text(command.strip().upper())
+                    elif char not in '\r\n':
+                        self.command_buffer += char
+                        if len(self.command_buffer) > 40:
+                            self.command_buffer = ""  # Bảo vệ tràn buffer
+            self.changed.notify_all()
+
+    def _drop(self):
+        if self.drop_rate > 0 and random.random() < self.drop_rate:
+            self.dropped += 1
+            return True
+        return False
+
+    def reset_seq(self):
+        """Như resetPCSeq(): PC mới kết nối (R#)"""
+        self.seq_history.clear()
+        self.last_motion_seq = None
+
+    def _check_seq(self, seq, kind):
+        """Như checkPCSeq(): SEQ_NEW (ghi nhận luôn), SEQ_DUPLICATE hoặc SEQ_STALE
+
+        Seq trong lịch sử gần đây là lệnh gửi lại (chỉ ACK); T# cũ hơn T#/D# đã
+        thực hiện (so sánh quay vòng 0-255) là lệnh đến trễ (NAK). D# và G luôn chạy.
+        """
+        seq &= 0xFF
+        if seq in self.seq_history:
+            return SEQ_DUPLICATE
+        newer = self.last_motion_seq is None or 0 < (seq - self.last_motion_seq) & 0xFF < 0x80
+        if kind == "T" and not newer:
+            return SEQ_STALE
+        self.seq_history.append(seq)
+        if kind in ("T", "D") and newer:
+            self.last_motion_seq = seq
+        return SEQ_NEW
+
+    def _handle_text(self, command):
+        if self._drop():
+            return
+        self.binary_mode = False
+        seq = None
+        if '@' in command:
+            command, seq_text = command.split('@', 1)
+            try:
+                seq = int(seq_text)
+            except ValueError:
+                seq = None
+        status = SEQ_NEW
+        if seq is not None:
+            status = self._check_seq(seq, command[:1])
+            self.println(f"{'NAK' if status == SEQ_STALE else 'ACK'}:{seq}")
+
+        self.println(f"[PC] Received: {command}")
+        if status == SEQ_DUPLICATE:
+            self.println("[PC] Duplicate command - ignored")
+        elif status == SEQ_STALE:
+            self.println("[PC] Stale command - rejected")
+        elif command == "R":
+            self.reset_seq()
+            self.println("[PC] Seq history reset")
+        elif command == "T":
+            self._cmd_tien()
+        elif command == "D":
+            self._cmd_dung()
+        elif command.startswith("G"):
+            try:
+                z, y = (float(v) for v in command[1:].split(','))
+            except ValueError:
+                self.println("[PC] Invalid coordinate format!")
+                return
+            self._cmd_coord(z, y)
+        else:
+            self.println(f"[PC] Unknown command: {command}")
+
+    def _handle_frame(self, frame):
+        if self._drop():
+            return
+        self.binary_mode = True
+        self.println(f"[PC] Received frame type {frame.type} seq {frame.seq}")
+        if frame.type == binary_protocol.MSG_SEQ_RESET:
+            self.reset_seq()
+            self.println("[PC] Seq history reset")
+            return
+
+        kind = {binary_protocol.MSG_TIEN: "T", binary_protocol.MSG_DUNG: "D"}.get(frame.type, "G")
+        status = self._check_seq(frame.seq, kind)
+        reply = binary_protocol.MSG_NAK if status == SEQ_STALE else binary_protocol.MSG_ACK
+        self.tx_seq = (self.tx_seq + 1) & 0xFF
+        self._write(binary_protocol.encode_frame(reply, self.tx_seq, frame.seq, frame.type))
+        if status == SEQ_DUPLICATE:
+            self.println("[PC] Duplicate frame - ignored")
+            return
+        if status == SEQ_STALE:
+            self.println("[PC] Stale frame - rejected")
+            return
+
+        if frame.type == binary_protocol.MSG_TIEN:
+            self._cmd_tien()
+        elif frame.type == binary_protocol.MSG_DUNG:
+            self._cmd_dung()
+        elif frame.type == binary_protocol.MSG_COORD:
+            self._cmd_coord(frame.values[0] / 10.0, frame.values[1] / 10.0)
+        else:
+            self.println("[PC] Unknown frame type!")
+
+    def _cmd_tien(self):
+        self.commands += 1
+        self.pc_control_active = True
+        self.stop_time = None
+        self.println("[PC] TIEN mode activated - PS2 disabled, starting smooth ramp-up")
+
+    def _cmd_dung(self):
+        self.commands += 1
+        self.pc_control_active = False
+        self.stop_time = self.clock()
+        self.println("[PC] DUNG - Sent stop, waiting 1s before PS2 control")
+
+    def _cmd_coord(self, z, y):
+        self.commands += 1
+        if self.harvest_state != HARVEST_IDLE:
+            self.println("[PC] ERROR: Cannot start new harvest - Already harvesting!")
+            self.println(f"[PC] Current state: {self.harvest_state}")
+            return
+        self.current_z = z
+        self.println("[AUTO] Opening gripper before movement")
+        self._start_move((z, y), HARVEST_WAIT_MOVE1)
+        self.println(f"[PC] COORD sent to Nano_1: {z:.1f},{y:.1f}# (Z={z:.2f}, Y={y:.2f}) - Waiting for DONE#")
+
+    def press_stop(self):
+        """Giả lập nút SELECT trên tay cầm PS2 (emergency stop)"""
+        with self.changed:
+            if self.pc_control_active or self.stop_time is not None:
+                self.pc_control_active = False
+                self.stop_time = None
+                self.send_to_pc(binary_protocol.MSG_STOP, "STOP")
+                self.println("[EMERGENCY] SELECT pressed - PC control stopped, sent STOP to PC")
+
+    # ===== State machine harvest =====
+
+    def move_duration(self, start, target):
+        """Thời gian Nano_1 đi từ start tới target (z, y) - 2 trục chạy song song"""
+        if self.move_time is not None:
+            return self.move_time
+        return max(trapezoid_time(target[0] - start[0], self.z_speed, self.z_accel),
+                   trapezoid_time(target[1] - start[1], self.y_speed, self.y_accel))
+
+    def _start_move(self, target, state):
+        self.move_target = target
+        self._enter(state, self.move_duration(self.position, target))
+
+    def _enter(self, state, duration):
+        self.harvest_state = state
+        self.state_deadline = self.clock() + duration / self.time_scale
+
+    def _advance(self):
+        """Chuyển state khi hết thời gian của state hiện tại"""
+        state = self.harvest_state
+        if state in (HARVEST_WAIT_MOVE1, HARVEST_WAIT_MOVE2, HARVEST_WAIT_RETURN):
+            self.position = self.move_target
+
+        if state == HARVEST_WAIT_MOVE1:
+            self.println("[HARVEST] Nano_1 reached target - Starting CUT")
+            self._enter(HARVEST_CUT, self.cut_time)
+        elif state == HARVEST_CUT:
+            self.println("[HARVEST] Cut complete - Moving to tray")
+            self._start_move((self.current_z, TRAY_Y), HARVEST_WAIT_MOVE2)
+        elif state == HARVEST_WAIT_MOVE2:
+            self.println("[HARVEST] Reached tray - Releasing strawberry")
+            self._enter(HARVEST_RELEASE, self.release_time)
+        elif state == HARVEST_RELEASE:
+            self.println("[HARVEST] Release complete - Moving to wait position")
+            self._start_move(WAIT_POSITION, HARVEST_WAIT_RETURN)
+        elif state == HARVEST_WAIT_RETURN:
+            self.println("[HARVEST] RETURNED TO WAIT POSITION - HARVEST COMPLETE!")
+            self.send_to_pc(binary_protocol.MSG_HARVEST_DONE, "HARVEST_DONE#")
+            self.harvests += 1
+            self.harvest_state = HARVEST_IDLE
+            self.state_deadline = None
+            self.current_z = 0.0
+
+    def next_deadline(self):
+        """Thời điểm (theo clock) state machine cần chạy tiếp, None nếu đang chờ lệnh"""
+        with self.lock:
+            deadlines = []
+            if self.state_deadline is not None:
+                deadlines.append(self.state_deadline)
+            if self.stop_time is not None:
+                deadlines.append(self.stop_time + 1.0 / self.time_scale)
+            return min(deadlines) if deadlines else None
+
+    def poll(self):
+        """Chạy các bước đã tới hạn, trả về True nếu có thay đổi"""
+        with self.changed:
+            now = self.clock()
+            if self.state_deadline is not None and now >= self.state_deadline:
+                self._advance()
+                return True
+            if self.stop_time is not None and now - self.stop_time >= 1.0 / self.time_scale:
+                self.stop_time = None
+                self.println("[PC] 1s elapsed - PS2 control to Nano enabled")
+                return True
+            return False
+
+    def _state_loop(self):
+        with self.changed:
+            while self.running:
+                if self.poll():
+                    continue
+                deadline = self.next_deadline()
+                self.changed.wait(deadline - self.clock() if deadline is not None else None)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="ESP32 harvest controller simulator on a pseudo-terminal")
+    parser.add_argument("--move-time", type=float, default=None,
+                        help="Fixed Nano_1 move duration in seconds (default: from stepper speed/accel)")
+    parser.add_argument("--cut-time", type=float, default=2.5, help="Cut servo time (s)")
+    parser.add_argument("--release-time", type=float, default=2.5, help="Release servo time (s)")
+    parser.add_argument("--time-scale", type=float, default=1.0, help="Run N times faster than real time")
+    parser.add_argument("--drop-rate", type=float, default=0.0, help="Fraction of commands to drop")
+    parser.add_argument("--quiet", action="store_true", help="Only send replies (no [..] log lines)")
+    args = parser.parse_args()
+
+    sim = ESP32Simulator(move_time=args.move_time, cut_time=args.cut_time, release_time=args.release_time,
+                         time_scale=args.time_scale, drop_rate=args.drop_rate, verbose=not args.quiet)
+    port = sim.open_pty()
+    print(f"ESP32 simulator on {port} - connect the app to this port (Ctrl+C to stop)")
+    print("Press Enter to simulate the PS2 SELECT (emergency stop) button")
+    try:
+        while True:
+            try:
+                input()
+            except EOFError:
+                # Không có stdin (chạy nền) - chỉ giữ simulator chạy
+                while True:
+                    time.sleep(1.0)
+            sim.press_stop()
+            print(f"STOP sent | state: {sim.harvest_state} | harvests: {sim.harvests}")
+    except KeyboardInterrupt:
+        pass
+    finally:
+        sim.close()
+
+
+if __name__ == "__main__":
+    main()
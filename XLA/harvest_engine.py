@@ -0,0 +1,974 @@
+import time
+import threading
+import argparse
+import json
+import os
+from collections import namedtuple
+
+import numpy as np
+
+from camera_capture import CameraCapture
+from detector_worker import DetectorWorker
+from scheduler import DetectionScheduler
+from metrics import StageMetrics, MetricsDumper
+from serial_transport import SerialTransport, SEQ_RESET_COMMAND
+from command_queue import CommandQueue
+from reliable_link import ReliableLink
+from esp32_simulator import ESP32Simulator, SIM_PORT
+from session_recorder import SessionRecorder, REC_SERIAL_RX, REC_SERIAL_TX, REC_STATE, REC_LOG
+import binary_protocol
+import box_geometry
+from coord_filter import CoordFilter
+import model_backends
+
+
+# Kết quả xử lý 1 frame: detection + quyết định harvest (viewer chỉ đọc để vẽ)
+HarvestFrame = namedtuple('HarvestFrame', [
+    'seq',             # Số thứ tự (tăng liên tục)
+    'detection',       # DetectionResult từ DetectorWorker
+    'xyxy',            # (N, 4) int - box pixel (conf/cls/track_ids lấy trong detection.boxes)
+    'center_x',        # (N,) int
+    'center_y',        # (N,) int
+    'in_zone',         # (N,) bool - tâm box nằm giữa x_line_left và x_line_right
+    'distance',        # (N,) khoảng cách (cm), 0 nếu không tính được
+    'X', 'Y', 'Z',     # (N,) tọa độ 3D (cm)
+    'target',          # Index box ưu tiên cao nhất trong zone (-1 nếu không có)
+    'target_in_zone',  # Có dâu Ripe trong zone
+    'auto_stopping',   # Đang auto stop (hiển thị "TARGET IN ZONE - STOPPED")
+    'total_objects'
+])
+
+
+class HarvestEngine:
+    """Engine thu hoạch không cần GUI: camera → detect → quyết định → serial
+
+    Toàn bộ logic zone, ưu tiên quả dưới trước, auto stop D#, chờ tọa độ hội tụ và
+    gửi tọa độ cắt đều nằm ở đây. StrawberryDetectorApp (Tk) chỉ là viewer
+    gắn vào engine; trên máy của robot có thể chạy engine trực tiếp bằng CLI.
+    """
+
+    def __init__(self, weights='best.pt', config_file="strawberry_config.txt", backend=None):
+        # Class names
+        self.class_names = {0: 'Ripe', 1: 'Unripe'}
+
+        # Biến trạng thái
+        self.is_running = False
+        self.cap = None  # CameraCapture (thread đọc camera riêng)
+        self.current_camera = 0
+        self.conf_threshold = 0.5
+        self.iou_threshold = 0.45
+        self.brightness = 0
+        self.total_objects = 0
+
+        # Distance calculation parameters
+        self.focal_length = 615  # Focal length pixel (cần calibrate)
+        self.real_width = 3.0    # Chiều rộng thực của dâu tây (cm) - có thể điều chỉnh
+        self.calibration_distance = 30.0  # Khoảng cách calibration (cm)
+        self.flip_horizontal = True  # Flip camera horizontally (mirror mode)
+        self.image_width = 640   # Chiều rộng ảnh
+        self.image_height = 480  # Chiều cao ảnh
+        self.last_pixel_width = 0  # Chiều rộng box gần nhất (để calibrate)
+
+        # Object tracking
+        self.tracking_method = "bytetrack"  # Tracking method: "bytetrack", "deepsort", "centroid", "none"
+
+        # Inference backend: "auto", "openvino", "onnx", "torchscript", "pytorch"
+        self.model_backend = "auto"
+        self.imgsz = 640  # Kích thước ảnh đưa vào model khi detect full frame (bội số 32)
+
+        # Cài đặt hiển thị - engine không dùng, chỉ lưu chung config với viewer
+        self.show_distance = True
+        self.show_coordinates = True
+        self.show_target_zone = True
+
+        # Serial communication
+        self.transport = None  # SerialTransport (thread đọc + subscriber)
+        self.command_queue = None  # CommandQueue - thread duy nhất ghi ra cổng
+        self.serial_protocol = "ascii"  # "ascii" (T#, G z,y#) hoặc "binary" (frame có CRC)
+        self.reliable_link = None  # ReliableLink - ACK/gửi lại T#, D#, G (nếu bật)
+        self.simulator = None      # ESP32Simulator khi port = "SIM"
+        self.sim_time_scale = 1.0  # Simulator chạy nhanh hơn thời gian thật N lần
+        self.sim_move_time = None  # Thời gian di chuyển Nano_1 cố định (None = theo tốc độ stepper)
+        self.reliable_delivery = False  # Cần firmware ESP32 trả ACK
+        self.ack_timeout = 0.2          # Giây chờ ACK trước khi có RTT đo được
+        self.ack_retries = 3            # Số lần gửi lại tối đa
+        self.serial_connected = False
+        self.test_mode_active = False  # Test mode: gửi T# liên tục
+        self.auto_stop_sent = False     # Đã gửi D# khi dâu vào zone
+        self.harvesting_in_progress = False  # Đang thực hiện harvest sequence
+        self.coord_send_time = 0        # Thời điểm gửi D# (0 = không chờ cắt)
+        self.saved_coord_for_auto = None  # Tọa độ đã save từ input để gửi auto
+        self.last_debug_time = 0        # Thời điểm in debug lần cuối (throttle spam)
+        self.last_detected_coords = None  # Lưu tọa độ phát hiện cuối (X, Y, Z, class) cho test cut
+        self.clock = time.time          # Đồng hồ cho chờ cắt / throttle debug (replay thay bằng đồng hồ ảo)
+
+        # Lọc tọa độ 3D theo track ID: sau D# cắt ngay khi ước lượng của target hội tụ
+        self.coord_filter = CoordFilter()
+        self.target_key = None           # Track ID của target ("target" nếu không tracking)
+        self.coord_tolerance = 0.3       # cm - độ lệch chuẩn tối đa của X/Y/Z để cắt
+        self.coord_min_samples = 3       # Số phép đo tối thiểu sau D#
+        self.coord_max_speed = 1.0       # cm/s - vận tốc ước lượng tối đa (quả đã thôi trôi sau D#)
+        self.cut_min_dwell = 0.2         # Giây chờ tối thiểu sau D# (xe phanh hẳn) trước khi cắt
+        self.cut_timeout = 1.0           # Giây chờ tối đa, hết giờ cắt theo ước lượng hiện tại
+
+        # Config file
+        self.config_file = config_file
+
+        # Target zone lines (X coordinates - vertical lines)
+        self.x_line_left = 250     # Đường trái (pixel)
+        self.x_line_right = 390    # Đường phải (pixel)
+        self.auto_stop_enabled = False  # Tự động dừng khi dâu vào vùng
+
+        # Corridor mode: chỉ detect trên crop quanh target zone (nhanh hơn full frame)
+        self.corridor_mode = False
+        self.corridor_padding = 40       # Pixel thêm 2 bên zone
+        self.corridor_lookahead = 120    # Pixel thêm về phía robot đang đi tới
+        self.travel_direction = "right"  # Hướng đi của robot trong ảnh: "left" / "right"
+        self.corridor_imgsz = 0          # 0 = tự tính (giữ scale như full frame 640)
+        self.corridor_full_frame_interval = 10  # Mỗi N frame chạy full frame 1 lần
+
+        # Scheduler: giảm tốc detect khi đang cắt, dừng khi robot đứng yên
+        self.adaptive_schedule = True
+        self.cutting_max_fps = 2.0       # FPS tối đa khi chờ HARVEST_DONE#
+        self.cutting_imgsz_scale = 0.75  # Giảm imgsz khi đang cắt (cảnh đứng yên)
+        self.idle_preview_fps = 5.0      # FPS khi idle nhưng có viewer
+
+        # Metrics: thời gian từng stage, ghi ra file định kỳ nếu có metrics_file
+        self.metrics_file = ""           # .json (ghi đè) hoặc .csv (append)
+        self.metrics_interval = 10.0     # Giây giữa 2 lần ghi
+
+        # Ghi phiên chạy (serial, lệnh, detect, trạng thái) ra record_dir/session_*.hvlog
+        self.record_sessions = False
+        self.record_dir = "sessions"
+        self.recorder = None
+        self.recorded_state = None
+
+        # Listener nhận log / thay đổi trạng thái: callback(event, data)
+        # event: "log" (message, color), "test_mode" (active), "serial" (connected)
+        self.listeners = []
+
+        # Load config from file
+        self.load_config()
+
+        # Load model (backend chọn từ config, --backend ghi đè)
+        # weights=None: không load model (replay từ detection đã ghi, không chạy detector)
+        if backend is not None:
+            self.model_backend = backend
+        if weights is None:
+            self.model, self.active_backend = None, "none"
+        else:
+            self.model, self.active_backend = model_backends.load_model(weights, self.model_backend)
+
+        # Thread detect + thread quyết định
+        self.scheduler = DetectionScheduler(self)
+        self.metrics = StageMetrics()
+        self.metrics_dumper = None
+        self.detector = DetectorWorker(self.model, self, scheduler=self.scheduler, metrics=self.metrics)
+        self.engine_thread = None
+        self.engine_running = False
+        self.frame_lock = threading.Lock()
+        self.new_frame = threading.Condition(self.frame_lock)
+        self.latest_frame = None
+        self.frame_seq = 0
+
+    # ===== Lifecycle =====
+
+    def start(self):
+        """Chạy thread detect và thread quyết định"""
+        if self.engine_running:
+            return
+        if self.record_sessions and self.recorder is None:
+            path = os.path.join(self.record_dir, time.strftime("session_%Y%m%d_%H%M%S.hvlog"))
+            self.recorder = SessionRecorder(path).start()
+            print(f"Recording session to {path}")
+        self.engine_running = True
+        self.detector.start()
+        self.engine_thread = threading.Thread(target=self._engine_loop, daemon=True)
+        self.engine_thread.start()
+
+        if self.metrics_file:
+            self.metrics_dumper = MetricsDumper(self.metrics, self.metrics_file, self.metrics_interval)
+            self.metrics_dumper.start()
+
+    def shutdown(self):
+        """Dừng toàn bộ engine, đóng camera/serial và lưu config"""
+        self.is_running = False
+        self.test_mode_active = False  # Dừng test mode
+        self.engine_running = False
+
+        self.detector.stop()
+        if self.engine_thread is not None:
+            self.engine_thread.join(timeout=2.0)
+            self.engine_thread = None
+
+        if self.metrics_dumper is not None:
+            self.metrics_dumper.stop()
+            self.metrics_dumper = None
+
+        self.close_camera()
+
+        # Đóng serial port (gửi nốt D# đang chờ)
+        if self.command_queue is not None:
+            self.command_queue.close(flush_timeout=0.5)
+        if self.reliable_link is not None:
+            self.reliable_link.close()
+        if self.transport is not None:
+            self.transport.close()
+        self._close_simulator()
+
+        if self.recorder is not None:
+            self.recorder.close()
+            self.recorder = None
+
+        # Lưu config cuối cùng
+        self.save_config()
+
+    def open_camera(self, camera_index=None):
+        """Mở camera (blocking - gọi từ thread riêng nếu đang ở GUI)"""
+        if camera_index is not None and camera_index != self.current_camera:
+            self.close_camera()
+            self.current_camera = camera_index
+
+        if self.cap is None or not self.cap.is_opened():
+            self.cap = CameraCapture(self.current_camera, self.image_width, self.image_height)
+            if not self.cap.start():
+                self.cap = None
+                return False
+            # Chờ frame đầu tiên để "warm up" camera
+            self.cap.read_latest(timeout=2.0)
+            self.detector.set_capture(self.cap)
+        return True
+
+    def close_camera(self):
+        if self.cap is not None:
+            self.detector.set_capture(None)
+            self.cap.stop()
+            self.cap = None
+
+    def camera_ready(self):
+        return self.is_running and self.cap is not None and self.cap.is_opened()
+
+    def get_latest_frame(self, last_seq=0, timeout=0.0):
+        """Lấy HarvestFrame mới nhất có seq > last_seq, None nếu chưa có"""
+        with self.new_frame:
+            if timeout > 0 and (self.latest_frame is None or self.latest_frame.seq <= last_seq):
+                self.new_frame.wait_for(
+                    lambda: (self.latest_frame is not None and self.latest_frame.seq > last_seq)
+                    or not self.engine_running,
+                    timeout=timeout)
+
+            if self.latest_frame is None or self.latest_frame.seq <= last_seq:
+                return None
+            return self.latest_frame
+
+    def _engine_loop(self):
+        last_seq = 0
+        while self.engine_running:
+            if self.recorder is not None:
+                self.record_state()
+            result = self.detector.get_latest(last_seq, timeout=0.1)
+            if result is None:
+                continue
+            last_seq = result.seq
+
+            with self.metrics.timer('decision'):
+                harvest_frame = self.process_detection(result)
+            if self.recorder is not None:
+                self.recorder.record_detection(harvest_frame)
+
+            with self.new_frame:
+                self.latest_frame = harvest_frame
+                self.new_frame.notify_all()
+
+    def record_state(self):
+        """Ghi trạng thái harvest khi có thay đổi (gọi mỗi vòng engine, tối đa 0.1s/lần)"""
+        state = (self.test_mode_active, self.harvesting_in_progress, self.auto_stop_sent,
+                 self.serial_connected, self.scheduler.policy_name)
+        if state != self.recorded_state:
+            self.recorded_state = state
+            self.recorder.record(REC_STATE, dict(zip(
+                ("test_mode", "harvesting", "auto_stop_sent", "serial_connected", "policy"), state)))
+
+    # ===== Listener / log =====
+
+    def add_listener(self, callback):
+        self.listeners.append(callback)
+
+    def notify(self, event, *data):
+        for callback in self.listeners:
+            try:
+                callback(event, *data)
+            except Exception as e:
+                print(f"Listener error: {e}")
+
+    def log_message(self, message, color="white"):
+        """Gửi log tới viewer (nếu có), không có viewer thì in ra stdout"""
+        if self.recorder is not None:
+            self.recorder.record(REC_LOG, message)
+        if self.listeners:
+            self.notify("log", message, color)
+        else:
+            timestamp = time.strftime("%H:%M:%S")
+            print(f"[{timestamp}] {message}")
+
+    # ===== Config =====
+
+    def save_config(self):
+        """Lưu config ra file txt (chỉ cơ bản, cho auto-save)"""
+        config = {
+            "real_width": self.real_width,
+            "focal_length": self.focal_length,
+            "x_line_left": self.x_line_left,
+            "x_line_right": self.x_line_right
+        }
+        try:
+            with open(self.config_file, 'w') as f:
+                json.dump(config, f, indent=4)
+            print(f"Config saved to {self.config_file}")
+        except Exception as e:
+            print(f"Error saving config: {e}")
+
+    def save_all_config(self):
+        """Lưu tất cả cài đặt ra file txt, trả về True nếu thành công"""
+        config = {
+            "real_width": self.real_width,
+            "focal_length": self.focal_length,
+            "x_line_left": self.x_line_left,
+            "x_line_right": self.x_line_right,
+            "conf_threshold": self.conf_threshold,
+            "iou_threshold": self.iou_threshold,
+            "brightness": self.brightness,
+            "show_distance": self.show_distance,
+            "show_coordinates": self.show_coordinates,
+            "flip_horizontal": self.flip_horizontal,
+            "tracking_method": self.tracking_method,
+            "model_backend": self.model_backend,
+            "imgsz": self.imgsz,
+            "show_target_zone": self.show_target_zone,
+            "auto_stop_enabled": self.auto_stop_enabled,
+            "corridor_mode": self.corridor_mode,
+            "corridor_padding": self.corridor_padding,
+            "corridor_lookahead": self.corridor_lookahead,
+            "travel_direction": self.travel_direction,
+            "corridor_imgsz": self.corridor_imgsz,
+            "corridor_full_frame_interval": self.corridor_full_frame_interval,
+            "adaptive_schedule": self.adaptive_schedule,
+            "cutting_max_fps": self.cutting_max_fps,
+            "cutting_imgsz_scale": self.cutting_imgsz_scale,
+            "idle_preview_fps": self.idle_preview_fps,
+            "coord_tolerance": self.coord_tolerance,
+            "coord_min_samples": self.coord_min_samples,
+            "coord_max_speed": self.coord_max_speed,
+            "cut_min_dwell": self.cut_min_dwell,
+            "cut_timeout": self.cut_timeout,
+            "serial_protocol": self.serial_protocol,
+            "reliable_delivery": self.reliable_delivery,
+            "ack_timeout": self.ack_timeout,
+            "ack_retries": self.ack_retries,
+            "metrics_file": self.metrics_file,
+            "metrics_interval": self.metrics_interval,
+            "record_sessions": self.record_sessions,
+            "record_dir": self.record_dir,
+            "current_camera": self.current_camera
+        }
+        try:
+            with open(self.config_file, 'w') as f:
+                json.dump(config, f, indent=4)
+            print(f"\n=== ALL CONFIG SAVED ===")
+            print(f"File: {self.config_file}")
+            print(f"  Detection: conf={self.conf_threshold:.2f}, iou={self.iou_threshold:.2f}")
+            print(f"  Brightness: {self.brightness}")
+            print(f"  Width: {self.real_width}cm, Focal: {self.focal_length}px")
+            print(f"  Zone: X={self.x_line_left} to {self.x_line_right}")
+            print(f"  Corridor: {self.corridor_mode} (pad={self.corridor_padding}, "
+                  f"lookahead={self.corridor_lookahead} {self.travel_direction})")
+            print(f"  Camera: {self.current_camera}")
+            print(f"  Backend: {self.model_backend}")
+            print(f"========================\n")
+            return True
+        except Exception as e:
+            print(f"Error saving config: {e}")
+            return False
+
+    def load_config(self):
+        """Đọc config từ file txt"""
+        if os.path.exists(self.config_file):
+            try:
+                with open(self.config_file, 'r') as f:
+                    config = json.load(f)
+
+                # Load các giá trị cơ bản
+                self.real_width = config.get("real_width", 3.0)
+                self.focal_length = config.get("focal_length", 615)
+                self.x_line_left = config.get("x_line_left", 250)
+                self.x_line_right = config.get("x_line_right", 390)
+
+                # Load các cài đặt khác (nếu có)
+                self.conf_threshold = config.get("conf_threshold", 0.5)
+                self.iou_threshold = config.get("iou_threshold", 0.45)
+                self.brightness = config.get("brightness", 0)
+                self.show_distance = config.get("show_distance", True)
+                self.show_coordinates = config.get("show_coordinates", True)
+                self.flip_horizontal = config.get("flip_horizontal", True)
+                self.tracking_method = config.get("tracking_method", "bytetrack")
+                self.model_backend = config.get("model_backend", "auto")
+                self.imgsz = config.get("imgsz", 640)
+                self.show_target_zone = config.get("show_target_zone", True)
+                self.auto_stop_enabled = config.get("auto_stop_enabled", False)
+                self.corridor_mode = config.get("corridor_mode", False)
+                self.corridor_padding = config.get("corridor_padding", 40)
+                self.corridor_lookahead = config.get("corridor_lookahead", 120)
+                self.travel_direction = config.get("travel_direction", "right")
+                self.corridor_imgsz = config.get("corridor_imgsz", 0)
+                self.corridor_full_frame_interval = config.get("corridor_full_frame_interval", 10)
+                self.adaptive_schedule = config.get("adaptive_schedule", True)
+                self.cutting_max_fps = config.get("cutting_max_fps", 2.0)
+                self.cutting_imgsz_scale = config.get("cutting_imgsz_scale", 0.75)
+                self.idle_preview_fps = config.get("idle_preview_fps", 5.0)
+                self.coord_tolerance = config.get("coord_tolerance", 0.3)
+                self.coord_min_samples = config.get("coord_min_samples", 3)
+                self.coord_max_speed = config.get("coord_max_speed", 1.0)
+                self.cut_min_dwell = config.get("cut_min_dwell", 0.2)
+                self.cut_timeout = config.get("cut_timeout", 1.0)
+                self.serial_protocol = config.get("serial_protocol", "ascii")
+                self.reliable_delivery = config.get("reliable_delivery", False)
+                self.ack_timeout = config.get("ack_timeout", 0.2)
+                self.ack_retries = config.get("ack_retries", 3)
+                self.metrics_file = config.get("metrics_file", "")
+                self.metrics_interval = config.get("metrics_interval", 10.0)
+                self.record_sessions = config.get("record_sessions", False)
+                self.record_dir = config.get("record_dir", "sessions")
+                self.current_camera = config.get("current_camera", 0)
+
+                print(f"Config loaded from {self.config_file}")
+                print(f"  Width: {self.real_width}cm, Focal: {self.focal_length}px")
+                print(f"  Zone: X={self.x_line_left} to {self.x_line_right}")
+                print(f"  Detection: conf={self.conf_threshold:.2f}, iou={self.iou_threshold:.2f}")
+                print(f"  Brightness: {self.brightness}")
+            except Exception as e:
+                print(f"Error loading config: {e}")
+        else:
+            print("No config file found. Using default values.")
+
+    def set_target_zone(self, x_left, x_right):
+        """Đổi target zone, trả về False nếu không hợp lệ"""
+        # Validate
+        if x_left >= x_right:
+            print("Warning: X Left must be < X Right")
+            return False
+
+        self.x_line_left = x_left
+        self.x_line_right = x_right
+        print(f"Target zone updated: X={self.x_line_left} to {self.x_line_right}")
+        return True
+
+    def calibrate(self, real_width):
+        """Calibrate focal length using current detected object"""
+        if self.last_pixel_width > 0:
+            # Formula: Focal_Length = (Pixel_Width * Distance) / Real_Width
+            self.real_width = real_width
+            self.focal_length = (self.last_pixel_width * self.calibration_distance) / self.real_width
+            print(f"Calibrated! Focal Length: {self.focal_length:.2f}px")
+            print(f"Place object at {self.calibration_distance}cm and click Calibrate")
+            return True
+
+        print("No object detected for calibration!")
+        return False
+
+    # ===== Serial =====
+
+    def connect_serial(self, port, baud, ser=None):
+        """Kết nối với ESP32 qua Serial (ser: object serial có sẵn, vd cổng giả lập)
+
+        port = "SIM": chạy ESP32Simulator trong process thay cho ESP32 thật.
+        """
+        try:
+            if not port and ser is None:
+                self.log_message("[ERROR] Please select a COM port!", "red")
+                return False
+
+            if port == SIM_PORT and ser is None:
+                self.simulator = ESP32Simulator(move_time=self.sim_move_time, time_scale=self.sim_time_scale)
+                ser = self.simulator.serial()
+
+            self.transport = SerialTransport(port, baud, ser=ser,
+                                             **binary_protocol.protocol_options(self.serial_protocol))
+            # Nhận từng dòng ngay khi byte tới (thread đọc của transport)
+            self.transport.subscribe(self._record_serial_line)
+            self.transport.subscribe(lambda line, timestamp: self.handle_serial_line(line))
+            self.transport.on_error(lambda e: self.log_message(f"[ERROR] Read error: {str(e)}", "red"))
+            self.transport.open()
+            self.transport.send_command(SEQ_RESET_COMMAND)  # Seq phiên trước (nếu có) không còn dùng
+            link = self.transport
+            if self.reliable_delivery:
+                # T#/D#/G có seq, chờ ACK và gửi lại nếu mất
+                self.reliable_link = ReliableLink(self.transport, ack_timeout=self.ack_timeout,
+                                                  max_retries=self.ack_retries, metrics=self.metrics,
+                                                  on_failed=lambda cmd, attempts: self.log_message(
+                                                      f"[ERROR] {cmd} not acknowledged after {attempts} tries!", "red"),
+                                                  on_rejected=lambda cmd: self.log_message(
+                                                      f"[WARNING] {cmd} rejected by ESP32 (newer command already run)",
+                                                      "yellow"))
+                link = self.reliable_link
+            self.command_queue = CommandQueue(link, metrics=self.metrics,
+                                              on_sent=self._on_command_sent,
+                                              on_error=lambda cmd, e: self.log_message(
+                                                  f"[ERROR] Send {cmd} failed: {str(e)}", "red"))
+            self.serial_connected = True
+
+            self.log_message(f"[SUCCESS] Connected to {port} @ {baud} baud ({self.serial_protocol}"
+                             f"{', ACK' if self.reliable_link else ''})", "green")
+            self.notify("serial", True)
+            return True
+
+        except Exception as e:
+            self.log_message(f"[ERROR] Connection failed: {str(e)}", "red")
+            self.serial_connected = False
+            if self.reliable_link is not None:
+                self.reliable_link.close()
+            self.reliable_link = None
+            if self.transport is not None:
+                self.transport.close()
+            self.transport = None
+            self._close_simulator()
+            return False
+
+    def disconnect_serial(self):
+        """Ngắt kết nối Serial"""
+        try:
+            self.serial_connected = False
+            if self.command_queue is not None:
+                self.command_queue.close()
+            self.command_queue = None
+            if self.reliable_link is not None:
+                self.reliable_link.close()
+            self.reliable_link = None
+            if self.transport is not None:
+                self.transport.close()
+            self.transport = None
+            self._close_simulator()
+
+            self.log_message("[INFO] Disconnected from serial port", "yellow")
+            self.notify("serial", False)
+
+        except Exception as e:
+            self.log_message(f"[ERROR] Disconnect failed: {str(e)}", "red")
+
+    def _record_serial_line(self, line, timestamp):
+        if self.recorder is not None:
+            self.recorder.record(REC_SERIAL_RX, line, timestamp)
+
+    def _on_command_sent(self, cmd, latency):
+        if self.recorder is not None:
+            self.recorder.record(REC_SERIAL_TX, cmd)
+        self.log_message(f"[SENT] {cmd}", "cyan")
+
+    def _close_simulator(self):
+        if self.simulator is not None:
+            self.simulator.close()
+            self.simulator = None
+
+    def send_command(self, cmd, on_sent=None):
+        """Đưa lệnh vào hàng đợi gửi ESP32 (không block, thread nào gọi cũng được)
+
+        on_sent(wire_time): gọi khi lệnh đã thực sự ghi ra cổng.
+        """
+        if not self.serial_connected or not self.command_queue:
+            self.log_message("[ERROR] Not connected! Click CONNECT first.", "red")
+            return False
+
+        self.command_queue.submit(cmd, on_sent=on_sent)
+        return True
+
+    def handle_serial_line(self, data):
+        """Xử lý 1 dòng nhận từ ESP32"""
+        if data.startswith(("ACK:", "NAK:")):
+            return  # Xác nhận / từ chối lệnh - ReliableLink xử lý
+        # Kiểm tra emergency stop từ ESP32
+        if data == "STOP":
+            self.log_message("[ESP32] EMERGENCY STOP received!", "red")
+            # Tự động dừng test mode
+            if self.test_mode_active:
+                self.stop_test_mode()
+        # Kiểm tra harvest complete từ ESP32
+        elif data == "HARVEST_DONE#":
+            self.log_message("✅ [HARVEST] COMPLETE! Strawberry harvested successfully!", "green")
+            # Tự động tiếp tục test mode - reset cờ và gửi T# lại
+            if self.test_mode_active:
+                self.log_message("[AUTO] Continuing to next strawberry...", "cyan")
+                self.harvesting_in_progress = False  # Reset trạng thái harvest
+                self.auto_stop_sent = False  # Reset để có thể dừng lại cho quả tiếp theo
+                # Gửi T# để tiếp tục di chuyển
+                if self.send_command("T#"):
+                    self.log_message("[AUTO] Sent T# - Moving to find next strawberry", "green")
+        else:
+            self.log_message(f"[ESP32] {data}", "white")
+
+    def save_coord_for_auto(self, z_val, y_val):
+        """Lưu tọa độ để gửi tự động khi detection dừng bánh xe"""
+        self.saved_coord_for_auto = (z_val, y_val)
+        self.log_message(f"[SAVED] Auto-send coord: Z={z_val:.1f}, Y={y_val:.1f}", "green")
+        self.log_message("[INFO] This coord will be sent after D# once coordinates settle in auto mode", "cyan")
+
+    def send_manual_coord(self, z_val, y_val):
+        """Gửi tọa độ thủ công"""
+        if not self.serial_connected or not self.command_queue:
+            self.log_message("[ERROR] Not connected! Click CONNECT first.", "red")
+            return
+
+        coord_cmd = f"G{z_val:.1f},{y_val:.1f}#"
+        self.send_command(coord_cmd)
+        self.log_message(f"[MANUAL] Sent coordinates: {coord_cmd}", "cyan")
+
+    def start_test_mode(self):
+        """Bắt đầu test mode - gửi T# 1 lần duy nhất"""
+        if not self.serial_connected or not self.command_queue:
+            self.log_message("[ERROR] Not connected! Click CONNECT first.", "red")
+            return False
+
+        self.test_mode_active = True
+        self.auto_stop_sent = False  # Reset cờ
+        self.notify("test_mode", True)
+
+        # Gửi lệnh T# 1 lần duy nhất
+        self.send_command("T#")
+        self.log_message("[TEST MODE] Started - Continuous harvesting mode activated", "green")
+        self.log_message("[INFO] Robot will harvest all Ripe strawberries until STOP pressed", "cyan")
+        return True
+
+    def stop_test_mode(self):
+        """Dừng test mode"""
+        self.test_mode_active = False
+        self.auto_stop_sent = False  # Reset cờ
+        self.notify("test_mode", False)
+
+        self.log_message("[TEST MODE] Stopped - Continuous harvesting ended", "yellow")
+
+        # Gửi lệnh dừng
+        if self.command_queue is not None:
+            self.send_command("D#")
+
+    def continue_after_skip(self, reason):
+        """Bỏ qua quả hiện tại và cho xe đi tiếp (chỉ trong test mode)"""
+        if self.test_mode_active:
+            self.harvesting_in_progress = False  # Reset trạng thái harvest
+            self.auto_stop_sent = False  # Reset để có thể dừng lại cho quả tiếp theo
+            self.coord_send_time = 0     # Reset để không gọi lại test_cut_strawberry
+            self.log_message(f"[AUTO] Continuing to find {reason}...", "green")
+            if self.send_command("T#"):
+                self.log_message("[AUTO] Sent T# - Moving forward", "cyan")
+
+    def test_cut_strawberry(self):
+        """Test cắt dâu từ tọa độ phát hiện (không di chuyển bánh xe)"""
+        if not self.serial_connected or not self.command_queue:
+            self.log_message("[ERROR] Not connected! Click CONNECT first.", "red")
+            return
+
+        if self.last_detected_coords is None:
+            self.log_message("[ERROR] No strawberry detected! Run camera first.", "red")
+            return
+
+        X, Y, Z, cls = self.last_detected_coords
+
+        # Kiểm tra chỉ cắt quả Ripe (class 0), bỏ qua Unripe (class 1)
+        if cls != 0:
+            class_name = self.class_names.get(cls, 'Unknown')
+            self.log_message(f"[SKIP] Berry is {class_name} - Only harvest Ripe strawberries", "yellow")
+            self.log_message(f"[INFO] Skipped berry at X={X:.1f}, Y={Y:.1f}, Z={Z:.1f}cm", "cyan")
+
+            # Tự động tiếp tục nếu đang trong test mode
+            self.continue_after_skip("next Ripe strawberry")
+            return
+        # Chuyển đổi tọa độ camera → tool (tính từ vị trí mặc định Z=100mm, Y=10mm)
+        # Y_cam (cm) → Z_tool (mm): Y*10 + 100 (offset) + 100 (default) = Y*10 + 200
+        # Z_cam (cm) → Y_tool (mm): Z*10 - 20 (offset cắt)
+        # Y của dâu → Z của tool, Z của dâu → Y của tool (tuyệt đối)
+        Z_tool, Y_tool = (int(v) for v in box_geometry.tool_coordinates(Y, Z))
+
+        # Kiểm tra giới hạn tool (Z max: 150mm, Y max: 300mm)
+        if Z_tool > box_geometry.TOOL_Z_MAX or Z_tool < 0:
+            self.log_message(f"[WARNING] Z_tool={Z_tool}mm out of range [0-150mm] - SKIPPED", "red")
+            self.log_message(f"[SKIP] Berry at X={X:.1f}, Y={Y:.1f}, Z={Z:.1f}cm is unreachable", "yellow")
+
+            # Tự động tiếp tục nếu đang trong test mode
+            self.continue_after_skip("reachable strawberry")
+            return
+
+        if Y_tool > box_geometry.TOOL_Y_MAX or Y_tool < 0:
+            self.log_message(f"[WARNING] Y_tool={Y_tool}mm out of range [0-300mm] - SKIPPED", "red")
+            self.log_message(f"[SKIP] Berry at X={X:.1f}, Y={Y:.1f}, Z={Z:.1f}cm is unreachable", "yellow")
+
+            # Tự động tiếp tục nếu đang trong test mode
+            self.continue_after_skip("reachable strawberry")
+            return
+
+        # Tọa độ hợp lệ - gửi lệnh
+        coord_cmd = f"G{Z_tool},{Y_tool}#"
+        self.harvesting_in_progress = True  # Đánh dấu đang harvest
+        self.send_command(coord_cmd)
+        self.log_message(f"[TEST CUT] Berry coords: X={X:.1f}, Y={Y:.1f}, Z={Z:.1f}cm", "cyan")
+        self.log_message(f"[TEST CUT] Tool coords sent: Z={Z_tool}mm, Y={Y_tool}mm", "yellow")
+        self.log_message(f"[TEST CUT] Sequence: Move→Cut→Tray(Y=10)→Release→Wait(100,10)", "green")
+
+    # ===== Tính toán tọa độ =====
+
+    def calculate_distance(self, pixel_width):
+        """Calculate distance using: Distance = (Real_Width * Focal_Length) / Pixel_Width
+
+        Nhận scalar hoặc array pixel_width (tính cho tất cả box cùng lúc).
+        """
+        return box_geometry.calculate_distance(pixel_width, self.real_width, self.focal_length)
+
+    def calculate_3d_coordinates(self, center_x, center_y, distance):
+        """Calculate 3D coordinates (X, Y, Z) in cm - origin is at camera center"""
+        return box_geometry.calculate_3d_coordinates(center_x, center_y, distance, self.focal_length,
+                                                     self.image_width, self.image_height)
+
+    # ===== Quyết định harvest =====
+
+    @staticmethod
+    def filter_key(boxes, index):
+        """Khóa CoordFilter của box: track ID, không tracking thì 1 khóa chung cho target"""
+        return int(boxes.track_ids[index]) if boxes.track_ids is not None else "target"
+
+    def update_coord_filter(self, boxes, distance, X, Y, Z, target):
+        """Đưa tọa độ frame này vào CoordFilter (mọi box có track ID, hoặc chỉ target)"""
+        now = self.clock()
+        if boxes.track_ids is not None:
+            indices = np.flatnonzero(distance > 0)
+        elif target >= 0 and distance[target] > 0:
+            indices = (target,)
+        else:
+            indices = ()
+        for i in indices:
+            self.coord_filter.update(self.filter_key(boxes, i), X[i], Y[i], Z[i], now)
+        self.coord_filter.prune(now)
+
+    def process_detection(self, result):
+        """Zone check, chọn target, auto stop D# và auto cut cho 1 kết quả detect"""
+        boxes = result.boxes
+
+        # Tọa độ box dạng pixel nguyên (giống int(x) từng box)
+        xyxy = boxes.xyxy.astype(int)
+        center_x, center_y = box_geometry.box_centers(xyxy)
+
+        # Check xem tâm có nằm trong target zone không (theo trục X)
+        in_zone = (center_x >= self.x_line_left) & (center_x <= self.x_line_right)
+        # Dâu Ripe (cls == 0) trong zone
+        ripe_in_zone = in_zone & (boxes.cls == 0)
+        target_in_zone = bool(ripe_in_zone.any())
+
+        # Tính khoảng cách và tọa độ 3D cho tất cả box
+        pixel_width = xyxy[:, 2] - xyxy[:, 0]
+        if len(pixel_width) > 0:
+            self.last_pixel_width = int(pixel_width[-1])  # Lưu để calibrate
+        distance = self.calculate_distance(pixel_width)
+        X, Y, Z = self.calculate_3d_coordinates(center_x, center_y, distance)
+
+        # Target: quả ở dưới cùng trong zone (center_y lớn nhất)
+        target = box_geometry.select_target(center_y, ripe_in_zone)
+        self.update_coord_filter(boxes, distance, X, Y, Z, target)
+
+        if target >= 0:
+            zone_idx = np.flatnonzero(ripe_in_zone)
+            zone_idx = zone_idx[np.argsort(-center_y[zone_idx], kind='stable')]  # Dưới → trên
+            print(f"[PRIORITY] {len(zone_idx)} Ripe strawberry(ies) in zone! Processing bottom-to-top:")
+            for i, idx in enumerate(zone_idx):
+                priority_marker = "🎯 TARGET" if i == 0 else "⏳ QUEUED"
+                track_id = boxes.track_ids[idx] if boxes.track_ids is not None else None
+                print(f"  {priority_marker} ID:{track_id} center_y={center_y[idx]} (lower=first)")
+
+            # Lưu tọa độ đã lọc của target (ưu tiên cao nhất)
+            if distance[target] > 0:
+                cls = int(boxes.cls[target])
+                self.target_key = self.filter_key(boxes, target)
+                estimate = self.coord_filter.get(self.target_key)
+                Xs, Ys, Zs = (float(v) for v in estimate.mean)
+                self.last_detected_coords = (Xs, Ys, Zs, cls)
+                track_id = boxes.track_ids[target] if boxes.track_ids is not None else None
+                print(f"[TARGET COORDS] Saved target ID:{track_id} -> X={Xs:.1f}, Y={Ys:.1f}, Z={Zs:.1f} "
+                      f"(±{estimate.std.max():.2f}cm, {estimate.samples} samples), "
+                      f"Class={self.class_names.get(cls, 'Unknown')}")
+        else:
+            # Không có quả Ripe trong zone - clear last_detected_coords để tránh xử lý tọa độ cũ
+            if target_in_zone == False and self.last_detected_coords:
+                print("[DEBUG] No Ripe strawberry in zone - Clearing old coordinates")
+                # Không clear hoàn toàn, vì có thể quả đang ở ngoài zone
+                # self.last_detected_coords = None
+
+            # Nếu đang test mode và detect được object trong zone nhưng không phải Ripe
+            # Kiểm tra xem có Unripe trong zone không
+            unripe_in_zone = bool((in_zone & (boxes.cls != 0)).any())
+            if unripe_in_zone and self.test_mode_active:
+                print("[DEBUG] Unripe strawberry in zone - Skipping and continuing movement")
+                # Đảm bảo xe không dừng lại
+                if self.auto_stop_sent:
+                    self.auto_stop_sent = False
+                    print("[DEBUG] Reset auto_stop_sent to allow next detection")
+
+        # Auto stop nếu có dâu trong zone (chỉ trong test mode)
+        # Debug: In ra các điều kiện (1s/lần)
+        if target_in_zone:
+            current_time = self.clock()
+            if current_time - self.last_debug_time >= 1.0:  # Chỉ in 1s 1 lần
+                print(f"[DEBUG] Target in zone detected!")
+                print(f"  auto_stop_enabled: {self.auto_stop_enabled}")
+                print(f"  test_mode_active: {self.test_mode_active}")
+                print(f"  auto_stop_sent: {self.auto_stop_sent}")
+                print(f"  serial_connected: {self.serial_connected}")
+                self.last_debug_time = current_time
+
+        auto_stopping = False
+        if self.auto_stop_enabled and target_in_zone and self.test_mode_active:
+            auto_stopping = True
+            if not self.auto_stop_sent and not self.harvesting_in_progress:  # Chỉ gửi 1 lần và không đang harvest
+                if self.serial_connected and self.command_queue:
+                    print("[DEBUG] Sending D# command...")
+                    # Gửi lệnh dừng - độ trễ từ lúc camera grab frame tới lúc D# ra serial
+                    capture_time = result.capture_time
+                    self.send_command("D#", on_sent=lambda wire_time: self.metrics.record(
+                        'camera_to_d', wire_time - capture_time))
+                    self.auto_stop_sent = True  # Đánh dấu đã gửi
+                    self.harvesting_in_progress = True  # Đánh dấu bắt đầu harvest sequence
+                    # KHÔNG TẮT test_mode_active - để tiếp tục thu hoạch sau HARVEST_DONE#
+                    self.log_message("[AUTO STOP] Target in zone - Sent D#", "yellow")
+
+                    # Lưu thời điểm để gọi test_cut_strawberry khi tọa độ hội tụ. Đo lại mọi track
+                    # từ đầu: target có thể đổi sang track khác sau D# (đổi ID, quả thấp hơn vào
+                    # zone), phép đo lúc xe còn chạy không được tính vào hội tụ
+                    self.coord_send_time = self.clock()
+                    self.coord_filter.reset()
+
+                    # Log: sẽ tự động gọi hàm cắt dâu khi tọa độ ổn định
+                    if self.last_detected_coords:
+                        X, Y, Z, cls = self.last_detected_coords
+                        class_name = self.class_names.get(cls, 'Unknown')
+                        print(f"[DEBUG] Will auto-cut strawberry once coords settle (max {self.cut_timeout:.1f}s): "
+                              f"Berry coords X={X:.1f}, Y={Y:.1f}, Z={Z:.1f}cm, Class={class_name}")
+                    else:
+                        print("[DEBUG] No detected coordinates - will NOT auto-cut")
+
+                    print("[DEBUG] D# sent successfully!")
+                else:
+                    print("[DEBUG] Serial not connected!")
+            else:
+                print("[DEBUG] D# already sent (auto_stop_sent=True)")
+        elif self.test_mode_active and not target_in_zone:
+            # Đang trong test mode nhưng KHÔNG có quả Ripe trong zone
+            # Đảm bảo xe vẫn di chuyển (không bị dừng)
+            if self.auto_stop_sent:
+                # Nếu trước đó đã gửi D# (có quả Ripe) nhưng giờ không còn
+                # Reset để xe tiếp tục đi
+                print("[DEBUG] No Ripe in zone - Ensuring movement continues")
+                self.auto_stop_sent = False
+
+        # Cập nhật thông tin
+        self.total_objects = len(boxes.cls)
+
+        # Kiểm tra xem đã đến lúc tự động cắt dâu chưa: đã qua cut_min_dwell và tọa độ
+        # target hội tụ (đủ mẫu, độ lệch chuẩn <= coord_tolerance, vận tốc <= coord_max_speed)
+        # hoặc hết cut_timeout kể từ D#
+        if self.coord_send_time > 0:
+            waited = self.clock() - self.coord_send_time
+            settled = waited >= self.cut_min_dwell and self.coord_filter.converged(
+                self.target_key, self.coord_tolerance, self.coord_min_samples, self.coord_max_speed)
+            if settled or waited >= self.cut_timeout:
+                # Tự động gọi test_cut_strawberry() để cắt dâu
+                if self.last_detected_coords:
+                    reason = "Coords settled" if settled else "Timeout"
+                    print(f"[AUTO CUT] {reason} after {waited:.2f}s - Auto-cutting strawberry...")
+                    self.log_message("[AUTO CUT] Starting harvest sequence...", "green")
+                    self.metrics.record('d_to_cut', waited)
+                    self.test_cut_strawberry()
+                else:
+                    print("[AUTO CUT] No coordinates detected - skipping")
+                    self.log_message("[AUTO CUT] No strawberry coords - skipped", "red")
+
+                # Reset
+                self.coord_send_time = 0
+
+        self.frame_seq += 1
+        return HarvestFrame(self.frame_seq, result, xyxy, center_x, center_y, in_zone,
+                            distance, X, Y, Z, target, target_in_zone, auto_stopping,
+                            self.total_objects)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Headless strawberry harvesting engine (no GUI)")
+    parser.add_argument("--weights", default="best.pt", help="YOLO weights file")
+    parser.add_argument("--config", default="strawberry_config.txt", help="Config file (JSON)")
+    parser.add_argument("--backend", default=None, choices=("auto",) + model_backends.BACKEND_PRIORITY,
+                        help="Inference backend (default: model_backend from config)")
+    parser.add_argument("--camera", type=int, default=None, help="Camera index (default: from config)")
+    parser.add_argument("--port", default=None,
+                        help=f"ESP32 serial port, e.g. COM3 or /dev/ttyUSB0 ({SIM_PORT} = built-in simulator)")
+    parser.add_argument("--sim-time-scale", type=float, default=1.0,
+                        help=f"Run the {SIM_PORT} simulator N times faster than real time")
+    parser.add_argument("--baud", type=int, default=115200, help="Serial baudrate")
+    parser.add_argument("--protocol", default=None, choices=binary_protocol.PROTOCOLS,
+                        help="Serial protocol (default: serial_protocol from config)")
+    parser.add_argument("--reliable", action="store_true",
+                        help="Require ESP32 ACKs for T#/D#/G and retransmit lost commands")
+    parser.add_argument("--auto-stop", action="store_true", help="Enable auto stop (D#) when a Ripe berry enters the zone")
+    parser.add_argument("--corridor", action="store_true", help="Detect only on a crop around the target zone")
+    parser.add_argument("--tracker", default=None, choices=("bytetrack", "deepsort", "centroid", "none"),
+                        help="Tracking method (default: tracking_method from config)")
+    parser.add_argument("--no-adaptive", action="store_true", help="Always detect at full rate (disable scheduler)")
+    parser.add_argument("--metrics-file", default=None, help="Dump stage timings periodically (.json or .csv)")
+    parser.add_argument("--metrics-interval", type=float, default=None, help="Seconds between metrics dumps")
+    parser.add_argument("--record", default=None, metavar="DIR",
+                        help="Record the session (serial, commands, detections, state) to DIR/session_*.hvlog")
+    parser.add_argument("--test-mode", action="store_true", help="Start continuous harvesting (send T#) after connecting")
+    args = parser.parse_args()
+
+    engine = HarvestEngine(weights=args.weights, config_file=args.config, backend=args.backend)
+    if args.auto_stop:
+        engine.auto_stop_enabled = True
+    if args.protocol:
+        engine.serial_protocol = args.protocol
+    if args.reliable:
+        engine.reliable_delivery = True
+    engine.sim_time_scale = args.sim_time_scale
+    if args.corridor:
+        engine.corridor_mode = True
+    if args.tracker:
+        engine.tracking_method = args.tracker
+    if args.no_adaptive:
+        engine.adaptive_schedule = False
+    if args.metrics_file:
+        engine.metrics_file = args.metrics_file
+    if args.record:
+        engine.record_sessions = True
+        engine.record_dir = args.record
+    if args.metrics_interval:
+        engine.metrics_interval = args.metrics_interval
+
+    engine.is_running = True
+    if not engine.open_camera(args.camera):
+        print(f"Cannot open camera {engine.current_camera}")
+        return
+    engine.start()
+
+    if args.port:
+        if engine.connect_serial(args.port, args.baud) and args.test_mode:
+            engine.start_test_mode()
+
+    print("Harvest engine running - press Ctrl+C to stop")
+    try:
+        while True:
+            time.sleep(1.0)
+            print(f"FPS: {engine.detector.fps:.1f} ({engine.active_backend}) | "
+                  f"Policy: {engine.scheduler.policy_name} ({engine.scheduler.duty_cycle:.0%} duty) | Objects: {engine.total_objects} | "
+                  f"Test mode: {engine.test_mode_active} | Harvesting: {engine.harvesting_in_progress}")
+    except KeyboardInterrupt:
+        print("Stopping...")
+    finally:
+        engine.shutdown()
+        print("Stage timings (ms):")
+        print(engine.metrics.format_table())
+        if engine.reliable_link is not None:
+            print(f"Serial ACK: {engine.reliable_link.stats()}")
+
+
+if __name__ == "__main__":
+    main()
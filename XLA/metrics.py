@@ -0,0 +1,135 @@
+import os
+import csv
+import json
+import time
+import threading
+from contextlib import contextmanager
+
+import numpy as np
+
+
+# Các stage được đo (ms). camera_to_d: từ lúc grab frame tới lúc ghi D# ra serial,
+# serial_queue: từ lúc submit lệnh tới lúc ghi xong ra cổng, serial_rtt: gửi → ACK của ESP32,
+# d_to_cut: từ lúc gửi D# tới lúc gửi tọa độ cắt (chờ tọa độ hội tụ)
+STAGES = ('capture', 'preprocess', 'inference', 'tracking', 'decision',
+          'overlay', 'display', 'serial_queue', 'serial_write', 'serial_rtt', 'camera_to_d', 'd_to_cut')
+
+PERCENTILES = (50, 95, 99)
+
+
+class RollingHistogram:
+    """Lưu N mẫu gần nhất (ring buffer NumPy), tính p50/p95/p99 khi cần"""
+
+    def __init__(self, size=500):
+        self.samples = np.zeros(size, dtype=np.float64)
+        self.index = 0
+        self.count = 0   # Tổng số mẫu từ đầu (không giới hạn bởi size)
+
+    def add(self, value):
+        self.samples[self.index] = value
+        self.index = (self.index + 1) % len(self.samples)
+        self.count += 1
+
+    def summary(self):
+        """dict count/mean/max/p50/p95/p99 trên cửa sổ hiện tại, None nếu chưa có mẫu"""
+        n = min(self.count, len(self.samples))
+        if n == 0:
+            return None
+        window = self.samples[:n]
+        p50, p95, p99 = np.percentile(window, PERCENTILES)
+        return {"count": self.count, "mean": float(window.mean()), "max": float(window.max()),
+                "p50": float(p50), "p95": float(p95), "p99": float(p99)}
+
+
+class StageMetrics:
+    """Thời gian từng stage của pipeline (đồng hồ monotonic, đơn vị ms)
+
+    Nhiều thread ghi cùng lúc (camera/detector/engine/Tk/serial) nên có lock.
+    Dùng: metrics.record('inference', seconds) hoặc `with metrics.timer('overlay'):`.
+    """
+
+    def __init__(self, window=500):
+        self.lock = threading.Lock()
+        self.histograms = {stage: RollingHistogram(window) for stage in STAGES}
+        self.start_time = time.monotonic()
+
+    def record(self, stage, seconds):
+        with self.lock:
+            self.histograms[stage].add(seconds * 1000.0)
+
+    @contextmanager
+    def timer(self, stage):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(stage, time.perf_counter() - start)
+
+    def snapshot(self):
+        """{stage: summary} cho các stage đã có mẫu"""
+        with self.lock:
+            result = {}
+            for stage, hist in self.histograms.items():
+                summary = hist.summary()
+                if summary is not None:
+                    result[stage] = summary
+            return result
+
+    def format_table(self):
+        """Bảng text p50/p95/p99 (ms) cho GUI / console"""
+        lines = [f"{'stage':<13}{'p50':>7}{'p95':>7}{'p99':>7}"]
+        for stage, s in self.snapshot().items():
+            lines.append(f"{stage:<13}{s['p50']:>7.1f}{s['p95']:>7.1f}{s['p99']:>7.1f}")
+        return "\n".join(lines)
+
+    def dump(self, path):
+        """Ghi snapshot ra file: .csv thì append từng dòng, còn lại ghi đè JSON"""
+        snapshot = self.snapshot()
+        timestamp = time.time()
+        if path.lower().endswith('.csv'):
+            new_file = not os.path.exists(path)
+            with open(path, 'a', newline='') as f:
+                writer = csv.writer(f)
+                if new_file:
+                    writer.writerow(["timestamp", "stage", "count", "mean", "max", "p50", "p95", "p99"])
+                for stage, s in snapshot.items():
+                    writer.writerow([f"{timestamp:.3f}", stage, s["count"], f"{s['mean']:.3f}",
+                                     f"{s['max']:.3f}", f"{s['p50']:.3f}", f"{s['p95']:.3f}", f"{s['p99']:.3f}"])
+        else:
+            with open(path, 'w') as f:
+                json.dump({"timestamp": timestamp,
+                           "uptime": time.monotonic() - self.start_time,
+                           "unit": "ms",
+                           "stages": snapshot}, f, indent=4)
+
+
+class MetricsDumper:
+    """Thread ghi StageMetrics ra file JSON/CSV định kỳ"""
+
+    def __init__(self, metrics, path, interval=10.0):
+        self.metrics = metrics
+        self.path = path
+        self.interval = interval
+        self.stop_event = threading.Event()
+        self.thread = None
+
+    def start(self):
+        self.thread = threading.Thread(target=self._dump_loop, daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.stop_event.set()
+        if self.thread is not None:
+            self.thread.join(timeout=2.0)
+            self.thread = None
+        self._dump()  # Ghi lần cuối khi dừng
+
+    def _dump_loop(self):
+        while not self.stop_event.wait(self.interval):
+            self._dump()
+
+    def _dump(self):
+        try:
+            self.metrics.dump(self.path)
+        except Exception as e:
+            print(f"Error writing metrics: {e}")
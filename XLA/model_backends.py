@@ -0,0 +1,110 @@
+import os
+import shutil
+import hashlib
+import importlib.util
+
+from ultralytics import YOLO
+
+
+# Thứ tự ưu tiên khi chọn "auto" (nhanh → chậm trên CPU)
+BACKEND_PRIORITY = ('openvino', 'onnx', 'torchscript', 'pytorch')
+
+# Module cần có để chạy từng backend
+BACKEND_MODULES = {
+    'openvino': ('openvino',),
+    'onnx': ('onnx', 'onnxruntime'),
+    'torchscript': ('torch',),
+    'pytorch': ('torch',),
+}
+
+# Tên artifact ultralytics tạo ra khi export (tính từ tên file weights)
+EXPORT_ARTIFACTS = {
+    'onnx': '{stem}.onnx',
+    'openvino': '{stem}_openvino_model',
+    'torchscript': '{stem}.torchscript',
+}
+
+# Backend hỗ trợ imgsz thay đổi (dùng cho crop ROI nhỏ hơn 640)
+DYNAMIC_BACKENDS = ('pytorch', 'onnx', 'openvino')
+
+
+def weights_hash(weights):
+    """SHA-256 (16 ký tự đầu) của file weights - khóa cache export"""
+    digest = hashlib.sha256()
+    with open(weights, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            digest.update(chunk)
+    return digest.hexdigest()[:16]
+
+
+def backend_available(backend):
+    """Kiểm tra đã cài đủ thư viện cho backend chưa"""
+    return all(importlib.util.find_spec(name) is not None for name in BACKEND_MODULES[backend])
+
+
+def export_cache_dir(weights):
+    """Thư mục cache cạnh weights: <stem>_exports/<hash>/"""
+    weights = os.path.abspath(weights)
+    stem = os.path.splitext(os.path.basename(weights))[0]
+    return os.path.join(os.path.dirname(weights), f"{stem}_exports", weights_hash(weights))
+
+
+def export_model(weights, backend, imgsz=640):
+    """Export weights sang backend (chỉ 1 lần), trả về đường dẫn artifact đã cache"""
+    if backend == 'pytorch':
+        return weights
+
+    cache_dir = export_cache_dir(weights)
+    stem = os.path.splitext(os.path.basename(weights))[0]
+    artifact = os.path.join(cache_dir, EXPORT_ARTIFACTS[backend].format(stem=stem))
+    if os.path.exists(artifact):
+        return artifact
+
+    # Export từ bản copy trong cache dir để artifact nằm luôn trong cache
+    # (không ghi đè file .onnx / _openvino_model cạnh best.pt của người dùng)
+    os.makedirs(cache_dir, exist_ok=True)
+    cached_weights = os.path.join(cache_dir, os.path.basename(weights))
+    if not os.path.exists(cached_weights):
+        shutil.copy2(weights, cached_weights)
+
+    print(f"[MODEL] Exporting {weights} to {backend} (first run only)...")
+    YOLO(cached_weights).export(format=backend, imgsz=imgsz,
+                                dynamic=backend in DYNAMIC_BACKENDS, verbose=False)
+
+    if not os.path.exists(artifact):
+        raise RuntimeError(f"Export to {backend} did not produce {artifact}")
+    print(f"[MODEL] Exported: {artifact}")
+    return artifact
+
+
+def load_model(weights='best.pt', backend='auto', imgsz=640):
+    """Load YOLO với backend nhanh nhất có sẵn (hoặc backend đã chỉ định)
+
+    Model export vẫn được bọc bởi ultralytics YOLO nên predict/track trả về
+    Results/Boxes giống hệt PyTorch - tracking và logic zone không đổi.
+    Trả về (model, tên backend thực tế).
+    """
+    if backend == 'auto':
+        candidates = [b for b in BACKEND_PRIORITY if backend_available(b)]
+    elif backend in BACKEND_MODULES:
+        candidates = [backend]
+        if backend != 'pytorch':
+            candidates.append('pytorch')  # Fallback nếu backend chỉ định lỗi
+    else:
+        print(f"[MODEL] Unknown backend '{backend}' - using pytorch")
+        candidates = ['pytorch']
+
+    for name in candidates:
+        try:
+            if not backend_available(name):
+                print(f"[MODEL] Backend {name} not installed - skipping")
+                continue
+            path = export_model(weights, name, imgsz)
+            model = YOLO(path, task='detect')
+            print(f"[MODEL] Loaded {path} ({name})")
+            return model, name
+        except Exception as e:
+            print(f"[MODEL] Backend {name} failed: {e}")
+
+    # Cuối cùng vẫn thử PyTorch gốc
+    return YOLO(weights), 'pytorch'
@@ -0,0 +1,184 @@
+import cv2
+import numpy as np
+
+
+class StaticOverlay:
+    """Lớp vẽ tĩnh (target zone, trục tọa độ, vạch chia) được cache sẵn
+
+    Các nét vẽ không đổi giữa các frame nên chỉ vẽ 1 lần vào layer BGR +
+    mask, build lại khi đổi zone / kích thước ảnh. Mỗi frame chỉ còn:
+    blend màu zone trên đúng ROI của zone + copy các pixel của mask.
+    Kết quả giống hệt vẽ trực tiếp từng frame như trước.
+    """
+
+    ZONE_COLOR = (0, 255, 0)
+    ZONE_ALPHA = 0.1  # Độ đậm màu phủ vùng target
+
+    def __init__(self):
+        self.key = None
+        self.zone_cols = None    # (x0, x1) cột của ROI zone
+        self.zone_tint = None    # Ảnh màu zone kích thước ROI (cho addWeighted)
+        self.pixel_idx = None    # Index phẳng các pixel có nét vẽ
+        self.pixel_val = None    # Màu BGR cuối cùng của các pixel đó
+
+    def apply(self, frame, x_line_left, x_line_right, show_target_zone=True):
+        """Vẽ overlay lên frame (in-place, frame phải C-contiguous)"""
+        height, width = frame.shape[:2]
+        key = (width, height, x_line_left, x_line_right, show_target_zone)
+        if key != self.key:
+            self.build(*key)
+
+        # Vẽ vùng target (semi-transparent) - chỉ blend trong ROI của zone
+        if self.zone_cols is not None:
+            x0, x1 = self.zone_cols
+            roi = frame[:, x0:x1]
+            cv2.addWeighted(self.zone_tint, self.ZONE_ALPHA, roi, 1 - self.ZONE_ALPHA, 0, dst=roi)
+
+        # Copy các nét vẽ tĩnh (đường zone, trục, vạch chia)
+        frame.reshape(-1, 3)[self.pixel_idx] = self.pixel_val
+        return frame
+
+    def build(self, width, height, x_line_left, x_line_right, show_target_zone):
+        """Vẽ lại layer tĩnh khi config thay đổi"""
+        layer = np.zeros((height, width, 3), dtype=np.uint8)
+        mask = np.zeros((height, width), dtype=np.uint8)
+
+        def draw(func, *args, color, **kwargs):
+            # Vẽ cùng 1 nét lên layer (màu thật) và mask (255)
+            func(layer, *args, color, **kwargs)
+            func(mask, *args, 255, **kwargs)
+
+        self.zone_cols = None
+        if show_target_zone:
+            # Đường trái (xanh lá) - vertical line
+            draw(cv2.line, (x_line_left, 0), (x_line_left, height), color=(0, 255, 0), thickness=2)
+            draw(cv2.putText, f"X_LEFT: {x_line_left}", (x_line_left + 5, 30),
+                 cv2.FONT_HERSHEY_SIMPLEX, 0.5, color=(0, 255, 0), thickness=2)
+
+            # Đường phải (vàng) - vertical line
+            draw(cv2.line, (x_line_right, 0), (x_line_right, height), color=(0, 255, 255), thickness=2)
+            draw(cv2.putText, f"X_RIGHT: {x_line_right}", (x_line_right - 100, 30),
+                 cv2.FONT_HERSHEY_SIMPLEX, 0.5, color=(0, 255, 255), thickness=2)
+
+            # ROI của vùng target (rectangle fill bao gồm cả cột x_line_right)
+            x0 = min(max(x_line_left, 0), width)
+            x1 = min(max(x_line_right + 1, 0), width)
+            if x1 > x0:
+                self.zone_cols = (x0, x1)
+                self.zone_tint = np.empty((height, x1 - x0, 3), dtype=np.uint8)
+                self.zone_tint[:] = self.ZONE_COLOR
+
+                # Đường zone nằm trong ROI cũng bị phủ màu (giống thứ tự vẽ cũ)
+                roi = layer[:, x0:x1]
+                cv2.addWeighted(self.zone_tint, self.ZONE_ALPHA, roi, 1 - self.ZONE_ALPHA, 0, dst=roi)
+
+        # Vẽ trục tọa độ X, Y (mảnh, màu trắng)
+        center_x = width // 2
+        center_y = height // 2
+        white = (255, 255, 255)
+
+        # Trục X (ngang) - qua tâm
+        draw(cv2.line, (0, center_y), (width, center_y), color=white, thickness=1)
+        # Mũi tên X
+        draw(cv2.arrowedLine, (width - 30, center_y), (width - 10, center_y), color=white,
+             thickness=1, tipLength=0.3)
+        draw(cv2.putText, "X", (width - 25, center_y - 10), cv2.FONT_HERSHEY_SIMPLEX, 0.5,
+             color=white, thickness=1)
+
+        # Trục Y (dọc) - qua tâm
+        draw(cv2.line, (center_x, 0), (center_x, height), color=white, thickness=1)
+        # Mũi tên Y
+        draw(cv2.arrowedLine, (center_x, 30), (center_x, 10), color=white, thickness=1, tipLength=0.3)
+        draw(cv2.putText, "Y", (center_x + 10, 25), cv2.FONT_HERSHEY_SIMPLEX, 0.5,
+             color=white, thickness=1)
+
+        # Vẽ vạch chia độ (mỗi 50 pixel)
+        for i in range(0, width, 50):
+            if i != center_x:
+                draw(cv2.line, (i, center_y - 3), (i, center_y + 3), color=white, thickness=1)
+        for i in range(0, height, 50):
+            if i != center_y:
+                draw(cv2.line, (center_x - 3, i), (center_x + 3, i), color=white, thickness=1)
+
+        # Gốc tọa độ (0,0)
+        draw(cv2.circle, (center_x, center_y), 3, color=white, thickness=-1)
+        draw(cv2.putText, "O", (center_x - 15, center_y + 20), cv2.FONT_HERSHEY_SIMPLEX, 0.4,
+             color=white, thickness=1)
+
+        self.pixel_idx = np.flatnonzero(mask)
+        self.pixel_val = layer.reshape(-1, 3)[self.pixel_idx]
+        self.key = (width, height, x_line_left, x_line_right, show_target_zone)
+
+
+def draw_detections(frame, harvest_frame, class_names, colors, show_coordinates=True, show_distance=True):
+    """Vẽ box, nhãn, tọa độ / khoảng cách của 1 HarvestFrame lên frame (in-place)
+
+    Box trong zone màu cam, target (quả ưu tiên cao nhất) thêm viền xanh lá đậm.
+    """
+    boxes = harvest_frame.detection.boxes
+    target = harvest_frame.target
+    for i in range(harvest_frame.total_objects):
+        x1, y1, x2, y2 = (int(v) for v in harvest_frame.xyxy[i])
+        conf = boxes.conf[i]
+        cls = int(boxes.cls[i])
+        track_id = int(boxes.track_ids[i]) if boxes.track_ids is not None else None
+        class_name = class_names.get(cls, 'Unknown')
+        center_x = int(harvest_frame.center_x[i])
+        center_y = int(harvest_frame.center_y[i])
+        in_zone = harvest_frame.in_zone[i]
+        distance = harvest_frame.distance[i]
+
+        color = colors.get(cls, (255, 255, 255))
+
+        if in_zone:
+            # Đổi màu box thành màu cam nếu trong zone
+            color = (0, 165, 255)  # Orange
+
+            # Nếu là target (ưu tiên cao nhất trong zone), vẽ viền đậm hơn
+            if i == target:
+                cv2.rectangle(frame, (x1, y1), (x2, y2), (0, 255, 0), 4)  # Viền xanh lá đậm
+                cv2.putText(frame, "NEXT TARGET", (x1, y1 - 30),
+                            cv2.FONT_HERSHEY_SIMPLEX, 0.7, (0, 255, 0), 2)
+
+        # Vẽ box với màu đã xác định
+        cv2.rectangle(frame, (x1, y1), (x2, y2), color, 2)
+
+        # Hiển thị class name, confidence và track ID
+        label = f"{class_name} {conf:.2f}"
+        if track_id is not None:
+            label += f" ID:{track_id}"
+        cv2.putText(frame, label, (x1, y1 - 10),
+                    cv2.FONT_HERSHEY_SIMPLEX, 0.6, color, 2)
+
+        if show_coordinates and distance > 0:
+            # Vẽ tọa độ bên dưới box (2 dòng)
+            coord_text1 = f"X:{harvest_frame.X[i]:+.1f} Y:{harvest_frame.Y[i]:+.1f}"
+            coord_text2 = f"Z:{harvest_frame.Z[i]:.1f}cm"
+
+            # Dòng 1: X, Y
+            cv2.putText(frame, coord_text1, (x1, y2 + 18),
+                        cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 255, 255), 2)
+            # Dòng 2: Z
+            cv2.putText(frame, coord_text2, (x1, y2 + 38),
+                        cv2.FONT_HERSHEY_SIMPLEX, 0.5, (255, 255, 0), 2)
+        elif show_distance and distance > 0:
+            # Chỉ hiển thị khoảng cách nếu không hiển thị tọa độ
+            distance_text = f"{distance:.1f}cm"
+            cv2.putText(frame, distance_text, (center_x - 30, y2 + 20),
+                        cv2.FONT_HERSHEY_SIMPLEX, 0.6, (255, 255, 0), 2)
+
+        # Vẽ dấu chấm màu đỏ ở giữa box
+        cv2.circle(frame, (center_x, center_y), 5, (0, 0, 255), -1)  # Chấm đỏ
+        cv2.circle(frame, (center_x, center_y), 6, (255, 255, 255), 1)  # Viền trắng
+
+        # Vẽ dấu * ở trên cùng box (giữa theo chiều ngang)
+        cv2.putText(frame, '*', (center_x - 8, y1 - 10),
+                    cv2.FONT_HERSHEY_SIMPLEX, 1.2, (0, 0, 255), 3)  # Dấu * màu đỏ
+        cv2.putText(frame, '*', (center_x - 8, y1 - 10),
+                    cv2.FONT_HERSHEY_SIMPLEX, 1.2, (255, 255, 255), 1)  # Viền trắng
+
+    # Hiển thị thông báo auto stop
+    if harvest_frame.auto_stopping:
+        cv2.putText(frame, "TARGET IN ZONE - STOPPED", (150, 50),
+                    cv2.FONT_HERSHEY_SIMPLEX, 1, (0, 0, 255), 3)
+    return frame
@@ -1,86 +1,57 @@
 import cv2
-from ultralytics import YOLO
 import time
 import numpy as np
+import threading
 import tkinter as tk
 from tkinter import ttk
-from PIL import Image, ImageTk
-import threading
-import serial
 import serial.tools.list_ports
-import json
-import os
+from harvest_engine import HarvestEngine
+import binary_protocol
+from esp32_simulator import SIM_PORT
+from overlay import StaticOverlay, draw_detections
+from display import FrameDisplay
 
 class StrawberryDetectorApp:
-    def __init__(self, root):
+    """Viewer Tk gắn vào HarvestEngine - chỉ hiển thị và chỉnh cài đặt
+
+    Toàn bộ detect / quyết định harvest / serial chạy trong engine, app này
+    chỉ vẽ kết quả mới nhất và chuyển thao tác của người dùng cho engine.
+    """
+    def __init__(self, root, engine):
         self.root = root
-        self.root.title("Strawberry Detection System - YOLOv8")
+        self.root.title(f"Strawberry Detection System - YOLOv8 ({engine.active_backend})")
         self.root.geometry("1200x700")
         self.root.configure(bg='#2b2b2b')
         
-        # Load model
-        self.model = YOLO('best.pt')
+        self.engine = engine
+        self.engine.scheduler.viewer_attached = True  # Idle vẫn detect chậm để xem hình
         
         # Class names và colors
-        self.class_names = {0: 'Ripe', 1: 'Unripe'}
+        self.class_names = engine.class_names
         self.colors = {
             0: (0, 255, 0),    # Ripe - xanh lá
             1: (0, 0, 255)     # Unripe - đỏ
         }
         
-        # Biến trạng thái
-        self.is_running = False
-        self.cap = None
-        self.current_camera = 0
-        self.conf_threshold = 0.5
-        self.iou_threshold = 0.45
-        self.brightness = 0
+        # Biến trạng thái hiển thị
+        self.last_frame_seq = 0  # Seq của HarvestFrame đã hiển thị gần nhất
         self.fps = 0
-        self.total_objects = 0
         self.frame_count = 0
-        
-        # Distance calculation parameters
-        self.show_distance = True
-        self.show_coordinates = True  # Hiển thị tọa độ 3D
-        self.focal_length = 615  # Focal length pixel (cần calibrate)
-        self.real_width = 3.0    # Chiều rộng thực của dâu tây (cm) - có thể điều chỉnh
-        self.calibration_distance = 30.0  # Khoảng cách calibration (cm)
-        self.flip_horizontal = True  # Flip camera horizontally (mirror mode)
-        self.image_width = 640   # Chiều rộng ảnh
-        self.image_height = 480  # Chiều cao ảnh
-        
-        # Object tracking
-        self.tracking_method = "bytetrack"  # Tracking method: "bytetrack", "deepsort", "none"
-        
-        # Serial communication
-        self.serial_port = None
-        self.serial_connected = False
+        self.current_frame = None    # Frame camera của kết quả đang hiển thị (read-only, copy khi save)
+        self.overlay_frame = None    # Buffer vẽ overlay, dùng lại mỗi frame
         self.serial_window = None
-        self.test_mode_active = False  # Test mode: gửi T# liên tục
-        self.test_thread = None
-        self.auto_stop_sent = False     # Đã gửi D# khi dâu vào zone
-        self.harvesting_in_progress = False  # Đang thực hiện harvest sequence
-        self.coord_send_time = 0        # Thời điểm gửi D# để delay 1s
-        self.coord_to_send = None       # Tọa độ từ detection (để hiển thị)
-        self.saved_coord_for_auto = None  # Tọa độ đã save từ input để gửi auto
-        self.last_debug_time = 0        # Thời điểm in debug lần cuối (throttle spam)
-        self.last_detected_coords = None  # Lưu tọa độ phát hiện cuối (X, Y, Z, class) cho test cut
-        
-        # Config file
-        self.config_file = "strawberry_config.txt"
-        
-        # Target zone lines (X coordinates - vertical lines)
-        self.x_line_left = 250     # Đường trái (pixel)
-        self.x_line_right = 390    # Đường phải (pixel)
-        self.show_target_zone = True
-        self.auto_stop_enabled = False  # Tự động dừng khi dâu vào vùng
-        
-        # Load config from file
-        self.load_config()
+        self.static_overlay = StaticOverlay()  # Zone + trục tọa độ, chỉ vẽ lại khi đổi zone
+        
+        # Nhận log / thay đổi trạng thái từ engine (từ thread khác → chuyển về Tk thread)
+        self.engine.add_listener(
+            lambda event, *data: self.root.after(0, lambda: self.on_engine_event(event, *data)))
         
         # Setup GUI
         self.setup_gui()
         
+        # Hiển thị video: 1 PhotoImage dùng suốt, buffer cấp phát sẵn
+        self.display = FrameDisplay(self.video_label, 800, 600)
+        
         # Update loop
         self.update_frame()
         
@@ -118,6 +89,10 @@ class StrawberryDetectorApp:
                                       font=('Arial', 10), bg='#1e1e1e', fg='#00ffff')
         self.objects_label.pack(side=tk.LEFT, padx=10)
         
+        self.camera_label = tk.Label(status_frame, text="Cam: 0.0 FPS | Dropped: 0", 
+                                     font=('Arial', 10), bg='#1e1e1e', fg='#888888')
+        self.camera_label.pack(side=tk.LEFT, padx=10)
+        
         # Right panel - Controls với Scrollbar
         right_container = tk.Frame(main_frame, bg='#1e1e1e', width=350)
         right_container.pack(side=tk.RIGHT, fill=tk.Y)
@@ -176,17 +151,17 @@ class StrawberryDetectorApp:
         # Confidence slider
         self.create_control_group(right_panel, "🎯 Confidence Threshold", 
                                  lambda p: self.create_slider(p, "Confidence:", 0, 100, 50, 
-                                                              lambda v: setattr(self, 'conf_threshold', float(v)/100)))
+                                                              lambda v: setattr(self.engine, 'conf_threshold', float(v)/100)))
         
         # IOU slider
         self.create_control_group(right_panel, "🔲 IOU Threshold", 
                                  lambda p: self.create_slider(p, "IOU:", 0, 100, 45, 
-                                                              lambda v: setattr(self, 'iou_threshold', float(v)/100)))
+                                                              lambda v: setattr(self.engine, 'iou_threshold', float(v)/100)))
         
         # Brightness slider
         self.create_control_group(right_panel, "💡 Brightness", 
                                  lambda p: self.create_slider(p, "Brightness:", 0, 200, 100, 
-                                                              lambda v: setattr(self, 'brightness', int(v)-100)))
+                                                              lambda v: setattr(self.engine, 'brightness', int(v)-100)))
         
         # Distance settings
         self.create_control_group(right_panel, "📏 Distance Settings", 
@@ -196,6 +171,10 @@ class StrawberryDetectorApp:
         self.create_control_group(right_panel, "🎯 Target Zone (X)", 
                                  self.create_target_zone_controls)
         
+        # Latency metrics
+        self.create_control_group(right_panel, "⏱ Latency (ms)", 
+                                 self.create_metrics_panel)
+        
         # Save button
         save_button = tk.Button(right_panel, text="💾 Save Current Frame", 
                                command=self.save_frame,
@@ -236,6 +215,14 @@ class StrawberryDetectorApp:
         frame.pack(pady=10, padx=20, fill=tk.X)
         content_creator(frame)
         
+    def create_metrics_panel(self, parent):
+        # Bảng p50/p95/p99 từng stage, cập nhật mỗi giây trong update_frame
+        self.metrics_label = tk.Label(parent, text="No data yet", 
+                                      font=('Courier', 8), bg='#1e1e1e', fg='#cccccc',
+                                      justify=tk.LEFT)
+        self.metrics_label.pack(pady=5, padx=10, anchor=tk.W)
+        self.last_metrics_update = 0
+        
     def create_camera_selector(self, parent):
         cam_frame = tk.Frame(parent, bg='#1e1e1e')
         cam_frame.pack(pady=10, padx=10, fill=tk.X)
@@ -257,7 +244,7 @@ class StrawberryDetectorApp:
         self.distance_var = tk.BooleanVar(value=True)
         distance_check = tk.Checkbutton(dist_frame, text="Show Distance", 
                                        variable=self.distance_var,
-                                       command=lambda: setattr(self, 'show_distance', self.distance_var.get()),
+                                       command=lambda: setattr(self.engine, 'show_distance', self.distance_var.get()),
                                        bg='#1e1e1e', fg='#cccccc', 
                                        selectcolor='#2b2b2b', font=('Arial', 9))
         distance_check.pack(anchor=tk.W, pady=5)
@@ -266,7 +253,7 @@ class StrawberryDetectorApp:
         self.flip_var = tk.BooleanVar(value=True)
         flip_check = tk.Checkbutton(dist_frame, text="🔄 Mirror Mode", 
                                    variable=self.flip_var,
-                                   command=lambda: setattr(self, 'flip_horizontal', self.flip_var.get()),
+                                   command=lambda: setattr(self.engine, 'flip_horizontal', self.flip_var.get()),
                                    bg='#1e1e1e', fg='#cccccc', 
                                    selectcolor='#2b2b2b', font=('Arial', 9))
         flip_check.pack(anchor=tk.W, pady=5)
@@ -275,7 +262,7 @@ class StrawberryDetectorApp:
         self.coord_var = tk.BooleanVar(value=True)
         coord_check = tk.Checkbutton(dist_frame, text="📍 Show Coordinates (X,Y,Z)", 
                                     variable=self.coord_var,
-                                    command=lambda: setattr(self, 'show_coordinates', self.coord_var.get()),
+                                    command=lambda: setattr(self.engine, 'show_coordinates', self.coord_var.get()),
                                     bg='#1e1e1e', fg='#cccccc', 
                                     selectcolor='#2b2b2b', font=('Arial', 9))
         coord_check.pack(anchor=tk.W, pady=5)
@@ -291,19 +278,25 @@ class StrawberryDetectorApp:
         
         tk.Radiobutton(track_frame, text="ByteTrack (Fast)", 
                       variable=self.tracking_var, value="bytetrack",
-                      command=lambda: setattr(self, 'tracking_method', 'bytetrack'),
+                      command=lambda: setattr(self.engine, 'tracking_method', 'bytetrack'),
                       bg='#1e1e1e', fg='#cccccc', selectcolor='#2b2b2b', 
                       font=('Arial', 9)).pack(anchor=tk.W)
         
         tk.Radiobutton(track_frame, text="DeepSORT (Accurate)", 
                       variable=self.tracking_var, value="deepsort",
-                      command=lambda: setattr(self, 'tracking_method', 'deepsort'),
+                      command=lambda: setattr(self.engine, 'tracking_method', 'deepsort'),
+                      bg='#1e1e1e', fg='#cccccc', selectcolor='#2b2b2b', 
+                      font=('Arial', 9)).pack(anchor=tk.W)
+        
+        tk.Radiobutton(track_frame, text="Centroid (Fastest)", 
+                      variable=self.tracking_var, value="centroid",
+                      command=lambda: setattr(self.engine, 'tracking_method', 'centroid'),
                       bg='#1e1e1e', fg='#cccccc', selectcolor='#2b2b2b', 
                       font=('Arial', 9)).pack(anchor=tk.W)
         
         tk.Radiobutton(track_frame, text="No Tracking", 
                       variable=self.tracking_var, value="none",
-                      command=lambda: setattr(self, 'tracking_method', 'none'),
+                      command=lambda: setattr(self.engine, 'tracking_method', 'none'),
                       bg='#1e1e1e', fg='#cccccc', selectcolor='#2b2b2b', 
                       font=('Arial', 9)).pack(anchor=tk.W)
         
@@ -315,7 +308,7 @@ class StrawberryDetectorApp:
         self.width_entry = tk.Entry(width_frame, width=8, bg='#2b2b2b', fg='#ffffff')
         self.width_entry.insert(0, "3.0")
         self.width_entry.pack(side=tk.LEFT, padx=5)
-        self.width_entry.bind('<Return>', lambda e: setattr(self, 'real_width', float(self.width_entry.get())))
+        self.width_entry.bind('<Return>', lambda e: setattr(self.engine, 'real_width', float(self.width_entry.get())))
         
         # Calibration button
         calib_button = tk.Button(dist_frame, text="📐 Calibrate", 
@@ -327,7 +320,7 @@ class StrawberryDetectorApp:
         
         # Calibration info
         self.calib_label = tk.Label(dist_frame, 
-                                   text=f"Focal: {self.focal_length:.0f}px",
+                                   text=f"Focal: {self.engine.focal_length:.0f}px",
                                    font=('Arial', 8), bg='#1e1e1e', fg='#ffaa00')
         self.calib_label.pack(pady=2)
     
@@ -339,7 +332,7 @@ class StrawberryDetectorApp:
         self.zone_var = tk.BooleanVar(value=True)
         zone_check = tk.Checkbutton(zone_frame, text="Show Target Zone", 
                                     variable=self.zone_var,
-                                    command=lambda: setattr(self, 'show_target_zone', self.zone_var.get()),
+                                    command=lambda: setattr(self.engine, 'show_target_zone', self.zone_var.get()),
                                     bg='#1e1e1e', fg='#cccccc', 
                                     selectcolor='#2b2b2b', font=('Arial', 9))
         zone_check.pack(anchor=tk.W, pady=5)
@@ -348,18 +341,27 @@ class StrawberryDetectorApp:
         self.auto_stop_var = tk.BooleanVar(value=False)
         auto_check = tk.Checkbutton(zone_frame, text="🚦 Auto Stop in Zone", 
                                    variable=self.auto_stop_var,
-                                   command=lambda: setattr(self, 'auto_stop_enabled', self.auto_stop_var.get()),
+                                   command=lambda: setattr(self.engine, 'auto_stop_enabled', self.auto_stop_var.get()),
                                    bg='#1e1e1e', fg='#cccccc', 
                                    selectcolor='#2b2b2b', font=('Arial', 9))
         auto_check.pack(anchor=tk.W, pady=5)
         
+        # Corridor mode: chỉ detect quanh target zone
+        self.corridor_var = tk.BooleanVar(value=self.engine.corridor_mode)
+        corridor_check = tk.Checkbutton(zone_frame, text="✂ Corridor Mode (detect zone only)", 
+                                       variable=self.corridor_var,
+                                       command=lambda: setattr(self.engine, 'corridor_mode', self.corridor_var.get()),
+                                       bg='#1e1e1e', fg='#cccccc', 
+                                       selectcolor='#2b2b2b', font=('Arial', 9))
+        corridor_check.pack(anchor=tk.W, pady=5)
+        
         # X Left line input
         left_frame = tk.Frame(zone_frame, bg='#1e1e1e')
         left_frame.pack(fill=tk.X, pady=5)
         tk.Label(left_frame, text="X Left (px):", font=('Arial', 8),
                 bg='#1e1e1e', fg='#cccccc').pack(side=tk.LEFT)
         self.x_left_entry = tk.Entry(left_frame, width=8, bg='#2b2b2b', fg='#ffffff')
-        self.x_left_entry.insert(0, str(self.x_line_left))
+        self.x_left_entry.insert(0, str(self.engine.x_line_left))
         self.x_left_entry.pack(side=tk.LEFT, padx=5)
         self.x_left_entry.bind('<Return>', lambda e: self.update_target_zone())
         
@@ -369,7 +371,7 @@ class StrawberryDetectorApp:
         tk.Label(right_frame, text="X Right (px):", font=('Arial', 8),
                 bg='#1e1e1e', fg='#cccccc').pack(side=tk.LEFT)
         self.x_right_entry = tk.Entry(right_frame, width=8, bg='#2b2b2b', fg='#ffffff')
-        self.x_right_entry.insert(0, str(self.x_line_right))
+        self.x_right_entry.insert(0, str(self.engine.x_line_right))
         self.x_right_entry.pack(side=tk.LEFT, padx=5)
         self.x_right_entry.bind('<Return>', lambda e: self.update_target_zone())
         
@@ -390,108 +392,36 @@ class StrawberryDetectorApp:
     def update_target_zone(self):
         """Update target zone lines từ entry"""
         try:
-            self.x_line_left = int(self.x_left_entry.get())
-            self.x_line_right = int(self.x_right_entry.get())
-            
-            # Validate
-            if self.x_line_left >= self.x_line_right:
-                print("Warning: X Left must be < X Right")
-                return
+            x_left = int(self.x_left_entry.get())
+            x_right = int(self.x_right_entry.get())
             
-            print(f"Target zone updated: X={self.x_line_left} to {self.x_line_right}")
-            
-            # Lưu tất cả config
-            self.save_all_config()
+            if self.engine.set_target_zone(x_left, x_right):
+                # Lưu tất cả config
+                self.save_all_config()
         except ValueError:
             print("Invalid input! Use numbers only.")
     
-    def save_config(self):
-        """Lưu config ra file txt (chỉ cơ bản, cho auto-save)"""
-        config = {
-            "real_width": self.real_width,
-            "focal_length": self.focal_length,
-            "x_line_left": self.x_line_left,
-            "x_line_right": self.x_line_right
-        }
-        try:
-            with open(self.config_file, 'w') as f:
-                json.dump(config, f, indent=4)
-            print(f"Config saved to {self.config_file}")
-        except Exception as e:
-            print(f"Error saving config: {e}")
-    
     def save_all_config(self):
         """Lưu tất cả cài đặt ra file txt"""
-        config = {
-            "real_width": self.real_width,
-            "focal_length": self.focal_length,
-            "x_line_left": self.x_line_left,
-            "x_line_right": self.x_line_right,
-            "conf_threshold": self.conf_threshold,
-            "iou_threshold": self.iou_threshold,
-            "brightness": self.brightness,
-            "show_distance": self.show_distance,
-            "show_coordinates": self.show_coordinates,
-            "flip_horizontal": self.flip_horizontal,
-            "tracking_method": self.tracking_method,
-            "show_target_zone": self.show_target_zone,
-            "auto_stop_enabled": self.auto_stop_enabled,
-            "current_camera": self.current_camera
-        }
-        try:
-            with open(self.config_file, 'w') as f:
-                json.dump(config, f, indent=4)
-            print(f"\n=== ALL CONFIG SAVED ===")
-            print(f"File: {self.config_file}")
-            print(f"  Detection: conf={self.conf_threshold:.2f}, iou={self.iou_threshold:.2f}")
-            print(f"  Brightness: {self.brightness}")
-            print(f"  Width: {self.real_width}cm, Focal: {self.focal_length}px")
-            print(f"  Zone: X={self.x_line_left} to {self.x_line_right}")
-            print(f"  Camera: {self.current_camera}")
-            print(f"========================\n")
-            
+        if self.engine.save_all_config():
             # Hiển thị thông báo trên GUI
-            if hasattr(self, 'status_label'):
-                self.status_label.config(text="✅ All config saved successfully!")
-                self.root.after(3000, lambda: self.status_label.config(text="Ready"))
-                
-        except Exception as e:
-            print(f"Error saving config: {e}")
+            self.status_label.config(text="✅ All config saved successfully!")
+            self.root.after(3000, lambda: self.status_label.config(text="Ready"))
     
-    def load_config(self):
-        """Đọc config từ file txt"""
-        if os.path.exists(self.config_file):
-            try:
-                with open(self.config_file, 'r') as f:
-                    config = json.load(f)
-                
-                # Load các giá trị cơ bản
-                self.real_width = config.get("real_width", 3.0)
-                self.focal_length = config.get("focal_length", 615)
-                self.x_line_left = config.get("x_line_left", 250)
-                self.x_line_right = config.get("x_line_right", 390)
-                
-                # Load các cài đặt khác (nếu có)
-                self.conf_threshold = config.get("conf_threshold", 0.5)
-                self.iou_threshold = config.get("iou_threshold", 0.45)
-                self.brightness = config.get("brightness", 0)
-                self.show_distance = config.get("show_distance", True)
-                self.show_coordinates = config.get("show_coordinates", True)
-                self.flip_horizontal = config.get("flip_horizontal", True)
-                self.tracking_method = config.get("tracking_method", "bytetrack")
-                self.show_target_zone = config.get("show_target_zone", True)
-                self.auto_stop_enabled = config.get("auto_stop_enabled", False)
-                self.current_camera = config.get("current_camera", 0)
-                
-                print(f"Config loaded from {self.config_file}")
-                print(f"  Width: {self.real_width}cm, Focal: {self.focal_length}px")
-                print(f"  Zone: X={self.x_line_left} to {self.x_line_right}")
-                print(f"  Detection: conf={self.conf_threshold:.2f}, iou={self.iou_threshold:.2f}")
-                print(f"  Brightness: {self.brightness}")
-            except Exception as e:
-                print(f"Error loading config: {e}")
-        else:
-            print("No config file found. Using default values.")
+    def on_engine_event(self, event, *data):
+        """Xử lý sự kiện từ engine (chạy trên Tk thread)"""
+        if event == "log":
+            self.log_message(*data)
+        elif event == "test_mode":
+            active = data[0]
+            if hasattr(self, 'start_test_btn') and self.start_test_btn.winfo_exists():
+                self.start_test_btn.config(state=tk.DISABLED if active else tk.NORMAL)
+                self.stop_test_btn.config(state=tk.NORMAL if active else tk.DISABLED)
+        elif event == "serial":
+            connected = data[0]
+            if hasattr(self, 'connect_btn') and self.connect_btn.winfo_exists():
+                self.connect_btn.config(state=tk.DISABLED if connected else tk.NORMAL)
+                self.disconnect_btn.config(state=tk.NORMAL if connected else tk.DISABLED)
     
     def open_serial_window(self):
         """Mở cửa sổ Serial Control"""
@@ -568,6 +498,22 @@ class StrawberryDetectorApp:
                                  width=12, state='readonly')
         baud_combo.pack(side=tk.LEFT, padx=5)
         
+        # Protocol (ASCII hoặc frame nhị phân)
+        tk.Label(baud_frame, text="Protocol:", font=('Arial', 10),
+                bg='#1e1e1e', fg='#cccccc').pack(side=tk.LEFT, padx=5)
+        
+        self.protocol_var = tk.StringVar(value=self.engine.serial_protocol)
+        protocol_combo = ttk.Combobox(baud_frame, textvariable=self.protocol_var,
+                                     values=list(binary_protocol.PROTOCOLS),
+                                     width=8, state='readonly')
+        protocol_combo.pack(side=tk.LEFT, padx=5)
+        
+        # ACK + gửi lại T#/D#/G (cần firmware ESP32 có ACK)
+        self.reliable_var = tk.BooleanVar(value=self.engine.reliable_delivery)
+        tk.Checkbutton(baud_frame, text="ACK", variable=self.reliable_var,
+                      bg='#1e1e1e', fg='#cccccc',
+                      selectcolor='#2b2b2b', font=('Arial', 10)).pack(side=tk.LEFT, padx=5)
+        
         # Connect/Disconnect buttons
         btn_frame = tk.Frame(conn_frame, bg='#1e1e1e')
         btn_frame.pack(pady=10, padx=10, fill=tk.X)
@@ -720,14 +666,14 @@ class StrawberryDetectorApp:
         self.refresh_ports()
         self.log_message("Serial window opened. Select COM port and click CONNECT.")
         
-        # Start reading thread nếu đã kết nối
-        if self.serial_connected:
-            self.start_serial_read_thread()
+        # Đồng bộ trạng thái nút với engine (thread đọc serial chạy trong engine)
+        self.on_engine_event("serial", self.engine.serial_connected)
+        self.on_engine_event("test_mode", self.engine.test_mode_active)
     
     def refresh_ports(self):
         """Refresh danh sách COM ports"""
         ports = serial.tools.list_ports.comports()
-        port_list = [port.device for port in ports]
+        port_list = [port.device for port in ports] + [SIM_PORT]  # SIM: ESP32 giả lập
         
         if hasattr(self, 'com_combo'):
             self.com_combo['values'] = port_list
@@ -742,92 +688,21 @@ class StrawberryDetectorApp:
         try:
             port = self.com_var.get()
             baud = int(self.baud_var.get())
-            
-            if not port:
-                self.log_message("[ERROR] Please select a COM port!", "red")
-                return
-            
-            self.serial_port = serial.Serial(port, baud, timeout=1)
-            self.serial_connected = True
-            
-            self.connect_btn.config(state=tk.DISABLED)
-            self.disconnect_btn.config(state=tk.NORMAL)
-            
-            self.log_message(f"[SUCCESS] Connected to {port} @ {baud} baud", "green")
-            
-            # Start reading thread
-            self.start_serial_read_thread()
-            
-        except Exception as e:
-            self.log_message(f"[ERROR] Connection failed: {str(e)}", "red")
-            self.serial_connected = False
+        except ValueError:
+            self.log_message("[ERROR] Invalid baudrate!", "red")
+            return
+        
+        self.engine.serial_protocol = self.protocol_var.get()
+        self.engine.reliable_delivery = self.reliable_var.get()
+        self.engine.connect_serial(port, baud)
     
     def disconnect_serial(self):
         """Ngắt kết nối Serial"""
-        try:
-            if self.serial_port and self.serial_port.is_open:
-                self.serial_port.close()
-            
-            self.serial_connected = False
-            self.serial_port = None
-            
-            self.connect_btn.config(state=tk.NORMAL)
-            self.disconnect_btn.config(state=tk.DISABLED)
-            
-            self.log_message("[INFO] Disconnected from serial port", "yellow")
-            
-        except Exception as e:
-            self.log_message(f"[ERROR] Disconnect failed: {str(e)}", "red")
+        self.engine.disconnect_serial()
     
     def send_command(self, cmd):
         """Gửi lệnh đến ESP32"""
-        if not self.serial_connected or not self.serial_port:
-            self.log_message("[ERROR] Not connected! Click CONNECT first.", "red")
-            return
-        
-        try:
-            self.serial_port.write(cmd.encode())
-            self.log_message(f"[SENT] {cmd}", "cyan")
-        except Exception as e:
-            self.log_message(f"[ERROR] Send failed: {str(e)}", "red")
-    
-    def start_serial_read_thread(self):
-        """Bắt đầu thread đọc dữ liệu từ ESP32"""
-        def read_serial():
-            while self.serial_connected and self.serial_port and self.serial_port.is_open:
-                try:
-                    if self.serial_port.in_waiting > 0:
-                        data = self.serial_port.readline().decode('utf-8', errors='ignore').strip()
-                        if data:
-                            # Kiểm tra emergency stop từ ESP32
-                            if data == "STOP":
-                                self.log_message("[ESP32] EMERGENCY STOP received!", "red")
-                                # Tự động dừng test mode
-                                if self.test_mode_active:
-                                    self.root.after(0, self.stop_test_mode)
-                            # Kiểm tra harvest complete từ ESP32
-                            elif data == "HARVEST_DONE#":
-                                self.log_message("✅ [HARVEST] COMPLETE! Strawberry harvested successfully!", "green")
-                                # Tự động tiếp tục test mode - reset cờ và gửi T# lại
-                                if self.test_mode_active:
-                                    self.log_message("[AUTO] Continuing to next strawberry...", "cyan")
-                                    self.harvesting_in_progress = False  # Reset trạng thái harvest
-                                    self.auto_stop_sent = False  # Reset để có thể dừng lại cho quả tiếp theo
-                                    # Gửi T# để tiếp tục di chuyển
-                                    try:
-                                        self.serial_port.write("T#".encode())
-                                        self.log_message("[AUTO] Sent T# - Moving to find next strawberry", "green")
-                                    except Exception as e:
-                                        self.log_message(f"[ERROR] Failed to continue: {str(e)}", "red")
-                            else:
-                                self.log_message(f"[ESP32] {data}", "white")
-                    time.sleep(0.05)
-                except Exception as e:
-                    self.log_message(f"[ERROR] Read error: {str(e)}", "red")
-                    break
-        
-        thread = threading.Thread(target=read_serial, daemon=True)
-        thread.start()
+        self.engine.send_command(cmd)
     
     def log_message(self, message, color="white"):
         """Thêm message vào debug log"""
@@ -852,191 +727,47 @@ class StrawberryDetectorApp:
             z_val = float(self.z_coord_entry.get())
             y_val = float(self.y_coord_entry.get())
             
-            self.saved_coord_for_auto = (z_val, y_val)
-            self.log_message(f"[SAVED] Auto-send coord: Z={z_val:.1f}, Y={y_val:.1f}", "green")
-            self.log_message("[INFO] This coord will be sent after D# + 1s in auto mode", "cyan")
+            self.engine.save_coord_for_auto(z_val, y_val)
             
         except ValueError:
             self.log_message("[ERROR] Invalid coordinate values!", "red")
     
     def send_manual_coord(self):
         """Gửi tọa độ thủ công từ input boxes"""
-        if not self.serial_connected or not self.serial_port:
-            self.log_message("[ERROR] Not connected! Click CONNECT first.", "red")
-            return
-        
         try:
             z_val = float(self.z_coord_entry.get())
             y_val = float(self.y_coord_entry.get())
             
-            coord_cmd = f"G{z_val:.1f},{y_val:.1f}#"
-            self.send_command(coord_cmd)
-            self.log_message(f"[MANUAL] Sent coordinates: {coord_cmd}", "cyan")
+            self.engine.send_manual_coord(z_val, y_val)
             
         except ValueError:
             self.log_message("[ERROR] Invalid coordinate values!", "red")
     
     def start_test_mode(self):
         """Bắt đầu test mode - gửi T# 1 lần duy nhất"""
-        if not self.serial_connected or not self.serial_port:
-            self.log_message("[ERROR] Not connected! Click CONNECT first.", "red")
-            return
-        
-        self.test_mode_active = True
-        self.auto_stop_sent = False  # Reset cờ
-        self.start_test_btn.config(state=tk.DISABLED)
-        self.stop_test_btn.config(state=tk.NORMAL)
-        
-        # Gửi lệnh T# 1 lần duy nhất
-        try:
-            self.serial_port.write("T#".encode())
-            self.log_message("[TEST MODE] Started - Continuous harvesting mode activated", "green")
-            self.log_message("[INFO] Robot will harvest all Ripe strawberries until STOP pressed", "cyan")
-        except Exception as e:
-            self.log_message(f"[ERROR] Failed to send T#: {str(e)}", "red")
-            self.test_mode_active = False
-            self.start_test_btn.config(state=tk.NORMAL)
-            self.stop_test_btn.config(state=tk.DISABLED)
+        self.engine.start_test_mode()
     
     def stop_test_mode(self):
         """Dừng test mode"""
-        self.test_mode_active = False
-        self.auto_stop_sent = False  # Reset cờ
-        self.start_test_btn.config(state=tk.NORMAL)
-        self.stop_test_btn.config(state=tk.DISABLED)
-        
-        self.log_message("[TEST MODE] Stopped - Continuous harvesting ended", "yellow")
-        
-        # Gửi lệnh dừng
-        if self.serial_port and self.serial_port.is_open:
-            self.send_command("D#")
+        self.engine.stop_test_mode()
     
     def test_cut_strawberry(self):
         """Test cắt dâu từ tọa độ phát hiện (không di chuyển bánh xe)"""
-        if not self.serial_connected or not self.serial_port:
-            self.log_message("[ERROR] Not connected! Click CONNECT first.", "red")
-            return
-        
-        if self.last_detected_coords is None:
-            self.log_message("[ERROR] No strawberry detected! Run camera first.", "red")
-            return
-        
-        X, Y, Z, cls = self.last_detected_coords
-        
-        # Kiểm tra chỉ cắt quả Ripe (class 0), bỏ qua Unripe (class 1)
-        if cls != 0:
-            class_name = self.class_names.get(cls, 'Unknown')
-            self.log_message(f"[SKIP] Berry is {class_name} - Only harvest Ripe strawberries", "yellow")
-            self.log_message(f"[INFO] Skipped berry at X={X:.1f}, Y={Y:.1f}, Z={Z:.1f}cm", "cyan")
-            
-            # Tự động tiếp tục nếu đang trong test mode
-            if self.test_mode_active:
-                self.harvesting_in_progress = False  # Reset trạng thái harvest
-                self.auto_stop_sent = False  # Reset để có thể dừng lại cho quả tiếp theo
-                self.coord_send_time = 0     # Reset để không gọi lại test_cut_strawberry
-                self.log_message("[AUTO] Continuing to find next Ripe strawberry...", "green")
-                try:
-                    self.serial_port.write("T#".encode())
-                    self.log_message("[AUTO] Sent T# - Moving forward", "cyan")
-                except Exception as e:
-                    self.log_message(f"[ERROR] Failed to continue: {str(e)}", "red")
-            return
-        # Chuyển đổi tọa độ camera → tool (tính từ vị trí mặc định Z=100mm, Y=10mm)
-        # Y_cam (cm) → Z_tool (mm): Y*10 + 100 (offset) + 100 (default) = Y*10 + 200
-        # Z_cam (cm) → Y_tool (mm): Z*10 - 20 (offset cắt)
-        Z_tool = int(Y * 10 + 195)  # Y của dâu → Z của tool (tuyệt đối)
-        Y_tool = int(Z * 10 - 40)   # Z của dâu → Y của tool (tuyệt đối)
-        
-        # Kiểm tra giới hạn tool (Z max: 150mm, Y max: 300mm)
-        if Z_tool > 150 or Z_tool < 0:
-            self.log_message(f"[WARNING] Z_tool={Z_tool}mm out of range [0-150mm] - SKIPPED", "red")
-            self.log_message(f"[SKIP] Berry at X={X:.1f}, Y={Y:.1f}, Z={Z:.1f}cm is unreachable", "yellow")
-            
-            # Tự động tiếp tục nếu đang trong test mode
-            if self.test_mode_active:
-                self.harvesting_in_progress = False  # Reset trạng thái harvest
-                self.auto_stop_sent = False  # Reset để có thể dừng lại cho quả tiếp theo
-                self.coord_send_time = 0     # Reset để không gọi lại test_cut_strawberry
-                self.log_message("[AUTO] Continuing to find reachable strawberry...", "green")
-                try:
-                    self.serial_port.write("T#".encode())
-                    self.log_message("[AUTO] Sent T# - Moving forward", "cyan")
-                except Exception as e:
-                    self.log_message(f"[ERROR] Failed to continue: {str(e)}", "red")
-            return
-        
-        if Y_tool > 300 or Y_tool < 0:
-            self.log_message(f"[WARNING] Y_tool={Y_tool}mm out of range [0-300mm] - SKIPPED", "red")
-            self.log_message(f"[SKIP] Berry at X={X:.1f}, Y={Y:.1f}, Z={Z:.1f}cm is unreachable", "yellow")
-            
-            # Tự động tiếp tục nếu đang trong test mode
-            if self.test_mode_active:
-                self.harvesting_in_progress = False  # Reset trạng thái harvest
-                self.auto_stop_sent = False  # Reset để có thể dừng lại cho quả tiếp theo
-                self.coord_send_time = 0     # Reset để không gọi lại test_cut_strawberry
-                self.log_message("[AUTO] Continuing to find reachable strawberry...", "green")
-                try:
-                    self.serial_port.write("T#".encode())
-                    self.log_message("[AUTO] Sent T# - Moving forward", "cyan")
-                except Exception as e:
-                    self.log_message(f"[ERROR] Failed to continue: {str(e)}", "red")
-            return
-        
-        # Tọa độ hợp lệ - gửi lệnh
-        coord_cmd = f"G{Z_tool},{Y_tool}#"
-        self.harvesting_in_progress = True  # Đánh dấu đang harvest
-        self.send_command(coord_cmd)
-        self.log_message(f"[TEST CUT] Berry coords: X={X:.1f}, Y={Y:.1f}, Z={Z:.1f}cm", "cyan")
-        self.log_message(f"[TEST CUT] Tool coords sent: Z={Z_tool}mm, Y={Y_tool}mm", "yellow")
-        self.log_message(f"[TEST CUT] Sequence: Move→Cut→Tray(Y=10)→Release→Wait(100,10)", "green")
+        self.engine.test_cut_strawberry()
     
     def calibrate_camera(self):
         """Calibrate focal length using current detected object"""
-        if hasattr(self, 'last_pixel_width') and self.last_pixel_width > 0:
-            # Formula: Focal_Length = (Pixel_Width * Distance) / Real_Width
-            self.real_width = float(self.width_entry.get())
-            self.focal_length = (self.last_pixel_width * self.calibration_distance) / self.real_width
-            self.calib_label.config(text=f"Focal: {self.focal_length:.0f}px")
-            print(f"Calibrated! Focal Length: {self.focal_length:.2f}px")
-            print(f"Place object at {self.calibration_distance}cm and click Calibrate")
+        try:
+            real_width = float(self.width_entry.get())
+        except ValueError:
+            print("Invalid object width!")
+            return
+        
+        if self.engine.calibrate(real_width):
+            self.calib_label.config(text=f"Focal: {self.engine.focal_length:.0f}px")
             
             # Lưu tất cả config
             self.save_all_config()
-        else:
-            print("No object detected for calibration!")
-    
-    def calculate_distance(self, pixel_width):
-        """Calculate distance using: Distance = (Real_Width * Focal_Length) / Pixel_Width"""
-        if pixel_width > 0 and self.focal_length > 0:
-            distance = (self.real_width * self.focal_length) / pixel_width
-            return distance
-        return 0
-    
-    def calculate_3d_coordinates(self, center_x, center_y, distance):
-        """Calculate 3D coordinates (X, Y, Z) in cm
-        - Z: depth (distance from camera)
-        - X: horizontal position (negative = left, positive = right)
-        - Y: vertical position (NEGATIVE = down, POSITIVE = up)
-        Origin is at camera center
-        """
-        if distance > 0 and self.focal_length > 0:
-            # Tâm ảnh
-            img_center_x = self.image_width / 2
-            img_center_y = self.image_height / 2
-            
-            # Tính offset từ tâm (pixel)
-            offset_x = center_x - img_center_x
-            offset_y = center_y - img_center_y
-            
-            # Chuyển đổi sang tọa độ thực (cm)
-            # Công thức: Real_Coordinate = (Pixel_Offset * Distance) / Focal_Length
-            X = (offset_x * distance) / self.focal_length
-            # ĐẢO DẤU Y: trong ảnh Y tăng khi đi xuống, nhưng thực tế Y dương là đi lên
-            Y = -(offset_y * distance) / self.focal_length
-            Z = distance
-            
-            return X, Y, Z
-        return 0, 0, 0
     
     def create_slider(self, parent, label, from_, to, default, command):
         slider_frame = tk.Frame(parent, bg='#1e1e1e')
@@ -1060,21 +791,18 @@ class StrawberryDetectorApp:
         return slider
         
     def toggle_detection(self):
-        self.is_running = not self.is_running
+        self.engine.is_running = not self.engine.is_running
         
-        if self.is_running:
+        if self.engine.is_running:
             self.start_button.config(text="⏸ STOP DETECTION", bg='#aa0000', activebackground='#ff0000')
             self.status_label.config(text="Status: Opening camera...", fg='#ffaa00')
             
             # Mở camera trong thread để không block UI
             def open_camera():
-                if self.cap is None or not self.cap.isOpened():
-                    self.cap = cv2.VideoCapture(self.current_camera)
-                    self.cap.set(cv2.CAP_PROP_FRAME_WIDTH, 640)
-                    self.cap.set(cv2.CAP_PROP_FRAME_HEIGHT, 480)
-                    # Đọc 1 frame để "warm up" camera
-                    self.cap.read()
-                self.root.after(0, lambda: self.status_label.config(text="Status: RUNNING", fg='#00ff00'))
+                if self.engine.open_camera():
+                    self.root.after(0, lambda: self.status_label.config(text="Status: RUNNING", fg='#00ff00'))
+                else:
+                    self.root.after(0, lambda: self.status_label.config(text="Status: CAMERA ERROR", fg='#ff4444'))
             
             threading.Thread(target=open_camera, daemon=True).start()
         else:
@@ -1084,386 +812,101 @@ class StrawberryDetectorApp:
     def on_camera_change(self, event=None):
         new_camera = int(self.camera_var.get())
         
-        if new_camera != self.current_camera:
-            if self.cap is not None:
-                self.cap.release()
+        if new_camera != self.engine.current_camera:
+            self.engine.close_camera()
+            self.engine.current_camera = new_camera
             
-            self.current_camera = new_camera
-            
-            if self.is_running:
-                self.cap = cv2.VideoCapture(self.current_camera)
-                self.cap.set(cv2.CAP_PROP_FRAME_WIDTH, 640)
-                self.cap.set(cv2.CAP_PROP_FRAME_HEIGHT, 480)
+            if self.engine.is_running:
+                self.engine.open_camera()
                 
     def save_frame(self):
         if hasattr(self, 'current_frame') and self.current_frame is not None:
             filename = f'capture_{self.frame_count}.jpg'
-            cv2.imwrite(filename, self.current_frame)
+            cv2.imwrite(filename, self.current_frame)  # Frame camera (không overlay)
             self.frame_count += 1
             print(f"Đã lưu ảnh: {filename}")
             
             # Hiển thị thông báo
             self.status_label.config(text=f"Saved: {filename}", fg='#ffff00')
             self.root.after(2000, lambda: self.status_label.config(
-                text="Status: RUNNING" if self.is_running else "Status: STOPPED",
-                fg='#00ff00' if self.is_running else '#ff4444'))
+                text="Status: RUNNING" if self.engine.is_running else "Status: STOPPED",
+                fg='#00ff00' if self.engine.is_running else '#ff4444'))
         
     def update_frame(self):
-        start_time = time.time()
-        
-        if self.is_running and self.cap is not None and self.cap.isOpened():
-            ret, frame = self.cap.read()
-            
-            if ret:
-                # Flip horizontal (mirror mode) nếu được bật
-                if self.flip_horizontal:
-                    frame = cv2.flip(frame, 1)
-                
-                # Điều chỉnh độ sáng
-                if self.brightness != 0:
-                    frame = cv2.convertScaleAbs(frame, alpha=1, beta=self.brightness)
-                
-                # Detect với tracking method đã chọn
-                if self.tracking_method == "bytetrack":
-                    results = self.model.track(frame, 
-                                             imgsz=640,
-                                             conf=self.conf_threshold,
-                                             iou=self.iou_threshold,
-                                             persist=True,  # Giữ track ID giữa các frame
-                                             tracker="bytetrack.yaml",  # ByteTrack tracker
-                                             verbose=False)
-                elif self.tracking_method == "deepsort":
-                    results = self.model.track(frame, 
-                                             imgsz=640,
-                                             conf=self.conf_threshold,
-                                             iou=self.iou_threshold,
-                                             persist=True,  # Giữ track ID giữa các frame
-                                             tracker="botsort.yaml",  # BotSORT (DeepSORT-based)
-                                             verbose=False)
-                else:  # tracking_method == "none"
-                    results = self.model.predict(frame, 
-                                               imgsz=640,
-                                               conf=self.conf_threshold, 
-                                               iou=self.iou_threshold, 
-                                               verbose=False)
-                
-                # Vẽ target zone lines nếu được bật
-                if self.show_target_zone:
-                    # Đường trái (xanh lá) - vertical line
-                    cv2.line(frame, (self.x_line_left, 0), (self.x_line_left, self.image_height), 
-                            (0, 255, 0), 2)
-                    cv2.putText(frame, f"X_LEFT: {self.x_line_left}", (self.x_line_left + 5, 30),
-                               cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 255, 0), 2)
-                    
-                    # Đường phải (vàng) - vertical line
-                    cv2.line(frame, (self.x_line_right, 0), (self.x_line_right, self.image_height), 
-                            (0, 255, 255), 2)
-                    cv2.putText(frame, f"X_RIGHT: {self.x_line_right}", (self.x_line_right - 100, 30),
-                               cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 255, 255), 2)
-                    
-                    # Vẽ vùng target (semi-transparent)
-                    overlay = frame.copy()
-                    cv2.rectangle(overlay, (self.x_line_left, 0), 
-                                (self.x_line_right, self.image_height), 
-                                (0, 255, 0), -1)
-                    cv2.addWeighted(overlay, 0.1, frame, 0.9, 0, frame)
-                
-                # Vẽ trục tọa độ X, Y (mảnh, màu trắng)
-                center_x = self.image_width // 2
-                center_y = self.image_height // 2
-                
-                # Trục X (ngang) - qua tâm
-                cv2.line(frame, (0, center_y), (self.image_width, center_y), (255, 255, 255), 1)
-                # Mũi tên X
-                cv2.arrowedLine(frame, (self.image_width - 30, center_y), 
-                              (self.image_width - 10, center_y), (255, 255, 255), 1, tipLength=0.3)
-                cv2.putText(frame, "X", (self.image_width - 25, center_y - 10),
-                           cv2.FONT_HERSHEY_SIMPLEX, 0.5, (255, 255, 255), 1)
-                
-                # Trục Y (dọc) - qua tâm
-                cv2.line(frame, (center_x, 0), (center_x, self.image_height), (255, 255, 255), 1)
-                # Mũi tên Y
-                cv2.arrowedLine(frame, (center_x, 30), (center_x, 10), (255, 255, 255), 1, tipLength=0.3)
-                cv2.putText(frame, "Y", (center_x + 10, 25),
-                           cv2.FONT_HERSHEY_SIMPLEX, 0.5, (255, 255, 255), 1)
+        if self.engine.camera_ready():
+            # Chỉ render kết quả mới nhất engine đã xử lý (YOLO + quyết định chạy ở thread khác)
+            harvest_frame = self.engine.get_latest_frame(self.last_frame_seq)
+            
+            # Tk đang chậm → chờ lượt sau (engine vẫn detect bình thường, chỉ bỏ frame hiển thị)
+            if harvest_frame is not None and self.display.ready():
+                if self.last_frame_seq > 0:
+                    self.display.dropped_frames += harvest_frame.seq - self.last_frame_seq - 1
+                self.last_frame_seq = harvest_frame.seq
+                # Kết quả read-only: vẽ trên buffer dùng lại (copyto, không cấp phát mỗi frame)
+                self.current_frame = harvest_frame.detection.frame
+                if self.overlay_frame is None or self.overlay_frame.shape != self.current_frame.shape:
+                    self.overlay_frame = np.empty_like(self.current_frame)
+                frame = self.overlay_frame
+                np.copyto(frame, self.current_frame)
                 
-                # Vẽ vạch chia độ (mỗi 50 pixel)
-                for i in range(0, self.image_width, 50):
-                    if i != center_x:
-                        cv2.line(frame, (i, center_y - 3), (i, center_y + 3), (255, 255, 255), 1)
-                for i in range(0, self.image_height, 50):
-                    if i != center_y:
-                        cv2.line(frame, (center_x - 3, i), (center_x + 3, i), (255, 255, 255), 1)
+                overlay_start = time.perf_counter()
                 
-                # Gốc tọa độ (0,0)
-                cv2.circle(frame, (center_x, center_y), 3, (255, 255, 255), -1)
-                cv2.putText(frame, "O", (center_x - 15, center_y + 20),
-                           cv2.FONT_HERSHEY_SIMPLEX, 0.4, (255, 255, 255), 1)
+                # Vẽ target zone, trục tọa độ, vạch chia (layer tĩnh đã cache)
+                self.static_overlay.apply(frame, self.engine.x_line_left, self.engine.x_line_right,
+                                          self.engine.show_target_zone)
                 
-                # Biến check xem có dâu trong zone không
-                target_in_zone = False
+                # Corridor mode: viền vùng crop đã detect (xám)
+                roi = harvest_frame.detection.roi
+                if roi is not None:
+                    cv2.rectangle(frame, (roi[0], 0), (roi[1] - 1, frame.shape[0] - 1), (128, 128, 128), 1)
                 
-                # Thu thập các đối tượng trong zone để sắp xếp theo ID
-                objects_in_zone = []
-                all_boxes_info = []  # Lưu thông tin tất cả các box để vẽ
+                # Vẽ tất cả các box, tọa độ và thông báo auto stop
+                draw_detections(frame, harvest_frame, self.class_names, self.colors,
+                                self.engine.show_coordinates, self.engine.show_distance)
                 
-                # Vẽ bounding boxes
-                for result in results:
-                    boxes = result.boxes
-                    
-                    for box in boxes:
-                        x1, y1, x2, y2 = box.xyxy[0].cpu().numpy()
-                        x1, y1, x2, y2 = int(x1), int(y1), int(x2), int(y2)
-                        
-                        conf = float(box.conf[0])
-                        cls = int(box.cls[0])
-                        
-                        # Lấy track ID nếu có
-                        track_id = None
-                        if hasattr(box, 'id') and box.id is not None:
-                            track_id = int(box.id[0])
-                        
-                        class_name = self.class_names.get(cls, 'Unknown')
-                        
-                        # Tính tâm của bounding box
-                        center_x = int((x1 + x2) / 2)
-                        center_y = int((y1 + y2) / 2)
-                        
-                        # Check xem tâm có nằm trong target zone không (theo trục X)
-                        in_zone = self.x_line_left <= center_x <= self.x_line_right
-                        
-                        # Lưu thông tin box
-                        box_info = {
-                            'x1': x1, 'y1': y1, 'x2': x2, 'y2': y2,
-                            'conf': conf, 'cls': cls, 'track_id': track_id,
-                            'class_name': class_name, 'center_x': center_x, 'center_y': center_y,
-                            'in_zone': in_zone
-                        }
-                        all_boxes_info.append(box_info)
-                        
-                        # Nếu trong zone và là Ripe (cls == 0), thêm vào danh sách ưu tiên
-                        if in_zone and cls == 0:
-                            target_in_zone = True
-                            objects_in_zone.append(box_info)
-                
-                # Sắp xếp các đối tượng trong zone theo vị trí Y (quả ở dưới trước - center_y lớn hơn)
-                if objects_in_zone:
-                    objects_in_zone.sort(key=lambda x: -x['center_y'])  # Sort giảm dần theo Y (dưới → trên)
-                    print(f"[PRIORITY] {len(objects_in_zone)} Ripe strawberry(ies) in zone! Processing bottom-to-top:")
-                    for i, obj in enumerate(objects_in_zone):
-                        priority_marker = "🎯 TARGET" if i == 0 else "⏳ QUEUED"
-                        print(f"  {priority_marker} ID:{obj['track_id']} center_y={obj['center_y']} (lower=first)")
-                    
-                    # Lưu tọa độ của quả có ID nhỏ nhất (ưu tiên cao nhất)
-                    target_obj = objects_in_zone[0]
-                else:
-                    # Không có quả Ripe trong zone - clear last_detected_coords để tránh xử lý tọa độ cũ
-                    if target_in_zone == False and self.last_detected_coords:
-                        print("[DEBUG] No Ripe strawberry in zone - Clearing old coordinates")
-                        # Không clear hoàn toàn, vì có thể quả đang ở ngoài zone
-                        # self.last_detected_coords = None
-                    
-                    # Nếu đang test mode và detect được object trong zone nhưng không phải Ripe
-                    # Kiểm tra xem có Unripe trong zone không
-                    unripe_in_zone = any(box['in_zone'] and box['cls'] != 0 for box in all_boxes_info)
-                    if unripe_in_zone and self.test_mode_active:
-                        print("[DEBUG] Unripe strawberry in zone - Skipping and continuing movement")
-                        # Đảm bảo xe không dừng lại
-                        if self.auto_stop_sent:
-                            self.auto_stop_sent = False
-                            print("[DEBUG] Reset auto_stop_sent to allow next detection")
-                
-                # Vẽ tất cả các box
-                for box_info in all_boxes_info:
-                    x1, y1, x2, y2 = box_info['x1'], box_info['y1'], box_info['x2'], box_info['y2']
-                    conf = box_info['conf']
-                    cls = box_info['cls']
-                    track_id = box_info['track_id']
-                    class_name = box_info['class_name']
-                    center_x = box_info['center_x']
-                    center_y = box_info['center_y']
-                    in_zone = box_info['in_zone']
-                    
-                    color = self.colors.get(cls, (255, 255, 255))
-                    
-                    if in_zone:
-                        # Đổi màu box thành màu cam nếu trong zone
-                        color = (0, 165, 255)  # Orange
-                        
-                        # Nếu là target (ID nhỏ nhất trong zone), vẽ viền đậm hơn
-                        if objects_in_zone and box_info == objects_in_zone[0]:
-                            cv2.rectangle(frame, (x1, y1), (x2, y2), (0, 255, 0), 4)  # Viền xanh lá đậm
-                            cv2.putText(frame, "NEXT TARGET", (x1, y1 - 30),
-                                      cv2.FONT_HERSHEY_SIMPLEX, 0.7, (0, 255, 0), 2)
-                    
-                    # Vẽ box với màu đã xác định
-                    # Vẽ box với màu đã xác định
-                    cv2.rectangle(frame, (x1, y1), (x2, y2), color, 2)
-                    
-                    # Hiển thị class name, confidence và track ID
-                    label = f"{class_name} {conf:.2f}"
-                    if track_id is not None:
-                        label += f" ID:{track_id}"
-                    cv2.putText(frame, label, (x1, y1 - 10),
-                              cv2.FONT_HERSHEY_SIMPLEX, 0.6, color, 2)
-                    
-                    # Tính khoảng cách và tọa độ 3D
-                    pixel_width = x2 - x1
-                    self.last_pixel_width = pixel_width  # Lưu để calibrate
-                    
-                    distance = self.calculate_distance(pixel_width)
-                    
-                    if self.show_coordinates and distance > 0:
-                        # Tính tọa độ 3D
-                        X, Y, Z = self.calculate_3d_coordinates(center_x, center_y, distance)
-                        
-                        # Chỉ lưu tọa độ của target (ID nhỏ nhất trong zone)
-                        if objects_in_zone and box_info == objects_in_zone[0]:
-                            self.last_detected_coords = (X, Y, Z, cls)
-                            print(f"[TARGET COORDS] Saved target ID:{track_id} -> X={X:.1f}, Y={Y:.1f}, Z={Z:.1f}, Class={class_name}")
-                        
-                        # Vẽ tọa độ bên dưới box (2 dòng)
-                        coord_text1 = f"X:{X:+.1f} Y:{Y:+.1f}"
-                        coord_text2 = f"Z:{Z:.1f}cm"
-                        
-                        # Dòng 1: X, Y
-                        cv2.putText(frame, coord_text1, (x1, y2 + 18),
-                                  cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 255, 255), 2)
-                        # Dòng 2: Z
-                        cv2.putText(frame, coord_text2, (x1, y2 + 38),
-                                  cv2.FONT_HERSHEY_SIMPLEX, 0.5, (255, 255, 0), 2)
-                    elif self.show_distance and distance > 0:
-                        # Chỉ hiển thị khoảng cách nếu không hiển thị tọa độ
-                        distance_text = f"{distance:.1f}cm"
-                        cv2.putText(frame, distance_text, (center_x - 30, y2 + 20),
-                                  cv2.FONT_HERSHEY_SIMPLEX, 0.6, (255, 255, 0), 2)
-                    
-                    # Vẽ dấu chấm màu đỏ ở giữa box
-                    cv2.circle(frame, (center_x, center_y), 5, (0, 0, 255), -1)  # Chấm đỏ
-                    cv2.circle(frame, (center_x, center_y), 6, (255, 255, 255), 1)  # Viền trắng
-                    
-                    # Vẽ dấu * ở trên cùng box (giữa theo chiều ngang)
-                    cv2.putText(frame, '*', (center_x - 8, y1 - 10), 
-                              cv2.FONT_HERSHEY_SIMPLEX, 1.2, (0, 0, 255), 3)  # Dấu * màu đỏ
-                    cv2.putText(frame, '*', (center_x - 8, y1 - 10), 
-                              cv2.FONT_HERSHEY_SIMPLEX, 1.2, (255, 255, 255), 1)  # Viền trắng
-                
-                # Auto stop nếu có dâu trong zone (chỉ trong test mode)
-                # Debug: In ra các điều kiện (1s/lần)
-                if target_in_zone:
-                    current_time = time.time()
-                    if current_time - self.last_debug_time >= 1.0:  # Chỉ in 1s 1 lần
-                        print(f"[DEBUG] Target in zone detected!")
-                        print(f"  auto_stop_enabled: {self.auto_stop_enabled}")
-                        print(f"  test_mode_active: {self.test_mode_active}")
-                        print(f"  auto_stop_sent: {self.auto_stop_sent}")
-                        print(f"  serial_connected: {self.serial_connected}")
-                        self.last_debug_time = current_time
-                
-                if self.auto_stop_enabled and target_in_zone and self.test_mode_active:
-                    if not self.auto_stop_sent and not self.harvesting_in_progress:  # Chỉ gửi 1 lần và không đang harvest
-                        if self.serial_connected and self.serial_port:
-                            print("[DEBUG] Sending D# command...")
-                            self.send_command("D#")  # Gửi lệnh dừng
-                            self.auto_stop_sent = True  # Đánh dấu đã gửi
-                            self.harvesting_in_progress = True  # Đánh dấu bắt đầu harvest sequence
-                            # KHÔNG TẮT test_mode_active - để tiếp tục thu hoạch sau HARVEST_DONE#
-                            self.log_message("[AUTO STOP] Target in zone - Sent D#", "yellow")
-                            
-                            # Lưu thời điểm để gọi test_cut_strawberry sau 1s
-                            self.coord_send_time = time.time()
-                            
-                            # Log: sẽ tự động gọi hàm cắt dâu sau 1s
-                            if self.last_detected_coords:
-                                X, Y, Z, cls = self.last_detected_coords
-                                class_name = self.class_names.get(cls, 'Unknown')
-                                print(f"[DEBUG] Will auto-cut strawberry after 1s: Berry coords X={X:.1f}, Y={Y:.1f}, Z={Z:.1f}cm, Class={class_name}")
-                            else:
-                                print("[DEBUG] No detected coordinates - will NOT auto-cut")
-                            
-                            print("[DEBUG] D# sent successfully!")
-                        else:
-                            print("[DEBUG] Serial not connected!")
-                    else:
-                        print("[DEBUG] D# already sent (auto_stop_sent=True)")
-                    
-                    # Hiển thị thông báo
-                    cv2.putText(frame, "TARGET IN ZONE - STOPPED", (150, 50),
-                               cv2.FONT_HERSHEY_SIMPLEX, 1, (0, 0, 255), 3)
-                elif self.test_mode_active and not target_in_zone:
-                    # Đang trong test mode nhưng KHÔNG có quả Ripe trong zone
-                    # Đảm bảo xe vẫn di chuyển (không bị dừng)
-                    if self.auto_stop_sent:
-                        # Nếu trước đó đã gửi D# (có quả Ripe) nhưng giờ không còn
-                        # Reset để xe tiếp tục đi
-                        print("[DEBUG] No Ripe in zone - Ensuring movement continues")
-                        self.auto_stop_sent = False
+                self.engine.metrics.record('overlay', time.perf_counter() - overlay_start)
                 
                 # Cập nhật thông tin
-                self.total_objects = len(results[0].boxes) if len(results) > 0 else 0
-                self.current_frame = frame.copy()
-                
-                # Kiểm tra xem đã đến lúc tự động cắt dâu chưa (sau 1s kể từ D#)
-                if self.coord_send_time > 0:
-                    if time.time() - self.coord_send_time >= 1.0:
-                        # Tự động gọi test_cut_strawberry() để cắt dâu
-                        if self.last_detected_coords:
-                            print("[AUTO CUT] 1s elapsed - Auto-cutting strawberry...")
-                            self.log_message("[AUTO CUT] Starting harvest sequence...", "green")
-                            self.test_cut_strawberry()
-                        else:
-                            print("[AUTO CUT] No coordinates detected - skipping")
-                            self.log_message("[AUTO CUT] No strawberry coords - skipped", "red")
-                        
-                        # Reset
-                        self.coord_send_time = 0
-                
-                # Tính FPS
-                self.fps = 1 / (time.time() - start_time)
-                self.fps_label.config(text=f"FPS: {self.fps:.1f}")
-                self.objects_label.config(text=f"Objects: {self.total_objects}")
+                # FPS của pipeline (camera → detect), không phải của Tk loop
+                self.fps = self.engine.detector.fps
+                scheduler = self.engine.scheduler
+                self.fps_label.config(text=f"FPS: {self.fps:.1f} | {scheduler.policy_name} "
+                                           f"{scheduler.duty_cycle:.0%}")
+                self.objects_label.config(text=f"Objects: {harvest_frame.total_objects}")
+                # close_camera (thread khác) có thể vừa đặt engine.cap = None - đọc 1 lần
+                cap = self.engine.cap
+                if cap is not None:
+                    cam_stats = cap.stats()
+                    self.camera_label.config(text=f"Cam: {cam_stats['capture_fps']:.1f} FPS | Dropped: {cam_stats['dropped']}"
+                                                  f" | Display dropped: {self.display.dropped_frames}")
                 
                 # Hiển thị frame
-                frame_rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-                img = Image.fromarray(frame_rgb)
-                img = img.resize((800, 600), Image.Resampling.LANCZOS)
-                imgtk = ImageTk.PhotoImage(image=img)
+                with self.engine.metrics.timer('display'):
+                    self.display.show(frame)
                 
-                self.video_label.imgtk = imgtk
-                self.video_label.configure(image=imgtk)
+                # Bảng latency (1 lần/giây)
+                now = time.monotonic()
+                if now - self.last_metrics_update >= 1.0:
+                    self.last_metrics_update = now
+                    self.metrics_label.config(text=self.engine.metrics.format_table())
         else:
             # Hiển thị màn hình đen khi dừng
-            blank = np.zeros((600, 800, 3), dtype=np.uint8)
-            cv2.putText(blank, "STOPPED - Click START to begin", (150, 300),
-                       cv2.FONT_HERSHEY_SIMPLEX, 1, (255, 255, 255), 2)
-            
-            img = Image.fromarray(blank)
-            imgtk = ImageTk.PhotoImage(image=img)
-            self.video_label.imgtk = imgtk
-            self.video_label.configure(image=imgtk)
+            self.display.show_blank("STOPPED - Click START to begin")
         
         # Lặp lại
         self.root.after(10, self.update_frame)
         
     def on_closing(self):
-        self.is_running = False
-        self.test_mode_active = False  # Dừng test mode
-        
-        if self.cap is not None:
-            self.cap.release()
-        
-        # Đóng serial port
-        if self.serial_port and self.serial_port.is_open:
-            self.serial_port.close()
-        
-        # Lưu config cuối cùng
-        self.save_config()
+        # Dừng engine, đóng camera/serial và lưu config
+        self.engine.shutdown()
         
         self.root.destroy()
 
 if __name__ == "__main__":
+    engine = HarvestEngine()
+    engine.start()
+    
     root = tk.Tk()
-    app = StrawberryDetectorApp(root)
+    app = StrawberryDetectorApp(root, engine)
     root.protocol("WM_DELETE_WINDOW", app.on_closing)
     root.mainloop()
-
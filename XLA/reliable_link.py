@@ -0,0 +1,210 @@
+import threading
+import time
+
+from command_queue import command_kind
+from metrics import RollingHistogram
+
+
+# Lệnh cần ESP32 xác nhận (lệnh bánh xe gửi định kỳ - mất 1 lệnh thì lệnh sau thay)
+RELIABLE_KINDS = ("D", "G", "T")
+# Lệnh chạy/dừng: lệnh mới nhất quyết định, lệnh cũ đang chờ ACK không gửi lại nữa
+DRIVE_KINDS = ("D", "T")
+
+
+class _Outstanding:
+    __slots__ = ('cmd', 'kind', 'seq', 'first_send', 'last_send', 'attempts')
+
+    def __init__(self, cmd, kind, seq, now):
+        self.cmd = cmd
+        self.kind = kind
+        self.seq = seq
+        self.first_send = now
+        self.last_send = now
+        self.attempts = 1
+
+
+class ReliableLink:
+    """Gửi lệnh có seq, chờ "ACK:<seq>" từ ESP32 và gửi lại nếu quá hạn
+
+    Dùng thay transport cho CommandQueue (cùng hàm send_command). ASCII gửi
+    "D@12#", binary dùng seq sẵn có trong frame; ESP32 trả "ACK:12" hoặc
+    frame ACK (BinaryLineParser đổi thành "ACK:12").
+    - Timeout tính theo RTT đo được (srtt + 4*rttvar, kiểu TCP), giới hạn trong
+      [min_timeout, max_timeout]; chưa có mẫu thì dùng ack_timeout.
+    - Gửi lại cùng seq tối đa max_retries lần và trong deadline giây, sau đó
+      bỏ và gọi on_failed(cmd, attempts). ESP32 chỉ ACK (không chạy lại) lệnh
+      trùng seq vừa thực hiện; T# đến sau T#/D# mới hơn bị trả "NAK:<seq>" →
+      bỏ và gọi on_rejected(cmd).
+    - Lệnh mới cùng loại thay lệnh cũ đang chờ ACK; T# và D# thay nhau.
+    - RTT chỉ lấy từ lệnh không phải gửi lại (Karn), ghi vào metrics 'serial_rtt'.
+    Mọi lệnh (kể cả lệnh không cần ACK - binary vẫn lấy seq) và lệnh gửi lại đều ghi
+    ra transport dưới send_lock; trước khi gửi lại kiểm tra lệnh vẫn còn chờ ACK -
+    T# cũ không bao giờ ra cổng sau D# đã thay nó.
+    """
+
+    def __init__(self, transport, ack_timeout=0.2, max_retries=3, deadline=1.0,
+                 min_timeout=0.02, max_timeout=1.0, metrics=None, on_failed=None, on_rejected=None,
+                 kinds=RELIABLE_KINDS):
+        self.transport = transport
+        self.ack_timeout = ack_timeout
+        self.max_retries = max_retries
+        self.deadline = deadline
+        self.min_timeout = min_timeout
+        self.max_timeout = max_timeout
+        self.metrics = metrics
+        self.on_failed = on_failed  # callback(cmd, attempts) khi hết lượt gửi lại
+        self.on_rejected = on_rejected  # callback(cmd) khi ESP32 trả NAK
+        self.kinds = kinds
+
+        self.send_lock = threading.Lock()  # Giữ từ lúc lấy seq tới lúc ghi xong (luôn lấy trước self.lock)
+        self.lock = threading.Lock()
+        self.changed = threading.Condition(self.lock)
+        self.outstanding = {}  # seq → _Outstanding
+        self.srtt = None
+        self.rttvar = 0.0
+
+        self.rtt = {}  # kind → RollingHistogram (ms)
+        self.acked_count = 0
+        self.retransmit_count = 0
+        self.failed_count = 0
+        self.rejected_count = 0
+
+        self.transport.subscribe(self._on_line)
+        self.running = True
+        self.thread = threading.Thread(target=self._retransmit_loop, daemon=True)
+        self.thread.start()
+
+    @property
+    def timeout(self):
+        """Thời gian chờ ACK hiện tại (giây)"""
+        if self.srtt is None:
+            return self.ack_timeout
+        return min(self.max_timeout, max(self.min_timeout, self.srtt + 4 * self.rttvar))
+
+    def send_command(self, cmd):
+        """Gửi lệnh, trả về seq nếu lệnh cần ACK"""
+        kind = command_kind(cmd)
+        with self.send_lock:
+            if kind not in self.kinds:
+                return self.transport.send_command(cmd)
+
+            seq = self.transport.next_seq()
+            with self.changed:
+                for other in list(self.outstanding.values()):
+                    if other.kind == kind or (kind in DRIVE_KINDS and other.kind in DRIVE_KINDS):
+                        del self.outstanding[other.seq]
+                self.outstanding[seq] = _Outstanding(cmd, kind, seq, time.monotonic())
+                self.changed.notify()
+            self.transport.send_command(cmd, seq=seq)
+        return seq
+
+    def pending_count(self):
+        with self.lock:
+            return len(self.outstanding)
+
+    def close(self):
+        with self.changed:
+            self.running = False
+            self.outstanding.clear()
+            self.changed.notify_all()
+        self.transport.unsubscribe(self._on_line)
+        if self.thread is not threading.current_thread():
+            self.thread.join(timeout=1.0)
+
+    def rtt_summary(self):
+        """{kind: summary} RTT gửi → ACK (ms)"""
+        with self.lock:
+            result = {}
+            for kind, hist in self.rtt.items():
+                summary = hist.summary()
+                if summary is not None:
+                    result[kind] = summary
+            return result
+
+    def stats(self):
+        return {"acked": self.acked_count, "retransmits": self.retransmit_count,
+                "failed": self.failed_count, "rejected": self.rejected_count,
+                "timeout_ms": self.timeout * 1000.0}
+
+    def _on_line(self, line, timestamp):
+        if not line.startswith(("ACK:", "NAK:")):
+            return
+        rejected = line.startswith("NAK:")
+        try:
+            seq = int(line[4:].strip())
+        except ValueError:
+            return
+
+        with self.changed:
+            pending = self.outstanding.pop(seq, None)
+            if pending is None:
+                return  # ACK trùng / lệnh đã bị thay
+            rtt = None
+            if rejected:
+                self.rejected_count += 1  # ESP32 đã chạy lệnh mới hơn, không gửi lại
+            else:
+                self.acked_count += 1
+            if not rejected and pending.attempts == 1:
+                rtt = max(0.0, timestamp - pending.first_send)
+                if self.srtt is None:
+                    self.srtt = rtt
+                    self.rttvar = rtt / 2
+                else:
+                    self.rttvar = 0.75 * self.rttvar + 0.25 * abs(self.srtt - rtt)
+                    self.srtt = 0.875 * self.srtt + 0.125 * rtt
+                hist = self.rtt.get(pending.kind)
+                if hist is None:
+                    hist = self.rtt[pending.kind] = RollingHistogram()
+                hist.add(rtt * 1000.0)
+            self.changed.notify()
+
+        if rejected and self.on_rejected is not None:
+            self.on_rejected(pending.cmd)
+        if rtt is not None and self.metrics is not None:
+            self.metrics.record('serial_rtt', rtt)
+
+    def _retransmit_loop(self):
+        while True:
+            resend = []
+            failed = []
+            with self.changed:
+                while self.running and not self.outstanding:
+                    self.changed.wait()
+                if not self.running:
+                    return
+
+                now = time.monotonic()
+                timeout = self.timeout
+                next_check = timeout
+                for pending in list(self.outstanding.values()):
+                    wait = pending.last_send + timeout - now
+                    if wait > 0:
+                        next_check = min(next_check, wait)
+                        continue
+                    if pending.attempts > self.max_retries or now - pending.first_send >= self.deadline:
+                        del self.outstanding[pending.seq]
+                        self.failed_count += 1
+                        failed.append(pending)
+                        continue
+                    pending.attempts += 1
+                    pending.last_send = now
+                    self.retransmit_count += 1
+                    resend.append(pending)
+
+                if not resend and not failed:
+                    self.changed.wait(next_check)
+                    continue
+
+            with self.send_lock:
+                for pending in resend:
+                    # Lệnh có thể vừa được ACK hoặc bị thay (D# thay T#) sau khi nhả lock
+                    with self.lock:
+                        if self.outstanding.get(pending.seq) is not pending:
+                            continue
+                    try:
+                        self.transport.send_command(pending.cmd, seq=pending.seq)
+                    except Exception as e:
+                        print(f"Retransmit {pending.cmd} failed: {e}")
+            for pending in failed:
+                if self.on_failed is not None:
+                    self.on_failed(pending.cmd, pending.attempts)
@@ -0,0 +1,408 @@
+import os
+import sys
+import time
+import argparse
+import heapq
+import difflib
+import itertools
+import contextlib
+from collections import namedtuple
+
+import numpy as np
+
+from harvest_engine import HarvestEngine
+from detector_worker import DetectionResult
+from box_geometry import BoxArrays
+from esp32_simulator import ESP32Simulator
+from session_recorder import SessionReader, REC_SERIAL_RX, REC_SERIAL_TX, REC_DETECTION, REC_STATE
+
+
+# Chạy lại 1 phiên đã ghi (.hvlog) qua đúng logic quyết định của HarvestEngine
+# (zone, ưu tiên, auto stop D#, delay 1s, test_cut_strawberry) với đồng hồ ảo,
+# nhanh hơn thời gian thật nhiều lần. Lệnh engine gửi được ghi lại để so với
+# lệnh thật trong phiên (regression test khi đổi ngưỡng / zone / calibrate).
+
+SentCommand = namedtuple('SentCommand', ['t', 'cmd'])
+
+# Sự kiện replay, cùng thời điểm thì xử lý theo thứ tự này
+EVENT_STATE = 0      # Trạng thái đã ghi (test mode bật/tắt, kết nối serial)
+EVENT_RX = 1         # Dòng ESP32 gửi lên
+EVENT_DETECTION = 2  # Kết quả detect của 1 frame
+
+
+def event_order(event):
+    return event[0], event[1]
+
+
+# Nguồn phản hồi của ESP32 khi replay
+RESPONSES = ("recorded", "sim", "none")
+
+
+class VirtualClock:
+    """Đồng hồ ảo gán vào engine.clock - chỉ tiến khi replay chuyển sang sự kiện kế tiếp"""
+
+    def __init__(self, start=0.0):
+        self.now = start
+
+    def __call__(self):
+        return self.now
+
+    def advance(self, t):
+        self.now = max(self.now, t)
+
+
+class ReplayQueue:
+    """Thay CommandQueue khi replay: ghi lại lệnh kèm thời gian ảo thay vì ghi ra cổng
+
+    device: ESP32Simulator nhận lệnh (responses="sim"), None = chỉ ghi lại.
+    """
+
+    def __init__(self, clock, device=None):
+        self.clock = clock
+        self.device = device
+        self.sent = []
+
+    def submit(self, cmd, priority=None, on_sent=None):
+        now = self.clock()
+        self.sent.append(SentCommand(now, cmd))
+        if self.device is not None:
+            self.device.receive(cmd.encode('utf-8'))
+        if on_sent is not None:
+            on_sent(now)
+        return True
+
+    def pending_count(self):
+        return 0
+
+    def close(self, flush_timeout=None):
+        pass
+
+
+def detection_from_record(record, conf_threshold=None):
+    """REC_DETECTION → DetectionResult (không có ảnh), lọc lại theo conf_threshold nếu có
+
+    Box đã ghi đã qua ngưỡng conf của phiên gốc nên chỉ tăng được ngưỡng, không giảm.
+    """
+    data = record.data
+    table = data['boxes']
+    if conf_threshold is not None:
+        table = table[table['conf'] >= conf_threshold]
+    track_ids = table['track_id'].astype(int)
+    if len(track_ids) == 0 or (track_ids < 0).all():
+        track_ids = None
+    boxes = BoxArrays(np.ascontiguousarray(table['xyxy'], dtype=np.float32),
+                      table['conf'].astype(np.float32),
+                      table['cls'].astype(int),
+                      track_ids)
+    return DetectionResult(data['seq'], data['capture_seq'], None, boxes, data['capture_time'],
+                           data['inference_time'], record.t, None)
+
+
+def load_session(path):
+    """Đọc .hvlog → (events, commands gốc, t_start)
+
+    events: list (t, loại, data) cho replay đã sắp theo event_order,
+    commands: SentCommand đã ghi ra cổng.
+    """
+    events = []
+    commands = []
+    with SessionReader(path) as reader:
+        t_start = reader.chunks[0].t_first if reader.chunks else reader.mono_start
+        for record in reader.records(types={REC_SERIAL_RX, REC_SERIAL_TX, REC_DETECTION, REC_STATE}):
+            if record.type == REC_SERIAL_TX:
+                commands.append(SentCommand(record.t, record.data))
+            elif record.type == REC_SERIAL_RX:
+                events.append((record.t, EVENT_RX, record.data))
+            elif record.type == REC_STATE:
+                events.append((record.t, EVENT_STATE, record.data))
+            else:
+                events.append((record.t, EVENT_DETECTION, record))
+    events.sort(key=event_order)
+    commands.sort(key=lambda c: c.t)
+    return events, commands, t_start
+
+
+def video_events(engine, path, start=0.0, fps=None):
+    """Detect lại từng frame của video bằng model của engine, thời gian ảo = start + i / fps"""
+    import cv2
+
+    cap = cv2.VideoCapture(path)
+    if not cap.isOpened():
+        raise IOError(f"Cannot open video {path}")
+    fps = fps or cap.get(cv2.CAP_PROP_FPS) or 30.0
+    index = 0
+    try:
+        while True:
+            ok, frame = cap.read()
+            if not ok:
+                break
+            t = start + index / fps
+            frame = engine.detector.preprocess(frame)
+            begin = time.perf_counter()
+            boxes, roi = engine.detector.detect(frame)
+            inference_time = time.perf_counter() - begin
+            index += 1
+            yield t, EVENT_DETECTION, DetectionResult(index, index, frame, boxes, t, inference_time, t, roi)
+    finally:
+        cap.release()
+
+
+class SessionReplay:
+    """Đẩy sự kiện đã ghi qua HarvestEngine theo thứ tự thời gian, với đồng hồ ảo
+
+    - Detection → process_detection (đồng hồ ảo = lúc có kết quả trong phiên gốc),
+      nên delay 1s sau D# và throttle debug giống hệt dù replay nhanh bao nhiêu.
+    - responses="recorded": dòng ESP32 (HARVEST_DONE#, STOP) phát lại đúng lúc đã ghi.
+      "sim": ESP32Simulator chạy theo đồng hồ ảo trả lời lệnh của replay (dùng khi
+      đổi ngưỡng làm thời điểm cắt khác phiên gốc). "none": không có phản hồi.
+    - Trạng thái đã ghi: bật/tắt test mode (người vận hành) và kết nối serial.
+    - speed > 0: giữ nhịp speed × thời gian thật, 0 = nhanh nhất có thể.
+    """
+
+    def __init__(self, engine, responses="recorded", speed=0.0, sim_options=None, verbose=False):
+        if responses not in RESPONSES:
+            raise ValueError(f"responses must be one of {RESPONSES}")
+        self.engine = engine
+        self.responses = responses
+        self.speed = speed
+        self.verbose = verbose
+
+        self.clock = VirtualClock()
+        engine.clock = self.clock
+        self.simulator = None
+        self.sim_port = None
+        if responses == "sim":
+            self.simulator = ESP32Simulator(clock=self.clock, verbose=False, **(sim_options or {}))
+            self.sim_port = self.simulator.serial()
+        self.queue = ReplayQueue(self.clock, self.simulator)
+        engine.command_queue = self.queue
+        engine.serial_connected = True
+        engine.add_listener(self._on_event)
+
+        self.logs = []
+        self.frames = 0
+        self.target_frames = 0
+        self.t_start = None
+        self.duration = 0.0
+        self.wall_time = 0.0
+
+    @property
+    def commands(self):
+        return self.queue.sent
+
+    def _on_event(self, event, *data):
+        if event == "log":
+            message = data[0]
+            self.logs.append((self.clock(), message))
+            if self.verbose:
+                print(f"[{self.clock() - (self.t_start or 0.0):9.3f}] {message}")
+
+    def run(self, events, start_test_mode=False):
+        """Chạy hết events (t, loại, data) đã sắp theo event_order, trả về list SentCommand
+        engine đã gửi. events có thể là iterator (video_events detect từng frame khi tới lượt)"""
+        events = iter(events)
+        first = next(events, None)
+        if first is None:
+            return self.commands
+        self.t_start = first[0]
+        self.clock.now = self.t_start
+        if start_test_mode:
+            self.engine.start_test_mode()
+
+        # Engine in rất nhiều dòng debug mỗi frame - bỏ đi trừ khi verbose
+        devnull = None if self.verbose else open(os.devnull, 'w')
+        wall_start = time.perf_counter()
+        try:
+            with contextlib.redirect_stdout(devnull) if devnull else contextlib.nullcontext():
+                for t, kind, data in itertools.chain((first,), events):
+                    self._advance_simulator(t)
+                    self.clock.advance(t)
+                    if self.speed > 0:
+                        delay = (t - self.t_start) / self.speed - (time.perf_counter() - wall_start)
+                        if delay > 0:
+                            time.sleep(delay)
+                    self._dispatch(kind, data)
+                    self._drain_simulator()
+        finally:
+            if devnull is not None:
+                devnull.close()
+            if self.simulator is not None:
+                self.simulator.close()
+        self.wall_time = time.perf_counter() - wall_start
+        self.duration = self.clock() - self.t_start
+        return self.commands
+
+    def _dispatch(self, kind, data):
+        engine = self.engine
+        if kind == EVENT_DETECTION:
+            harvest_frame = engine.process_detection(data)
+            self.frames += 1
+            if harvest_frame.target >= 0:
+                self.target_frames += 1
+        elif kind == EVENT_RX:
+            if self.responses == "recorded":
+                engine.handle_serial_line(data)
+        elif kind == EVENT_STATE:
+            self.apply_state(data)
+
+    def apply_state(self, state):
+        """Thao tác của người vận hành trong phiên gốc: kết nối serial, bật/tắt test mode
+
+        Cờ harvesting / auto_stop_sent do engine tự tính lại nên không áp dụng.
+        """
+        engine = self.engine
+        engine.serial_connected = bool(state.get("serial_connected", engine.serial_connected))
+        test_mode = state.get("test_mode", engine.test_mode_active)
+        if test_mode and not engine.test_mode_active:
+            engine.start_test_mode()
+        elif not test_mode and engine.test_mode_active:
+            engine.stop_test_mode()
+
+    def _advance_simulator(self, t):
+        """Chạy state machine của simulator tới thời điểm t (từng mốc một)"""
+        if self.simulator is None:
+            return
+        while True:
+            deadline = self.simulator.next_deadline()
+            if deadline is None or deadline > t:
+                return
+            self.clock.advance(deadline)
+            self.simulator.poll()
+            self._drain_simulator()
+
+    def _drain_simulator(self):
+        if self.sim_port is None or not self.sim_port.in_waiting:
+            return
+        data = self.sim_port.read(self.sim_port.in_waiting)
+        for line in data.decode('utf-8', errors='replace').splitlines():
+            line = line.strip()
+            if line:
+                self.engine.handle_serial_line(line)
+
+    def throughput(self):
+        """(frame/s, số lần nhanh hơn thời gian thật)"""
+        wall = max(self.wall_time, 1e-9)
+        return self.frames / wall, self.duration / wall
+
+
+def diff_commands(recorded, replayed, t0=0.0):
+    """So 2 chuỗi lệnh: (các dòng khác nhau kiểu diff, độ lệch thời gian của lệnh khớp)
+
+    So theo nội dung lệnh (thứ tự), thời gian chỉ để hiển thị - lệch vài chục ms
+    do thread engine/queue của phiên gốc không tính là khác.
+    """
+    matcher = difflib.SequenceMatcher(a=[c.cmd for c in recorded], b=[c.cmd for c in replayed],
+                                      autojunk=False)
+    lines = []
+    offsets = []
+    for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+        if tag == 'equal':
+            offsets.extend(replayed[j].t - recorded[i].t for i, j in zip(range(i1, i2), range(j1, j2)))
+            continue
+        lines.extend(f"- {c.t - t0:10.3f}  {c.cmd}" for c in recorded[i1:i2])
+        lines.extend(f"+ {c.t - t0:10.3f}  {c.cmd}" for c in replayed[j1:j2])
+    return lines, offsets
+
+
+def write_commands(path, commands, t0=0.0):
+    with open(path, 'w') as f:
+        for command in commands:
+            f.write(f"{command.t - t0:.3f}\t{command.cmd}\n")
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Replay a recorded session (.hvlog) through the harvest decision logic on a virtual clock")
+    parser.add_argument("session", nargs="?", default=None,
+                        help="Session log (.hvlog): detections, ESP32 replies, operator state, sent commands")
+    parser.add_argument("--video", default=None,
+                        help="Re-run detection on a video instead of the recorded detections (needs --weights)")
+    parser.add_argument("--video-fps", type=float, default=None, help="Video frame rate (default: from file)")
+    parser.add_argument("--weights", default="best.pt", help="YOLO weights file (only used with --video)")
+    parser.add_argument("--config", default="strawberry_config.txt", help="Config file (JSON)")
+    parser.add_argument("--conf", type=float, default=None,
+                        help="Confidence threshold (recorded detections can only be filtered upwards)")
+    parser.add_argument("--zone", type=int, nargs=2, default=None, metavar=("LEFT", "RIGHT"),
+                        help="Override the target zone lines (pixel)")
+    parser.add_argument("--auto-stop", action="store_true", help="Enable auto stop (D#) when a Ripe berry enters the zone")
+    parser.add_argument("--test-mode", action="store_true", help="Start test mode at the beginning of the replay")
+    parser.add_argument("--responses", default=None, choices=RESPONSES,
+                        help="ESP32 replies: recorded lines, the simulator on the virtual clock, or none "
+                             "(default: recorded if the session has any)")
+    parser.add_argument("--sim-move-time", type=float, default=None,
+                        help="Fixed Nano_1 move duration for --responses sim (default: from stepper speed)")
+    parser.add_argument("--speed", type=float, default=0.0,
+                        help="Pace the replay at N x real time (default: as fast as possible)")
+    parser.add_argument("--output", default=None, help="Write the replayed command stream (t<TAB>cmd) to a file")
+    parser.add_argument("--verbose", action="store_true", help="Print engine debug output and log messages")
+    args = parser.parse_args()
+
+    if args.session is None and args.video is None:
+        parser.error("need a session log and/or --video")
+
+    events, recorded, t_start = [], [], 0.0
+    if args.session:
+        events, recorded, t_start = load_session(args.session)
+
+    engine = HarvestEngine(weights=args.weights if args.video else None, config_file=args.config)
+    if args.conf is not None:
+        engine.conf_threshold = args.conf
+    if args.zone and not engine.set_target_zone(*args.zone):
+        return 1
+    if args.auto_stop:
+        engine.auto_stop_enabled = True
+
+    responses = args.responses
+    if responses is None:
+        responses = "recorded" if any(kind == EVENT_RX for _, kind, _ in events) else "sim"
+
+    if args.video:
+        # Detection chạy lại trên video, chỉ giữ phản hồi ESP32 / trạng thái của phiên.
+        # Ghép lười theo thời gian: mỗi frame được đọc + detect khi tới lượt rồi bỏ,
+        # không giữ cả video đã decode trong RAM
+        events = [e for e in events if e[1] != EVENT_DETECTION]
+        events = heapq.merge(events, video_events(engine, args.video, t_start, args.video_fps),
+                             key=event_order)
+    else:
+        conf = args.conf
+        events = [(t, kind, detection_from_record(data, conf) if kind == EVENT_DETECTION else data)
+                  for t, kind, data in events]
+    replay = SessionReplay(engine, responses=responses, speed=args.speed,
+                           sim_options={"move_time": args.sim_move_time}, verbose=args.verbose)
+    replayed = replay.run(events, start_test_mode=args.test_mode)
+    t0 = replay.t_start if replay.t_start is not None else t_start
+
+    fps, ratio = replay.throughput()
+    print(f"Replayed {replay.frames} frames ({replay.duration:.1f}s of session) in {replay.wall_time:.2f}s: "
+          f"{fps:.0f} frames/s, {ratio:.0f}x real time (ESP32 replies: {responses})")
+    print(f"Frames with a target in zone: {replay.target_frames}")
+    print(f"Commands: replay {len(replayed)}, recorded {len(recorded)}")
+
+    if args.output:
+        write_commands(args.output, replayed, t0)
+        print(f"Command stream written to {args.output}")
+
+    if not args.session:
+        for command in replayed:
+            print(f"  {command.t - t0:10.3f}  {command.cmd}")
+        return 0
+
+    lines, offsets = diff_commands(recorded, replayed, t0)
+    if offsets:
+        worst = max(offsets, key=abs)
+        print(f"Matched {len(offsets)} commands, timing offset max {worst * 1000:+.0f}ms, "
+              f"mean {np.mean(offsets) * 1000:+.0f}ms")
+    if not lines:
+        print("Command stream identical to the recording")
+        return 0
+    print(f"{len(lines)} differing commands (- recorded, + replay):")
+    for line in lines:
+        print(line)
+    if responses == "recorded":
+        print("Note: ESP32 replies were replayed as recorded - once decisions differ, "
+              "--responses sim gives replies that follow the replayed commands")
+    return 2
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,89 @@
+import time
+import threading
+from collections import namedtuple
+
+
+# Chính sách detect theo trạng thái robot
+# max_fps: 0 = không giới hạn, None = tạm dừng detect
+SchedulePolicy = namedtuple('SchedulePolicy', ['name', 'max_fps', 'imgsz_scale'])
+
+
+class DetectionScheduler:
+    """Điều chỉnh tốc độ / độ phân giải detect theo trạng thái thu hoạch
+
+    - moving:     robot đang chạy (test mode T#) → full rate, full imgsz
+    - settling:   vừa gửi D#, chờ tọa độ hội tụ → full rate (cần frame mới nhất)
+    - cutting:    đã gửi tọa độ, chờ HARVEST_DONE# → cảnh đứng yên, detect thưa + imgsz nhỏ
+    - idle:       đã kết nối ESP32 nhưng robot đứng yên → dừng detect
+    - preview:    idle nhưng có viewer đang xem → detect chậm để vẫn thấy hình
+    - standalone: chưa kết nối serial (chỉ detect) → full rate
+
+    duty_cycle: tỉ lệ thời gian detector thực sự chạy model (đo theo cửa sổ ~1s).
+    """
+
+    POLICY_STANDALONE = SchedulePolicy('standalone', 0, 1.0)
+    POLICY_MOVING = SchedulePolicy('moving', 0, 1.0)
+    POLICY_SETTLING = SchedulePolicy('settling', 0, 1.0)
+
+    def __init__(self, settings, window=1.0):
+        self.settings = settings
+        self.window = window
+        self.viewer_attached = False
+
+        self.policy = self.POLICY_STANDALONE
+        self.last_start = 0.0
+
+        self.lock = threading.Lock()
+        self.busy_time = 0.0
+        self.window_start = time.monotonic()
+        self.duty_cycle = 0.0
+
+    @property
+    def policy_name(self):
+        return self.policy.name
+
+    def select_policy(self):
+        """Chọn policy từ trạng thái hiện tại của engine"""
+        settings = self.settings
+        if not settings.adaptive_schedule or not settings.serial_connected:
+            return self.POLICY_STANDALONE
+        if settings.harvesting_in_progress:
+            if settings.coord_send_time > 0:
+                return self.POLICY_SETTLING
+            return SchedulePolicy('cutting', settings.cutting_max_fps, settings.cutting_imgsz_scale)
+        if settings.test_mode_active:
+            return self.POLICY_MOVING
+        if self.viewer_attached:
+            return SchedulePolicy('preview', settings.idle_preview_fps, 1.0)
+        return SchedulePolicy('idle', None, 1.0)
+
+    def ready(self):
+        """True nếu được chạy detect ngay bây giờ (cập nhật policy)"""
+        now = time.monotonic()
+        self.policy = self.select_policy()
+        self._roll(now)
+
+        max_fps = self.policy.max_fps
+        if max_fps is None:
+            return False
+        if max_fps > 0 and now - self.last_start < 1.0 / max_fps:
+            return False
+        return True
+
+    def begin(self):
+        self.last_start = time.monotonic()
+
+    def record(self, busy):
+        """Cộng thời gian chạy model (s) vào cửa sổ đo duty cycle"""
+        now = time.monotonic()
+        with self.lock:
+            self.busy_time += busy
+        self._roll(now)
+
+    def _roll(self, now):
+        with self.lock:
+            elapsed = now - self.window_start
+            if elapsed >= self.window:
+                self.duty_cycle = min(self.busy_time / elapsed, 1.0)
+                self.busy_time = 0.0
+                self.window_start = now
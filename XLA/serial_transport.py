@@ -0,0 +1,188 @@
+import time
+import threading
+
+import serial
+
+
+# Gửi ngay khi mở cổng: ESP32 xóa lịch sử seq của phiên trước (seq lại bắt đầu từ 1)
+SEQ_RESET_COMMAND = "R#"
+
+
+def tag_command(cmd, seq):
+    """Gắn seq vào lệnh ASCII để ESP32 trả "ACK:<seq>": "D#" → "D@12#"."""
+    return f"{cmd.strip().rstrip('#')}@{seq}#"
+
+
+class LineParser:
+    """Ghép byte nhận được thành từng dòng (tách theo '\\n', bỏ '\\r')
+
+    Dữ liệu serial đến theo từng mẩu bất kỳ, phần chưa đủ dòng được giữ lại
+    cho lần feed sau. Dòng quá dài (nhiễu, sai baud) bị cắt để không tràn bộ nhớ.
+    """
+
+    def __init__(self, terminator=b'\n', max_line=1024, encoding='utf-8'):
+        self.terminator = terminator
+        self.max_line = max_line
+        self.encoding = encoding
+        self.buffer = bytearray()
+
+    def feed(self, data):
+        """Thêm bytes, trả về list các dòng hoàn chỉnh (str, đã strip)"""
+        self.buffer.extend(data)
+        lines = []
+        while True:
+            index = self.buffer.find(self.terminator)
+            if index < 0:
+                break
+            raw = bytes(self.buffer[:index])
+            del self.buffer[:index + len(self.terminator)]
+            line = raw.decode(self.encoding, errors='ignore').strip()
+            if line:
+                lines.append(line)
+
+        if len(self.buffer) > self.max_line:
+            self.buffer.clear()
+        return lines
+
+    def reset(self):
+        self.buffer.clear()
+
+
+class SerialTransport:
+    """Serial dùng chung cho các app: thread đọc blocking + phát dòng cho subscriber
+
+    Thread đọc gọi ser.read() có timeout nên thức dậy ngay khi có byte mới
+    (không poll in_waiting + sleep). Mỗi dòng được gửi tới tất cả subscriber
+    kèm thời điểm nhận (time.monotonic). Callback chạy trên thread đọc - GUI
+    cần tự chuyển về main thread (root.after).
+
+    ser: có thể truyền sẵn object kiểu serial.Serial (read/write/close/is_open)
+    thay cho port, ví dụ cổng giả lập.
+    parser/encoder: đổi giao thức (xem binary_protocol.protocol_options).
+    """
+
+    def __init__(self, port=None, baudrate=115200, ser=None, read_timeout=0.1, parser=None, encoder=None):
+        self.port = port
+        self.baudrate = baudrate
+        self.ser = ser
+        self.read_timeout = read_timeout
+        self.parser = parser or LineParser()
+        self.encoder = encoder  # callable(cmd, seq) → bytes, None = gửi ASCII nguyên văn
+        self.tx_seq = 0
+
+        self.subscribers = []
+        self.error_handlers = []
+        self.write_lock = threading.Lock()
+        self.thread = None
+        self.running = False
+
+        self.rx_lines = 0
+        self.tx_bytes = 0
+
+    @property
+    def is_open(self):
+        return self.ser is not None and self.ser.is_open
+
+    def open(self):
+        """Mở cổng (nếu chưa có ser) và chạy thread đọc"""
+        if self.ser is None:
+            self.ser = serial.Serial(self.port, self.baudrate, timeout=self.read_timeout)
+        self.start()
+        return self
+
+    def subscribe(self, callback):
+        """callback(line, timestamp) được gọi cho mỗi dòng nhận được"""
+        self.subscribers.append(callback)
+
+    def unsubscribe(self, callback):
+        if callback in self.subscribers:
+            self.subscribers.remove(callback)
+
+    def on_error(self, callback):
+        """callback(exception) khi thread đọc gặp lỗi và dừng"""
+        self.error_handlers.append(callback)
+
+    def start(self):
+        if self.running:
+            return
+        self.running = True
+        self.parser.reset()
+        self.thread = threading.Thread(target=self._read_loop, daemon=True)
+        self.thread.start()
+
+    def write(self, data):
+        """Ghi str/bytes ra cổng (thread-safe), trả về số byte đã ghi"""
+        if isinstance(data, str):
+            data = data.encode('utf-8')
+        with self.write_lock:
+            written = self.ser.write(data)
+        self.tx_bytes += len(data)
+        return written
+
+    def next_seq(self):
+        """Seq tiếp theo (0-255, quay vòng)"""
+        self.tx_seq = (self.tx_seq + 1) & 0xFF
+        return self.tx_seq
+
+    def send_command(self, cmd, seq=None):
+        """Gửi 1 lệnh ("T#", "G195,-40#"...) theo giao thức của transport
+
+        Có encoder thì gửi frame nhị phân và trả về seq của frame; lệnh không
+        mã hóa được (hoặc chế độ ASCII) thì gửi text nguyên văn, trả về None.
+        seq: gửi lại với seq cho trước (retransmit); ở chế độ ASCII lệnh được
+        gắn thêm "@seq" (tag_command) để ESP32 xác nhận.
+        """
+        if self.encoder is not None:
+            frame_seq = self.next_seq() if seq is None else seq
+            frame = self.encoder(cmd, frame_seq)
+            if frame is not None:
+                self.write(frame)
+                return frame_seq
+        if seq is not None:
+            self.write(tag_command(cmd, seq))
+            return seq
+        self.write(cmd)
+        return None
+
+    def close(self):
+        self.running = False
+        ser = self.ser
+        if ser is not None:
+            # Đánh thức read() đang block (pyserial có cancel_read trên Win/POSIX)
+            cancel_read = getattr(ser, 'cancel_read', None)
+            if cancel_read is not None:
+                try:
+                    cancel_read()
+                except Exception:
+                    pass
+        if self.thread is not None and self.thread is not threading.current_thread():
+            self.thread.join(timeout=max(1.0, self.read_timeout * 5))
+        self.thread = None
+        if ser is not None and ser.is_open:
+            ser.close()
+
+    def _read_loop(self):
+        while self.running:
+            try:
+                # Block tới khi có ít nhất 1 byte hoặc hết timeout, rồi lấy hết phần đang chờ
+                data = self.ser.read(max(1, self.ser.in_waiting))
+            except Exception as e:
+                if self.running:
+                    self.running = False
+                    for handler in list(self.error_handlers):
+                        handler(e)
+                break
+
+            if not data:
+                continue
+            timestamp = time.monotonic()
+            for line in self.parser.feed(data):
+                self.rx_lines += 1
+                self.dispatch(line, timestamp)
+
+    def dispatch(self, line, timestamp):
+        for callback in list(self.subscribers):
+            try:
+                callback(line, timestamp)
+            except Exception as e:
+                print(f"Serial subscriber error: {e}")
@@ -0,0 +1,380 @@
+import os
+import json
+import time
+import zlib
+import queue
+import bisect
+import itertools
+import struct
+import argparse
+import threading
+from collections import namedtuple
+
+import numpy as np
+
+
+# File log phiên chạy (.hvlog), chỉ ghi nối thêm:
+#   [FILE HEADER] ([CHUNK] ... [INDEX]) ... [INDEX] [FOOTER]
+# CHUNK: header cố định + nhiều record (zlib nếu nhỏ hơn), INDEX: vị trí + khoảng
+# thời gian của các chunk trước đó (trỏ về INDEX trước), FOOTER: vị trí INDEX cuối.
+# File bị ngắt giữa chừng (mất điện) vẫn đọc được bằng cách quét header các chunk.
+FILE_MAGIC = b"HVLOG01\n"
+FILE_HEADER = struct.Struct('<8sHHdd')     # magic, version, flags, wall_start, mono_start
+CHUNK_HEADER = struct.Struct('<4sIIIdd')   # b"CHNK", raw_len, stored_len, n_records, t_first, t_last
+INDEX_HEADER = struct.Struct('<4sIQ')      # b"INDX", số entry, offset INDEX trước (0 = không có)
+INDEX_ENTRY = struct.Struct('<QddI')       # offset chunk, t_first, t_last, n_records
+FOOTER = struct.Struct('<4sQ')             # b"HEND", offset INDEX cuối
+RECORD_HEADER = struct.Struct('<dHHI')     # t (monotonic), type, flags, payload length
+VERSION = 1
+FLAG_COMPRESSED = 0x1
+
+# Loại record
+REC_SERIAL_RX = 1    # Dòng nhận từ ESP32 (utf-8)
+REC_SERIAL_TX = 2    # Lệnh đã ghi ra cổng (utf-8)
+REC_DETECTION = 3    # DETECTION_HEADER + N × BOX_DTYPE
+REC_STATE = 4        # Trạng thái harvest (JSON)
+REC_LOG = 5          # log_message (utf-8)
+
+RECORD_NAMES = {REC_SERIAL_RX: "rx", REC_SERIAL_TX: "tx", REC_DETECTION: "detection",
+                REC_STATE: "state", REC_LOG: "log"}
+
+# seq, capture_seq, capture_time, inference_time, target, target_in_zone
+DETECTION_HEADER = struct.Struct('<IIdfhBx')
+# Mỗi box 1 record cố định 40 byte
+BOX_DTYPE = np.dtype([('xyxy', '<f4', 4), ('conf', '<f4'), ('cls', '<i4'),
+                      ('track_id', '<i4'), ('X', '<f4'), ('Y', '<f4'), ('Z', '<f4')])
+
+Record = namedtuple('Record', ['t', 'type', 'data'])
+ChunkInfo = namedtuple('ChunkInfo', ['offset', 't_first', 't_last', 'n_records'])
+
+
+def pack_detection(harvest_frame):
+    """HarvestFrame → payload REC_DETECTION"""
+    detection = harvest_frame.detection
+    boxes = detection.boxes
+    n = len(boxes.conf)
+    table = np.zeros(n, dtype=BOX_DTYPE)
+    if n:
+        table['xyxy'] = boxes.xyxy
+        table['conf'] = boxes.conf
+        table['cls'] = boxes.cls
+        table['track_id'] = boxes.track_ids if boxes.track_ids is not None else -1
+        table['X'] = harvest_frame.X
+        table['Y'] = harvest_frame.Y
+        table['Z'] = harvest_frame.Z
+    header = DETECTION_HEADER.pack(detection.seq & 0xFFFFFFFF, detection.capture_seq & 0xFFFFFFFF,
+                                   detection.capture_time, detection.inference_time,
+                                   int(harvest_frame.target), bool(harvest_frame.target_in_zone))
+    return header + table.tobytes()
+
+
+def unpack_detection(payload):
+    seq, capture_seq, capture_time, inference_time, target, in_zone = DETECTION_HEADER.unpack_from(payload)
+    boxes = np.frombuffer(payload, dtype=BOX_DTYPE, offset=DETECTION_HEADER.size)
+    return {"seq": seq, "capture_seq": capture_seq, "capture_time": capture_time,
+            "inference_time": inference_time, "target": target, "target_in_zone": bool(in_zone),
+            "boxes": boxes}
+
+
+def decode_payload(rec_type, payload):
+    if rec_type == REC_DETECTION:
+        return unpack_detection(payload)
+    if rec_type == REC_STATE:
+        return json.loads(payload)
+    return payload.decode('utf-8', errors='replace')
+
+
+class SessionRecorder:
+    """Ghi mọi dòng serial, lệnh gửi, kết quả detect và trạng thái harvest ra .hvlog
+
+    record() chỉ đưa (t, type, data) vào hàng đợi - đóng gói, nén và ghi file
+    chạy trên thread riêng nên không ảnh hưởng latency vòng detect/serial.
+    Hàng đợi đầy (đĩa quá chậm) thì bỏ record và đếm vào self.dropped.
+    Chunk được ghi khi đủ chunk_size byte hoặc sau flush_interval giây; mỗi
+    index_every chunk ghi 1 block INDEX.
+    """
+
+    def __init__(self, path, compress=True, chunk_size=64 * 1024, flush_interval=1.0,
+                 index_every=16, max_queue=20000):
+        self.path = path
+        self.compress = compress
+        self.chunk_size = chunk_size
+        self.flush_interval = flush_interval
+        self.index_every = index_every
+        self.queue = queue.Queue(maxsize=max_queue)
+        self.dropped = 0
+        self.records = 0
+        self.bytes_written = 0
+        self.thread = None
+        self.file = None
+
+    def start(self):
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.file = open(self.path, 'wb')
+        flags = FLAG_COMPRESSED if self.compress else 0
+        self._write(FILE_HEADER.pack(FILE_MAGIC, VERSION, flags, time.time(), time.monotonic()))
+        self.thread = threading.Thread(target=self._write_loop, daemon=True)
+        self.thread.start()
+        return self
+
+    def record(self, rec_type, data, t=None):
+        """data: str / bytes / dict (REC_STATE); t mặc định = time.monotonic()"""
+        try:
+            self.queue.put_nowait((time.monotonic() if t is None else t, rec_type, data))
+        except queue.Full:
+            self.dropped += 1
+
+    def record_detection(self, harvest_frame):
+        # Đóng gói trên thread ghi (HarvestFrame bất biến)
+        self.record(REC_DETECTION, harvest_frame, harvest_frame.detection.done_time)
+
+    def close(self):
+        if self.thread is None:
+            return
+        self.queue.put(None)
+        self.thread.join(timeout=5.0)
+        self.thread = None
+
+    def _write(self, data):
+        self.file.write(data)
+        self.bytes_written += len(data)
+
+    def _pack(self, rec_type, data):
+        if rec_type == REC_DETECTION and not isinstance(data, (bytes, bytearray)):
+            return pack_detection(data)
+        if rec_type == REC_STATE and isinstance(data, dict):
+            return json.dumps(data).encode('utf-8')
+        if isinstance(data, str):
+            return data.encode('utf-8')
+        return bytes(data)
+
+    def _write_loop(self):
+        buffer = bytearray()
+        n_records = 0
+        t_first = t_last = 0.0
+        chunk_start = time.monotonic()
+        pending_index = []
+        last_index = 0
+        closing = False
+
+        while not closing:
+            try:
+                item = self.queue.get(timeout=self.flush_interval)
+            except queue.Empty:
+                item = ()
+            if item is None:
+                closing = True
+            elif item:
+                t, rec_type, data = item
+                try:
+                    payload = self._pack(rec_type, data)
+                except Exception as e:
+                    print(f"Recorder: cannot pack record {rec_type}: {e}")
+                    continue
+                if n_records == 0:
+                    t_first = t_last = t
+                    chunk_start = time.monotonic()
+                t_first = min(t_first, t)
+                t_last = max(t_last, t)
+                buffer += RECORD_HEADER.pack(t, rec_type, 0, len(payload))
+                buffer += payload
+                n_records += 1
+                self.records += 1
+
+            full = len(buffer) >= self.chunk_size
+            stale = n_records and time.monotonic() - chunk_start >= self.flush_interval
+            if n_records and (full or stale or closing):
+                pending_index.append(self._write_chunk(buffer, n_records, t_first, t_last))
+                buffer = bytearray()
+                n_records = 0
+                if len(pending_index) >= self.index_every:
+                    last_index = self._write_index(pending_index, last_index)
+                    pending_index = []
+                self.file.flush()
+
+        if pending_index:
+            last_index = self._write_index(pending_index, last_index)
+        self._write(FOOTER.pack(b"HEND", last_index))
+        self.file.close()
+
+    def _write_chunk(self, raw, n_records, t_first, t_last):
+        offset = self.file.tell()
+        body = bytes(raw)
+        if self.compress:
+            packed = zlib.compress(body, 1)
+            if len(packed) < len(body):
+                body = packed
+        self._write(CHUNK_HEADER.pack(b"CHNK", len(raw), len(body), n_records, t_first, t_last))
+        self._write(body)
+        return ChunkInfo(offset, t_first, t_last, n_records)
+
+    def _write_index(self, entries, previous):
+        offset = self.file.tell()
+        self._write(INDEX_HEADER.pack(b"INDX", len(entries), previous))
+        for entry in entries:
+            self._write(INDEX_ENTRY.pack(*entry))
+        return offset
+
+
+class SessionReader:
+    """Đọc file .hvlog: danh sách chunk (từ INDEX hoặc quét header), tìm theo thời gian"""
+
+    def __init__(self, path):
+        self.path = path
+        self.file = open(path, 'rb')
+        magic, self.version, self.flags, self.wall_start, self.mono_start = \
+            FILE_HEADER.unpack(self.file.read(FILE_HEADER.size))
+        if magic != FILE_MAGIC:
+            raise ValueError(f"{path} is not a session log")
+        self.complete = False
+        self.chunks = self._load_index() or self._scan_chunks()
+        self.chunks.sort(key=lambda c: c.t_first)
+        # t_last lớn nhất tính tới mỗi chunk (record từ nhiều thread có thể lệch thứ tự chút)
+        self._t_last = list(itertools.accumulate((c.t_last for c in self.chunks), max))
+
+    def close(self):
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    @property
+    def duration(self):
+        if not self.chunks:
+            return 0.0
+        return self.chunks[-1].t_last - self.chunks[0].t_first
+
+    def to_wall(self, t):
+        """Thời điểm monotonic trong log → time.time()"""
+        return self.wall_start + (t - self.mono_start)
+
+    def _load_index(self):
+        size = os.fstat(self.file.fileno()).st_size
+        if size < FILE_HEADER.size + FOOTER.size:
+            return None
+        self.file.seek(size - FOOTER.size)
+        magic, offset = FOOTER.unpack(self.file.read(FOOTER.size))
+        if magic != b"HEND":
+            return None
+        self.complete = True
+        chunks = []
+        while offset:
+            self.file.seek(offset)
+            _, count, offset = INDEX_HEADER.unpack(self.file.read(INDEX_HEADER.size))
+            data = self.file.read(INDEX_ENTRY.size * count)
+            chunks.extend(ChunkInfo(*entry) for entry in INDEX_ENTRY.iter_unpack(data))
+        return chunks
+
+    def _scan_chunks(self):
+        """File chưa đóng đúng cách: đi qua header từng block (không giải nén)"""
+        chunks = []
+        offset = FILE_HEADER.size
+        self.file.seek(offset)
+        while True:
+            head = self.file.read(4)
+            if head == b"CHNK":
+                rest = self.file.read(CHUNK_HEADER.size - 4)
+                if len(rest) < CHUNK_HEADER.size - 4:
+                    break
+                _, raw_len, stored_len, n_records, t_first, t_last = CHUNK_HEADER.unpack(head + rest)
+                end = offset + CHUNK_HEADER.size + stored_len
+                if end > os.fstat(self.file.fileno()).st_size:
+                    break  # Chunk cuối ghi dở
+                chunks.append(ChunkInfo(offset, t_first, t_last, n_records))
+            elif head == b"INDX":
+                rest = self.file.read(INDEX_HEADER.size - 4)
+                if len(rest) < INDEX_HEADER.size - 4:
+                    break
+                _, count, _ = INDEX_HEADER.unpack(head + rest)
+                end = offset + INDEX_HEADER.size + count * INDEX_ENTRY.size
+            else:
+                break
+            offset = end
+            self.file.seek(offset)
+        return chunks
+
+    def read_chunk(self, chunk):
+        """List Record của 1 chunk"""
+        self.file.seek(chunk.offset)
+        _, raw_len, stored_len, n_records, _, _ = CHUNK_HEADER.unpack(self.file.read(CHUNK_HEADER.size))
+        body = self.file.read(stored_len)
+        if stored_len < raw_len:
+            body = zlib.decompress(body)
+        records = []
+        pos = 0
+        for _ in range(n_records):
+            t, rec_type, _, length = RECORD_HEADER.unpack_from(body, pos)
+            pos += RECORD_HEADER.size
+            records.append(Record(t, rec_type, body[pos:pos + length]))
+            pos += length
+        return records
+
+    def records(self, start=None, end=None, types=None, decode=True):
+        """Generator Record trong [start, end] (monotonic), chỉ đọc các chunk liên quan"""
+        first = 0 if start is None else bisect.bisect_left(self._t_last, start)
+        for chunk in self.chunks[first:]:
+            if end is not None and chunk.t_first > end:
+                break
+            for record in self.read_chunk(chunk):
+                if start is not None and record.t < start:
+                    continue
+                if end is not None and record.t > end:
+                    continue
+                if types is not None and record.type not in types:
+                    continue
+                if decode:
+                    record = record._replace(data=decode_payload(record.type, record.data))
+                yield record
+
+
+def format_record(record, t0):
+    name = RECORD_NAMES.get(record.type, str(record.type))
+    if record.type == REC_DETECTION:
+        data = record.data
+        text = (f"#{data['seq']} {len(data['boxes'])} boxes, target={data['target']}, "
+                f"in_zone={data['target_in_zone']}, inference={data['inference_time'] * 1000:.1f}ms")
+    else:
+        text = record.data
+    return f"{record.t - t0:10.3f}  {name:<9} {text}"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Inspect a harvest session log (.hvlog)")
+    parser.add_argument("command", choices=("info", "dump"))
+    parser.add_argument("file")
+    parser.add_argument("--from", dest="start", type=float, default=None, help="Seconds from session start")
+    parser.add_argument("--to", dest="end", type=float, default=None, help="Seconds from session start")
+    parser.add_argument("--type", default=None, help=f"Comma-separated record types ({', '.join(RECORD_NAMES.values())})")
+    args = parser.parse_args()
+
+    with SessionReader(args.file) as reader:
+        t0 = reader.chunks[0].t_first if reader.chunks else reader.mono_start
+        if args.command == "info":
+            print(f"File: {args.file} ({'complete' if reader.complete else 'recovered by scan'})")
+            print(f"Started: {time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(reader.to_wall(t0)))}")
+            print(f"Duration: {reader.duration:.1f}s, chunks: {len(reader.chunks)}, "
+                  f"records: {sum(c.n_records for c in reader.chunks)}")
+            counts = {}
+            for record in reader.records(decode=False):
+                counts[record.type] = counts.get(record.type, 0) + 1
+            for rec_type, count in sorted(counts.items()):
+                print(f"  {RECORD_NAMES.get(rec_type, rec_type):<9} {count}")
+            return
+
+        types = None
+        if args.type:
+            by_name = {name: rec_type for rec_type, name in RECORD_NAMES.items()}
+            types = {by_name[name.strip()] for name in args.type.split(",")}
+        start = None if args.start is None else t0 + args.start
+        end = None if args.end is None else t0 + args.end
+        for record in reader.records(start, end, types):
+            print(format_record(record, t0))
+
+
+if __name__ == "__main__":
+    main()
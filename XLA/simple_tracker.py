@@ -0,0 +1,158 @@
+import numpy as np
+
+from box_geometry import BoxArrays, empty_boxes
+
+
+# Tracker IoU/tâm box viết bằng NumPy cho tracking_method "centroid".
+#
+# Camera gắn trên robot nên mọi quả trong ảnh cùng trôi 1 hướng với cùng vận tốc
+# (ngược hướng robot đi). Thay vì Kalman filter từng track như ByteTrack/BoT-SORT,
+# tracker ước lượng 1 vận tốc chung cho cả cảnh, dịch các track theo vận tốc đó
+# rồi ghép với detection mới: trước theo IoU, sau theo khoảng cách tâm cho quả
+# đi nhanh không còn chồng box. Dưới 1 ms/frame với vài chục box trên CPU.
+
+
+def iou_matrix(a, b):
+    """IoU (M, N) giữa box a (M, 4) và b (N, 4)"""
+    x1 = np.maximum(a[:, None, 0], b[None, :, 0])
+    y1 = np.maximum(a[:, None, 1], b[None, :, 1])
+    x2 = np.minimum(a[:, None, 2], b[None, :, 2])
+    y2 = np.minimum(a[:, None, 3], b[None, :, 3])
+    inter = np.clip(x2 - x1, 0, None) * np.clip(y2 - y1, 0, None)
+    area_a = (a[:, 2] - a[:, 0]) * (a[:, 3] - a[:, 1])
+    area_b = (b[:, 2] - b[:, 0]) * (b[:, 3] - b[:, 1])
+    return inter / np.maximum(area_a[:, None] + area_b[None, :] - inter, 1e-9)
+
+
+def greedy_match(score, valid):
+    """Ghép (track, detection) theo score giảm dần, mỗi bên dùng 1 lần → (rows, cols)"""
+    rows, cols = np.nonzero(valid)
+    if len(rows) == 0:
+        return rows, cols
+    order = np.argsort(-score[rows, cols], kind='stable')
+    used_rows, used_cols = set(), set()
+    keep = []
+    for i in order:
+        r, c = rows[i], cols[i]
+        if r not in used_rows and c not in used_cols:
+            used_rows.add(r)
+            used_cols.add(c)
+            keep.append(i)
+    keep = np.array(keep, dtype=int)
+    return rows[keep], cols[keep]
+
+
+class CentroidTracker:
+    """Tracker nhẹ cùng interface với corridor.CorridorTracker (.method, .update)
+
+    direction: hướng quả trôi theo trục x của ảnh (-1 sang trái, 1 sang phải,
+    0 không biết). Ghép theo khoảng cách tâm bỏ qua cặp đi ngược hướng quá
+    `backtrack` px - tránh đổi ID giữa 2 quả cạnh nhau.
+    """
+
+    method = "centroid"
+
+    def __init__(self, direction=0, iou_threshold=0.2, max_distance=1.0, max_age=15,
+                 backtrack=8.0, velocity_smoothing=0.5):
+        self.direction = direction
+        self.iou_threshold = iou_threshold
+        self.max_distance = max_distance  # Tính theo cạnh lớn của box
+        self.max_age = max_age            # Số frame giữ track mất dấu
+        self.backtrack = backtrack
+        self.velocity_smoothing = velocity_smoothing
+        self.reset()
+
+    def reset(self):
+        self.boxes = np.zeros((0, 4), dtype=np.float32)
+        self.ids = np.zeros(0, dtype=int)
+        self.missed = np.zeros(0, dtype=int)
+        self.velocity = np.zeros(2, dtype=np.float32)  # px/frame, chung cho cả cảnh
+        self.next_id = 1
+
+    def predict(self):
+        """Vị trí dự đoán của các track ở frame hiện tại"""
+        shift = self.velocity[None, :] * (self.missed[:, None] + 1)
+        return self.boxes + np.tile(shift, 2)
+
+    def update(self, data, frame=None):
+        """data: (N, 6) [x1, y1, x2, y2, conf, cls] full frame → BoxArrays có track_ids
+
+        frame không dùng (không có appearance feature), giữ để thay được CorridorTracker.
+        """
+        if len(data) == 0:
+            self._age(np.zeros(len(self.ids), dtype=bool))
+            return empty_boxes()
+
+        xyxy = np.ascontiguousarray(data[:, :4], dtype=np.float32)
+        n = len(xyxy)
+        det_ids = np.zeros(n, dtype=int)
+        matched_tracks = np.zeros(len(self.ids), dtype=bool)
+
+        if len(self.ids):
+            predicted = self.predict()
+            rows, cols = self._associate(predicted, xyxy)
+            if len(rows):
+                # Vận tốc cảnh = trung vị độ dời tâm (chia số frame bị lỡ) của các cặp ghép được
+                moved = (self._centers(xyxy[cols]) - self._centers(self.boxes[rows])) / (self.missed[rows, None] + 1)
+                step = np.median(moved, axis=0)
+                a = self.velocity_smoothing
+                self.velocity = (a * self.velocity + (1 - a) * step).astype(np.float32)
+
+                det_ids[cols] = self.ids[rows]
+                self.boxes[rows] = xyxy[cols]
+                self.missed[rows] = 0
+                matched_tracks[rows] = True
+
+        self._age(matched_tracks)
+
+        new = det_ids == 0
+        if new.any():
+            count = int(new.sum())
+            det_ids[new] = np.arange(self.next_id, self.next_id + count)
+            self.next_id += count
+            self.boxes = np.concatenate([self.boxes, xyxy[new]])
+            self.ids = np.concatenate([self.ids, det_ids[new]])
+            self.missed = np.concatenate([self.missed, np.zeros(count, dtype=int)])
+
+        boxes = BoxArrays(xyxy, data[:, 4].astype(np.float32), data[:, 5].astype(int), det_ids)
+        for arr in boxes:
+            arr.flags.writeable = False
+        return boxes
+
+    def _associate(self, predicted, xyxy):
+        """Ghép 2 bước: IoU với box dự đoán, rồi khoảng cách tâm cho phần còn lại"""
+        iou = iou_matrix(predicted, xyxy)
+        rows, cols = greedy_match(iou, iou >= self.iou_threshold)
+
+        free_rows = np.setdiff1d(np.arange(len(predicted)), rows)
+        free_cols = np.setdiff1d(np.arange(len(xyxy)), cols)
+        if len(free_rows) == 0 or len(free_cols) == 0:
+            return rows, cols
+
+        offset = self._centers(xyxy[free_cols])[None, :, :] - self._centers(predicted[free_rows])[:, None, :]
+        distance = np.hypot(offset[..., 0], offset[..., 1])
+        sizes = predicted[free_rows, 2:] - predicted[free_rows, :2]
+        gate = self.max_distance * sizes.max(axis=1)[:, None]
+        valid = distance <= gate
+        if self.direction:
+            valid &= offset[..., 0] * self.direction >= -self.backtrack
+        r, c = greedy_match(-distance, valid)
+        return np.concatenate([rows, free_rows[r]]), np.concatenate([cols, free_cols[c]])
+
+    def _age(self, matched):
+        """Tăng missed cho track không ghép được, bỏ track quá max_age"""
+        self.missed[~matched] += 1
+        alive = self.missed <= self.max_age
+        if not alive.all():
+            self.boxes = self.boxes[alive]
+            self.ids = self.ids[alive]
+            self.missed = self.missed[alive]
+
+    @staticmethod
+    def _centers(xyxy):
+        return (xyxy[:, :2] + xyxy[:, 2:]) / 2
+
+
+def flow_direction(travel_direction):
+    """Hướng quả trôi trong ảnh: ngược hướng robot đi (travel_direction "left"/"right")"""
+    return {"right": -1, "left": 1}.get(travel_direction, 0)
@@ -0,0 +1,343 @@
+import os
+import sys
+import glob
+import json
+import time
+import argparse
+import itertools
+import contextlib
+from collections import namedtuple
+
+import cv2
+import numpy as np
+
+from harvest_engine import HarvestEngine
+from detector_worker import DetectionResult
+import box_geometry
+import model_backends
+
+
+# Quét lưới cài đặt detect (conf, iou, imgsz, tracker, backend) trên bộ clip có nhãn:
+# precision / recall của quyết định "có dâu Ripe trong zone" so với p95 latency mỗi
+# frame, in bảng Pareto và ghi điểm vận hành đã chọn vào strawberry_config.txt.
+#
+# Bộ clip: mỗi thư mục là 1 clip (frame theo thứ tự tên file, tracker reset giữa
+# các clip). Nhãn dạng YOLO cạnh ảnh (abc.jpg → abc.txt) hoặc thư mục labels/
+# song song images/: "cls cx cy w h" chuẩn hóa 0..1, không có file nhãn = frame trống.
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.bmp')
+
+# Tên tracker trong control panel → tracking_method của engine
+TRACKERS = {"bytetrack": "bytetrack", "botsort": "deepsort", "deepsort": "deepsort",
+            "centroid": "centroid", "none": "none"}
+
+SweepConfig = namedtuple('SweepConfig', ['backend', 'imgsz', 'tracker', 'conf', 'iou'])
+
+Clip = namedtuple('Clip', ['name', 'frames'])  # frames: list (đường dẫn ảnh, nhãn (N, 5))
+
+
+# ===== Bộ clip có nhãn =====
+
+def label_path(image_path):
+    """abc.jpg → abc.txt cạnh ảnh, hoặc .../labels/abc.txt nếu ảnh nằm trong .../images/"""
+    stem = os.path.splitext(image_path)[0]
+    beside = stem + ".txt"
+    if os.path.exists(beside):
+        return beside
+    parts = stem.split(os.sep)
+    if "images" in parts:
+        index = len(parts) - 1 - parts[::-1].index("images")
+        parts[index] = "labels"
+        return os.sep.join(parts) + ".txt"
+    return beside
+
+
+def read_labels(path):
+    """(N, 5) [cls, cx, cy, w, h] chuẩn hóa, rỗng nếu không có file"""
+    if not os.path.exists(path):
+        return np.zeros((0, 5))
+    rows = [line.split()[:5] for line in open(path) if line.strip()]
+    return np.array(rows, dtype=np.float64).reshape(-1, 5)
+
+
+def load_clips(paths):
+    """Clip từ thư mục (mỗi thư mục 1 clip) hoặc glob / file ảnh (gom theo thư mục cha)"""
+    groups = {}
+    for path in paths:
+        if os.path.isdir(path):
+            images = [os.path.join(path, name) for name in sorted(os.listdir(path))]
+            key = path
+        else:
+            images = sorted(glob.glob(path)) if any(c in path for c in '*?[') else [path]
+            key = None
+        for image in images:
+            if image.lower().endswith(IMAGE_EXTENSIONS):
+                clip = key or os.path.dirname(image) or "."
+                groups.setdefault(clip, []).append(image)
+    return [Clip(name, [(image, read_labels(label_path(image))) for image in images])
+            for name, images in groups.items()]
+
+
+def ground_truth_boxes(labels, width, height, flip_horizontal):
+    """Nhãn chuẩn hóa → (xyxy pixel, cls), lật ngang giống tiền xử lý của detector"""
+    cls = labels[:, 0].astype(int)
+    cx = labels[:, 1]
+    if flip_horizontal:
+        cx = 1.0 - cx
+    cx, cy = cx * width, labels[:, 2] * height
+    w, h = labels[:, 3] * width, labels[:, 4] * height
+    xyxy = np.column_stack([cx - w / 2, cy - h / 2, cx + w / 2, cy + h / 2])
+    return xyxy, cls
+
+
+def ripe_in_zone(xyxy, cls, x_line_left, x_line_right):
+    """Mask box Ripe có tâm trong zone (cùng quy tắc với process_detection)"""
+    center_x, _ = box_geometry.box_centers(xyxy.astype(int))
+    return (center_x >= x_line_left) & (center_x <= x_line_right) & (cls == 0)
+
+
+def box_iou(box, boxes):
+    """IoU của 1 box với (N, 4) box"""
+    x1 = np.maximum(box[0], boxes[:, 0])
+    y1 = np.maximum(box[1], boxes[:, 1])
+    x2 = np.minimum(box[2], boxes[:, 2])
+    y2 = np.minimum(box[3], boxes[:, 3])
+    inter = np.clip(x2 - x1, 0, None) * np.clip(y2 - y1, 0, None)
+    area = (box[2] - box[0]) * (box[3] - box[1])
+    areas = (boxes[:, 2] - boxes[:, 0]) * (boxes[:, 3] - boxes[:, 1])
+    return inter / np.maximum(area + areas - inter, 1e-9)
+
+
+# ===== Sweep =====
+
+class SweepRunner:
+    """Chạy đúng pipeline của engine (preprocess → DetectorWorker.detect → process_detection)
+
+    Mỗi backend 1 HarvestEngine (load model 1 lần). Frame được giải mã 1 lần và
+    giữ trong RAM cho mọi cấu hình. Latency = preprocess + detect (kể cả tracker)
+    + quyết định, bỏ qua `warmup` frame đầu mỗi cấu hình.
+    """
+
+    def __init__(self, weights, config_file, clips, match_iou=0.5, warmup=3):
+        self.weights = weights
+        self.config_file = config_file
+        self.clips = clips
+        self.match_iou = match_iou
+        self.warmup = warmup
+        self.engines = {}
+        self.frames = {}
+
+    def engine_for(self, backend):
+        if backend not in self.engines:
+            self.engines[backend] = HarvestEngine(weights=self.weights, config_file=self.config_file,
+                                                  backend=backend)
+        return self.engines[backend]
+
+    def frame(self, path):
+        if path not in self.frames:
+            self.frames[path] = cv2.imread(path)
+        return self.frames[path]
+
+    def evaluate(self, config):
+        """dict kết quả của 1 cấu hình (None nếu backend không load được đúng loại,
+        hoặc backend export cố định 640 mà imgsz khác - kết quả sẽ bị gắn nhãn sai)"""
+        engine = self.engine_for(config.backend)
+        if config.backend != "auto" and engine.active_backend != config.backend:
+            return None
+        if config.imgsz != 640 and engine.active_backend not in model_backends.DYNAMIC_BACKENDS:
+            return None
+        engine.conf_threshold = config.conf
+        engine.iou_threshold = config.iou
+        engine.tracking_method = TRACKERS[config.tracker]
+        engine.imgsz = config.imgsz
+        detector = engine.detector
+
+        counts = {"tp": 0, "fp": 0, "fn": 0, "tn": 0, "target_hits": 0}
+        latencies = []
+        with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+            for clip in self.clips:
+                detector.reset_tracking()
+                for index, (path, labels) in enumerate(clip.frames):
+                    raw = self.frame(path)
+                    if raw is None:
+                        continue
+                    height, width = raw.shape[:2]
+                    engine.image_width, engine.image_height = width, height
+
+                    start = time.perf_counter()
+                    frame = detector.preprocess(raw)
+                    boxes, roi = detector.detect(frame)
+                    harvest_frame = engine.process_detection(
+                        DetectionResult(index, index, frame, boxes, 0.0, 0.0, 0.0, roi))
+                    elapsed = time.perf_counter() - start
+                    if index >= self.warmup:
+                        latencies.append(elapsed)
+
+                    self._score(counts, harvest_frame, labels, width, height, engine)
+
+        return self._summary(config, counts, latencies)
+
+    def _score(self, counts, harvest_frame, labels, width, height, engine):
+        gt_xyxy, gt_cls = ground_truth_boxes(labels, width, height, engine.flip_horizontal)
+        gt_mask = ripe_in_zone(gt_xyxy, gt_cls, engine.x_line_left, engine.x_line_right)
+        truth = bool(gt_mask.any())
+        predicted = harvest_frame.target_in_zone
+        if predicted and truth:
+            counts["tp"] += 1
+            # Target được chọn có trùng 1 quả Ripe thật trong zone không
+            target = harvest_frame.target
+            if target >= 0 and box_iou(harvest_frame.xyxy[target], gt_xyxy[gt_mask]).max() >= self.match_iou:
+                counts["target_hits"] += 1
+        elif predicted:
+            counts["fp"] += 1
+        elif truth:
+            counts["fn"] += 1
+        else:
+            counts["tn"] += 1
+
+    def _summary(self, config, counts, latencies):
+        tp, fp, fn = counts["tp"], counts["fp"], counts["fn"]
+        precision = tp / (tp + fp) if tp + fp else 1.0
+        recall = tp / (tp + fn) if tp + fn else 1.0
+        f1 = 2 * precision * recall / (precision + recall) if precision + recall else 0.0
+        ms = np.asarray(latencies) * 1000.0 if latencies else np.zeros(1)
+        return {**config._asdict(), **counts,
+                "frames": sum(counts[k] for k in ("tp", "fp", "fn", "tn")),
+                "precision": precision, "recall": recall, "f1": f1,
+                "target_accuracy": counts["target_hits"] / tp if tp else 0.0,
+                "p50_ms": float(np.percentile(ms, 50)), "p95_ms": float(np.percentile(ms, 95)),
+                "fps": float(1000.0 / ms.mean()) if ms.mean() > 0 else 0.0}
+
+
+def config_grid(args):
+    return [SweepConfig(*values) for values in
+            itertools.product(args.backend, args.imgsz, args.tracker, args.conf, args.iou)]
+
+
+def pareto_front(results):
+    """Index các cấu hình không bị trội: không cấu hình nào có precision, recall
+    đều >= và p95 <= (ít nhất 1 phía tốt hơn hẳn)"""
+    front = []
+    for i, a in enumerate(results):
+        dominated = any(
+            b["precision"] >= a["precision"] and b["recall"] >= a["recall"] and b["p95_ms"] <= a["p95_ms"]
+            and (b["precision"] > a["precision"] or b["recall"] > a["recall"] or b["p95_ms"] < a["p95_ms"])
+            for j, b in enumerate(results) if j != i)
+        if not dominated:
+            front.append(i)
+    return front
+
+
+def choose_operating_point(results, front, max_latency=None, min_recall=0.0):
+    """F1 cao nhất trên Pareto front trong giới hạn p95 / recall, hòa thì p95 thấp hơn"""
+    candidates = [results[i] for i in front
+                  if (max_latency is None or results[i]["p95_ms"] <= max_latency)
+                  and results[i]["recall"] >= min_recall]
+    if not candidates:
+        return None
+    return max(candidates, key=lambda r: (r["f1"], -r["p95_ms"]))
+
+
+def format_table(results, front, chosen=None):
+    lines = [f"{'':2}{'backend':<12}{'imgsz':>6} {'tracker':<10}{'conf':>6}{'iou':>6}"
+             f"{'prec':>8}{'recall':>8}{'f1':>7}{'target':>8}{'p50 ms':>9}{'p95 ms':>9}"]
+    order = sorted(range(len(results)), key=lambda i: results[i]["p95_ms"])
+    for i in order:
+        r = results[i]
+        mark = "*" if r is chosen else ("P" if i in front else " ")
+        lines.append(f"{mark:<2}{r['backend']:<12}{r['imgsz']:>6} {r['tracker']:<10}{r['conf']:>6.2f}{r['iou']:>6.2f}"
+                     f"{r['precision']:>8.3f}{r['recall']:>8.3f}{r['f1']:>7.3f}{r['target_accuracy']:>8.2f}"
+                     f"{r['p50_ms']:>9.1f}{r['p95_ms']:>9.1f}")
+    lines.append("P = Pareto-optimal (precision, recall vs p95 latency), * = chosen operating point")
+    return "\n".join(lines)
+
+
+def write_operating_point(config_file, result):
+    """Ghi conf/iou/tracker/imgsz/backend vào config, giữ nguyên các khóa khác"""
+    config = {}
+    if os.path.exists(config_file):
+        with open(config_file) as f:
+            config = json.load(f)
+    config.update({
+        "conf_threshold": result["conf"],
+        "iou_threshold": result["iou"],
+        "tracking_method": TRACKERS[result["tracker"]],
+        "imgsz": result["imgsz"],
+        "model_backend": result["backend"],
+    })
+    with open(config_file, 'w') as f:
+        json.dump(config, f, indent=4)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Sweep conf/iou/imgsz/tracker/backend on labeled clips: ripe-in-zone precision/recall vs latency")
+    parser.add_argument("clips", nargs="+", help="Clip folders (one clip each) or image globs, YOLO labels beside images")
+    parser.add_argument("--weights", default="best.pt", help="YOLO weights file")
+    parser.add_argument("--config", default="strawberry_config.txt",
+                        help="Config with zone/calibration; the chosen operating point is written here")
+    parser.add_argument("--conf", type=float, nargs="+", default=[0.3, 0.4, 0.5, 0.6], help="conf_threshold values")
+    parser.add_argument("--iou", type=float, nargs="+", default=[0.45], help="iou_threshold values")
+    parser.add_argument("--imgsz", type=int, nargs="+", default=[640, 480, 320],
+                        help="Inference sizes (multiple of 32, fixed-size exports such as torchscript only run 640)")
+    parser.add_argument("--tracker", nargs="+", default=["bytetrack", "none"], choices=tuple(TRACKERS),
+                        help="Tracking modes")
+    parser.add_argument("--backend", nargs="+", default=["auto"], choices=("auto",) + model_backends.BACKEND_PRIORITY,
+                        help="Inference backends")
+    parser.add_argument("--match-iou", type=float, default=0.5, help="IoU for the chosen target to count as a hit")
+    parser.add_argument("--max-latency", type=float, default=None, help="Only choose configs with p95 <= this (ms)")
+    parser.add_argument("--min-recall", type=float, default=0.0, help="Only choose configs with recall >= this")
+    parser.add_argument("--output", default=None, help="Write all results as JSON")
+    parser.add_argument("--dry-run", action="store_true", help="Report the chosen point without writing the config")
+    args = parser.parse_args()
+
+    clips = load_clips(args.clips)
+    total = sum(len(clip.frames) for clip in clips)
+    if not total:
+        print("No labeled images found")
+        return 1
+    labeled = sum(len(labels) > 0 for clip in clips for _, labels in clip.frames)
+    grid = config_grid(args)
+    print(f"{len(clips)} clips, {total} frames ({labeled} with labels), {len(grid)} configurations")
+
+    runner = SweepRunner(args.weights, args.config, clips, args.match_iou)
+    results = []
+    for i, config in enumerate(grid, 1):
+        result = runner.evaluate(config)
+        if result is None:
+            print(f"[{i}/{len(grid)}] {config.backend} imgsz={config.imgsz}: not available - skipped")
+            continue
+        results.append(result)
+        print(f"[{i}/{len(grid)}] {config.backend} imgsz={config.imgsz} {config.tracker} conf={config.conf:.2f} "
+              f"iou={config.iou:.2f}: P={result['precision']:.3f} R={result['recall']:.3f} "
+              f"p95={result['p95_ms']:.1f}ms")
+    if not results:
+        print("No configuration could be evaluated")
+        return 1
+
+    front = pareto_front(results)
+    chosen = choose_operating_point(results, front, args.max_latency, args.min_recall)
+    print()
+    print(format_table(results, front, chosen))
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({"results": results, "pareto": front,
+                       "chosen": results.index(chosen) if chosen else None}, f, indent=2)
+        print(f"Results written to {args.output}")
+
+    if chosen is None:
+        print("No configuration meets --max-latency / --min-recall - config not changed")
+        return 1
+    summary = (f"conf={chosen['conf']:.2f}, iou={chosen['iou']:.2f}, tracker={chosen['tracker']}, "
+               f"imgsz={chosen['imgsz']}, backend={chosen['backend']}")
+    if args.dry_run:
+        print(f"Chosen: {summary} (dry run - {args.config} not changed)")
+    else:
+        write_operating_point(args.config, chosen)
+        print(f"Chosen: {summary} → written to {args.config}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
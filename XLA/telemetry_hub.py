@@ -0,0 +1,388 @@
+import re
+import json
+import time
+import queue
+import socket
+import argparse
+import threading
+
+from serial_transport import SerialTransport
+from command_queue import CommandQueue
+
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8765
+
+_NUMBER = r"[-+]?\d+(?:\.\d+)?"
+
+
+# ===== Grammar theo từng thiết bị: parse(line) → (kind, fields) =====
+
+def parse_pid(line):
+    """PID_SPEED_CONTROL.ino: "target v1Filt_M1 v1Filt_M2" """
+    parts = line.split()
+    if len(parts) == 3:
+        try:
+            target, rpm_m1, rpm_m2 = (float(p) for p in parts)
+            return "pid", {"target": target, "rpm_M1": rpm_m1, "rpm_M2": rpm_m2}
+        except ValueError:
+            pass
+    return "log", {}
+
+
+_NANO1_POSITION = re.compile(rf"Vi tri cuoi:\s*({_NUMBER})")
+_NANO1_HOMED = re.compile(rf"HOMING HOAN THANH \(Z=({_NUMBER})mm, Y=({_NUMBER})mm\)")
+
+
+def parse_nano1(line):
+    """Main_code_nano_1.ino: log stepper (vị trí cuối, DONE#, homing, lỗi)"""
+    match = _NANO1_POSITION.search(line)
+    if match:
+        return "position", {"mm": float(match.group(1))}
+    match = _NANO1_HOMED.search(line)
+    if match:
+        return "homed", {"z": float(match.group(1)), "y": float(match.group(2))}
+    if "Sent DONE#" in line:
+        return "done", {}
+    if line.startswith("[LOI]"):
+        return "error", {"message": line[5:].strip()}
+    return "log", {}
+
+
+_NANO2_YAW = re.compile(rf"Yaw:\s*({_NUMBER})\s+Target:\s*({_NUMBER})\s+Correction:\s*({_NUMBER})")
+
+
+def parse_nano2(line):
+    """Main_code_nano_2.ino: "Yaw: x Target: y Correction: z" """
+    match = _NANO2_YAW.search(line)
+    if match:
+        yaw, target, correction = (float(v) for v in match.groups())
+        return "yaw", {"yaw": yaw, "target": target, "correction": correction}
+    return "log", {}
+
+
+_TAG = re.compile(r"^\[([A-Z0-9_ ]+)\]\s*(.*)$")
+
+
+def parse_esp32(line):
+    """CODE_ESP32.ino: HARVEST_DONE#, STOP, ACK:<seq>, NAK:<seq>, log "[PC] ...", "[AUTO] ..."..."""
+    if line == "HARVEST_DONE#":
+        return "harvest_done", {}
+    if line == "STOP":
+        return "stop", {}
+    if line.startswith(("ACK:", "NAK:")):
+        try:
+            return line[:3].lower(), {"seq": int(line[4:])}
+        except ValueError:
+            pass
+    match = _TAG.match(line)
+    if match:
+        return "log", {"tag": match.group(1), "message": match.group(2)}
+    return "log", {}
+
+
+def parse_raw(line):
+    return "log", {}
+
+
+GRAMMARS = {
+    "esp32": parse_esp32,
+    "nano1": parse_nano1,
+    "nano2": parse_nano2,
+    "pid": parse_pid,
+    "raw": parse_raw,
+}
+
+
+def register_grammar(name, parser):
+    """Thêm grammar mới: parser(line) → (kind, fields)"""
+    GRAMMARS[name] = parser
+
+
+# ===== Hub =====
+
+class _Device:
+    def __init__(self, name, transport, grammar):
+        self.name = name
+        self.transport = transport
+        self.grammar = grammar
+        self.command_queue = None
+        self.lines = 0
+        self.parse_errors = 0
+
+
+class _Client:
+    def __init__(self, sock, address, max_queue):
+        self.sock = sock
+        self.address = address
+        self.queue = queue.Queue(maxsize=max_queue)
+        self.dropped = 0
+        self.running = True
+
+
+class TelemetryHub:
+    """Gom telemetry từ nhiều cổng serial, parse theo grammar từng thiết bị và phát đi
+
+    - Mỗi thiết bị 1 SerialTransport (thread đọc riêng), thời điểm nhận lấy từ
+      time.monotonic() chung cho mọi cổng → so sánh/ghép được giữa các thiết bị.
+    - Sample: {"device", "kind", "t" (monotonic), "wall" (time.time), "fields", "line"}.
+    - Subscriber cùng process: subscribe(callback(sample)).
+    - Process khác (GUI, recorder, metrics): TCP localhost, mỗi sample 1 dòng JSON.
+      Client chậm không làm chậm hub: hàng đợi mỗi client có giới hạn, đầy thì
+      bỏ sample cũ nhất.
+    - Client gửi {"device": "esp32", "command": "T#"} để ghi lệnh ra thiết bị.
+    """
+
+    def __init__(self, host=DEFAULT_HOST, port=DEFAULT_PORT, max_client_queue=5000):
+        self.host = host
+        self.port = port
+        self.max_client_queue = max_client_queue
+        self.devices = {}
+        self.subscribers = []
+        self.clients = []
+        self.lock = threading.Lock()
+        self.server = None
+        self.server_thread = None
+        self.running = False
+        self.samples = 0
+
+    def add_device(self, name, port=None, baudrate=115200, grammar=None, ser=None):
+        """Mở 1 cổng serial, grammar mặc định theo tên thiết bị (không có thì 'raw')"""
+        if grammar is None:
+            grammar = name if name in GRAMMARS else "raw"
+        transport = SerialTransport(port, baudrate, ser=ser)
+        device = _Device(name, transport, GRAMMARS[grammar])
+        transport.subscribe(lambda line, timestamp: self._on_line(device, line, timestamp))
+        transport.on_error(lambda e: print(f"[HUB] {name} read error: {e}"))
+        transport.open()
+        device.command_queue = CommandQueue(transport)
+        with self.lock:
+            self.devices[name] = device
+        return device
+
+    def subscribe(self, callback):
+        """callback(sample) trên thread đọc của thiết bị"""
+        self.subscribers.append(callback)
+
+    def send(self, device_name, command):
+        device = self.devices.get(device_name)
+        if device is None:
+            return False
+        return device.command_queue.submit(command)
+
+    def start(self):
+        """Mở TCP server (port 0 = tự chọn, xem self.port sau khi start)"""
+        self.running = True
+        self.server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.server.bind((self.host, self.port))
+        self.server.listen()
+        self.port = self.server.getsockname()[1]
+        self.server_thread = threading.Thread(target=self._accept_loop, daemon=True)
+        self.server_thread.start()
+        return self
+
+    def close(self):
+        self.running = False
+        if self.server is not None:
+            try:
+                self.server.close()
+            except OSError:
+                pass
+        with self.lock:
+            clients = list(self.clients)
+            devices = list(self.devices.values())
+        for client in clients:
+            self._drop_client(client)
+        for device in devices:
+            device.command_queue.close(flush_timeout=0.2)
+            device.transport.close()
+
+    def stats(self):
+        with self.lock:
+            return {"samples": self.samples,
+                    "clients": len(self.clients),
+                    "dropped": sum(c.dropped for c in self.clients),
+                    "devices": {d.name: {"lines": d.lines, "parse_errors": d.parse_errors}
+                                for d in self.devices.values()}}
+
+    def _on_line(self, device, line, timestamp):
+        device.lines += 1
+        try:
+            kind, fields = device.grammar(line)
+        except Exception:
+            device.parse_errors += 1
+            kind, fields = "log", {}
+        sample = {"device": device.name, "kind": kind, "t": timestamp,
+                  "wall": time.time(), "fields": fields, "line": line}
+        self.publish(sample)
+
+    def publish(self, sample):
+        """Phát 1 sample tới subscriber và client TCP (gọi từ thread đọc của nhiều thiết bị)"""
+        with self.lock:
+            self.samples += 1
+            clients = list(self.clients)
+        for callback in list(self.subscribers):
+            try:
+                callback(sample)
+            except Exception as e:
+                print(f"[HUB] Subscriber error: {e}")
+
+        if not clients:
+            return
+        data = (json.dumps(sample, ensure_ascii=False) + "\n").encode('utf-8')
+        for client in clients:
+            try:
+                client.queue.put_nowait(data)
+            except queue.Full:
+                try:
+                    client.queue.get_nowait()  # Bỏ sample cũ nhất
+                except queue.Empty:
+                    pass
+                with self.lock:
+                    client.dropped += 1
+                try:
+                    client.queue.put_nowait(data)
+                except queue.Full:
+                    pass  # Thiết bị khác vừa ghi đầy - bỏ sample này
+
+    def _accept_loop(self):
+        while self.running:
+            try:
+                sock, address = self.server.accept()
+            except OSError:
+                break
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            client = _Client(sock, address, self.max_client_queue)
+            with self.lock:
+                self.clients.append(client)
+            threading.Thread(target=self._client_writer, args=(client,), daemon=True).start()
+            threading.Thread(target=self._client_reader, args=(client,), daemon=True).start()
+
+    def _client_writer(self, client):
+        while client.running:
+            try:
+                data = client.queue.get(timeout=0.5)
+            except queue.Empty:
+                continue
+            try:
+                client.sock.sendall(data)
+            except OSError:
+                break
+        self._drop_client(client)
+
+    def _client_reader(self, client):
+        buffer = b""
+        while client.running:
+            try:
+                chunk = client.sock.recv(4096)
+            except OSError:
+                break
+            if not chunk:
+                break
+            buffer += chunk
+            while b"\n" in buffer:
+                raw, buffer = buffer.split(b"\n", 1)
+                try:
+                    request = json.loads(raw)
+                    self.send(request["device"], request["command"])
+                except (ValueError, KeyError, TypeError) as e:
+                    print(f"[HUB] Bad client request {raw!r}: {e}")
+        self._drop_client(client)
+
+    def _drop_client(self, client):
+        client.running = False
+        with self.lock:
+            if client in self.clients:
+                self.clients.remove(client)
+        try:
+            client.sock.close()
+        except OSError:
+            pass
+
+
+class TelemetryClient:
+    """Kết nối tới TelemetryHub: đọc sample (dict) và gửi lệnh tới thiết bị"""
+
+    def __init__(self, host=DEFAULT_HOST, port=DEFAULT_PORT, timeout=5.0):
+        self.sock = socket.create_connection((host, port), timeout=timeout)
+        self.sock.settimeout(None)
+        self.reader = self.sock.makefile('rb')
+        self.write_lock = threading.Lock()
+
+    def samples(self, devices=None, kinds=None):
+        """Generator sample, lọc theo device / kind nếu có"""
+        for raw in self.reader:
+            sample = json.loads(raw)
+            if devices is not None and sample["device"] not in devices:
+                continue
+            if kinds is not None and sample["kind"] not in kinds:
+                continue
+            yield sample
+
+    def send(self, device, command):
+        data = (json.dumps({"device": device, "command": command}) + "\n").encode('utf-8')
+        with self.write_lock:
+            self.sock.sendall(data)
+
+    def close(self):
+        try:
+            self.sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+        self.sock.close()
+
+
+def parse_device_spec(spec):
+    """"NAME=PORT[@BAUD][:GRAMMAR]" → (name, port, baud, grammar)"""
+    name, _, rest = spec.partition("=")
+    if not name or not rest:
+        raise argparse.ArgumentTypeError(f"Invalid device spec: {spec}")
+    grammar = None
+    if ":" in rest:
+        rest, grammar = rest.rsplit(":", 1)
+    port, _, baud = rest.partition("@")
+    return name, port, int(baud) if baud else 115200, grammar
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Telemetry hub: several serial devices → JSON lines on a local socket")
+    parser.add_argument("--device", action="append", type=parse_device_spec, default=[],
+                        help="NAME=PORT[@BAUD][:GRAMMAR], e.g. esp32=COM3@115200 or pid=/dev/ttyUSB1@9600 "
+                             f"(grammars: {', '.join(GRAMMARS)})")
+    parser.add_argument("--host", default=DEFAULT_HOST, help="Listen address")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT, help="Listen port")
+    parser.add_argument("--echo", action="store_true", help="Print every sample")
+    args = parser.parse_args()
+
+    if not args.device:
+        parser.error("at least one --device is required")
+
+    hub = TelemetryHub(args.host, args.port).start()
+    simulators = []
+    for name, port, baud, grammar in args.device:
+        ser = None
+        if port == "SIM":
+            from esp32_simulator import ESP32Simulator
+            simulators.append(ESP32Simulator())
+            ser = simulators[-1].serial()
+        hub.add_device(name, port, baud, grammar, ser=ser)
+        print(f"[HUB] {name}: {port} @ {baud} ({grammar or (name if name in GRAMMARS else 'raw')})")
+    if args.echo:
+        hub.subscribe(lambda s: print(f"{s['t']:.3f} {s['device']:<6} {s['kind']:<12} {s['fields'] or s['line']}"))
+
+    print(f"Telemetry hub on {args.host}:{hub.port} - Ctrl+C to stop")
+    try:
+        while True:
+            time.sleep(5.0)
+            print(f"[HUB] {hub.stats()}")
+    except KeyboardInterrupt:
+        pass
+    finally:
+        hub.close()
+        for simulator in simulators:
+            simulator.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+import threading
+
+import numpy as np
+
+
+class TelemetryStore:
+    """Ring buffer NumPy cấp phát sẵn cho telemetry (thời gian + nhiều kênh)
+
+    Mỗi mẫu được ghi 2 lần (vị trí i và i + capacity) nên N mẫu gần nhất luôn
+    nằm liền nhau trong mảng → window() trả về view, không copy. Append O(1),
+    không cấp phát bộ nhớ mới.
+    View chỉ hợp lệ tới lần append kế tiếp khi buffer đã đầy (mẫu cũ nhất
+    của view bị ghi đè) - đủ cho vẽ đồ thị, cần giữ lâu thì .copy().
+    """
+
+    def __init__(self, channels, capacity=60000, dtype=np.float64):
+        self.channels = tuple(channels)
+        self.capacity = int(capacity)
+        self.index = {name: i for i, name in enumerate(self.channels)}
+        # Hàng 0: thời gian, hàng 1..: các kênh
+        self.data = np.zeros((len(self.channels) + 1, 2 * self.capacity), dtype=dtype)
+        self.head = 0    # Vị trí ghi tiếp theo (0..capacity-1)
+        self.count = 0   # Số mẫu đang lưu (<= capacity)
+        self.total = 0   # Tổng số mẫu từ đầu
+        self.lock = threading.Lock()
+
+    @classmethod
+    def for_duration(cls, channels, minutes, sample_rate):
+        """Đủ chỗ cho `minutes` phút lịch sử ở `sample_rate` mẫu/giây"""
+        return cls(channels, capacity=max(1, int(minutes * 60 * sample_rate)))
+
+    def __len__(self):
+        return self.count
+
+    def append(self, timestamp, *values):
+        """Thêm 1 mẫu: append(t, v_kênh_1, v_kênh_2, ...)"""
+        with self.lock:
+            head = self.head
+            column = (timestamp,) + values
+            self.data[:, head] = column
+            self.data[:, head + self.capacity] = column
+            self.head = (head + 1) % self.capacity
+            self.count = min(self.count + 1, self.capacity)
+            self.total += 1
+
+    def clear(self):
+        with self.lock:
+            self.head = 0
+            self.count = 0
+
+    def _view(self, n):
+        # N mẫu gần nhất: [head + capacity - n, head + capacity) luôn liền nhau
+        end = self.head + self.capacity
+        return self.data[:, end - n:end]
+
+    def window(self, seconds=None, last=None):
+        """(times, values) của các mẫu gần nhất - view, không copy
+
+        seconds: chỉ lấy mẫu trong `seconds` giây cuối; last: chỉ lấy N mẫu cuối.
+        values có shape (số kênh, N), hàng theo thứ tự channels.
+        """
+        with self.lock:
+            n = self.count if last is None else min(last, self.count)
+            view = self._view(n)
+            if seconds is not None and n > 0:
+                times = view[0]
+                start = np.searchsorted(times, times[-1] - seconds, side='left')
+                view = view[:, start:]
+        return view[0], view[1:]
+
+    def channel(self, name, seconds=None, last=None):
+        """(times, values) của 1 kênh theo tên"""
+        times, values = self.window(seconds, last)
+        return times, values[self.index[name]]
+
+    def decimated(self, seconds=None, max_points=2000):
+        """(times, values) rút gọn còn ~max_points điểm, giữ đỉnh (min/max mỗi nhóm)
+
+        Ít điểm hơn max_points thì trả về view như window(). Ngược lại chia thành
+        max_points/2 nhóm, mỗi nhóm lấy min và max (không mất spike khi xem lâu).
+        """
+        times, values = self.window(seconds)
+        n = len(times)
+        if n <= max_points:
+            return times, values
+
+        buckets = max(1, max_points // 2)
+        size = -(-n // buckets)            # ceil
+        buckets = n // size
+        start = n - buckets * size         # Bỏ vài mẫu cũ nhất cho chia hết
+        t = times[start:].reshape(buckets, size)
+        v = values[:, start:].reshape(len(self.channels), buckets, size)
+
+        out_times = np.empty(2 * buckets, dtype=times.dtype)
+        out_times[0::2] = t[:, 0]
+        out_times[1::2] = t[:, -1]
+        out_values = np.empty((len(self.channels), 2 * buckets), dtype=values.dtype)
+        out_values[:, 0::2] = v.min(axis=2)
+        out_values[:, 1::2] = v.max(axis=2)
+        return out_times, out_values
+
+    def time_range(self):
+        """(t_cũ_nhất, t_mới_nhất), None nếu chưa có mẫu"""
+        with self.lock:
+            if self.count == 0:
+                return None
+            view = self._view(self.count)
+            return float(view[0, 0]), float(view[0, -1])
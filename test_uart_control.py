@@ -1,13 +1,25 @@
 import tkinter as tk
 from tkinter import ttk
-import serial
+import os
+import sys
 import serial.tools.list_ports
 import threading
 import time
 import matplotlib.pyplot as plt
 from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
-from matplotlib.animation import FuncAnimation
-from collections import deque
+
+# Dùng chung SerialTransport với app detect (thư mục XLA)
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "XLA"))
+from serial_transport import SerialTransport
+from command_queue import CommandQueue
+import binary_protocol
+from telemetry_store import TelemetryStore
+from blit_plotter import BlitPlotter
+
+HISTORY_MINUTES = 10      # Lịch sử telemetry giữ lại
+MAX_SAMPLE_RATE = 200     # Mẫu/giây tối đa dự kiến (PID in ra nhanh)
+PLOT_WINDOWS = {"10 s": 10, "30 s": 30, "1 min": 60, "5 min": 300, "All": None}
+PLOT_INTERVAL_MS = 100   # Chu kỳ cập nhật đồ thị
 
 class MotorControlApp:
     def __init__(self, root):
@@ -15,18 +27,15 @@ class MotorControlApp:
         self.root.title("Arduino Motor Control & Monitor")
         self.root.geometry("1000x700")
         
-        self.ser = None
+        self.transport = None  # SerialTransport (thread đọc blocking + callback)
+        self.command_queue = None  # CommandQueue - thread duy nhất ghi ra cổng
         self.is_connected = False
-        self.is_reading = False
         self.is_sending = False  # Cờ để gửi liên tục
         
-        # Data buffers cho plotting (lưu 200 điểm)
-        self.time_data = deque(maxlen=200)
-        self.target_L_data = deque(maxlen=200)
-        self.actual_L_data = deque(maxlen=200)
-        self.target_R_data = deque(maxlen=200)
-        self.actual_R_data = deque(maxlen=200)
-        self.start_time = time.time()
+        # Ring buffer NumPy cho plotting (HISTORY_MINUTES phút)
+        self.telemetry = TelemetryStore.for_duration(('target_L', 'actual_L', 'target_R', 'actual_R'),
+                                                     HISTORY_MINUTES, MAX_SAMPLE_RATE)
+        self.start_time = time.monotonic()
         
         self.create_widgets()
         self.setup_plot()
@@ -53,6 +62,13 @@ class MotorControlApp:
         
         tk.Button(connect_frame, text="Exit", command=self.exit_app, bg="red", fg="white", font=("Arial", 10, "bold")).grid(row=0, column=5, padx=5)
         
+        # Giao thức gửi lệnh bánh xe: ASCII "L_dir,L_rpm,R_dir,R_rpm#" hoặc frame nhị phân
+        tk.Label(connect_frame, text="Protocol:").grid(row=0, column=6, padx=5)
+        self.protocol_combo = ttk.Combobox(connect_frame, width=8, state="readonly",
+                                           values=list(binary_protocol.PROTOCOLS))
+        self.protocol_combo.current(0)
+        self.protocol_combo.grid(row=0, column=7, padx=5)
+        
         # Frame điều khiển động cơ
         control_frame = tk.LabelFrame(self.root, text="Motor Control", padx=10, pady=10)
         control_frame.pack(padx=10, pady=10, fill="x")
@@ -104,6 +120,14 @@ class MotorControlApp:
         plot_frame = tk.LabelFrame(self.root, text="Real-time Monitor (Serial Plotter)", padx=5, pady=5)
         plot_frame.pack(padx=10, pady=10, fill="both", expand=True)
         
+        # Khoảng thời gian hiển thị
+        window_frame = tk.Frame(plot_frame)
+        window_frame.pack(fill="x")
+        tk.Label(window_frame, text="Window:").pack(side="left", padx=5)
+        self.window_combo = ttk.Combobox(window_frame, width=8, state="readonly", values=list(PLOT_WINDOWS))
+        self.window_combo.current(1)
+        self.window_combo.pack(side="left", padx=5)
+        
         self.plot_canvas_widget = tk.Frame(plot_frame)
         self.plot_canvas_widget.pack(fill="both", expand=True)
         
@@ -137,25 +161,19 @@ class MotorControlApp:
         self.canvas.draw()
         self.canvas.get_tk_widget().pack(fill="both", expand=True)
         
-        # Animation
-        self.ani = FuncAnimation(self.fig, self.update_plot, interval=100, blit=False, cache_frame_data=False)
+        # Blitting: chỉ vẽ lại 4 đường, nền (trục/lưới/legend) được cache
+        self.plotter = BlitPlotter(self.canvas, [self.line_target_L, self.line_actual_L,
+                                                 self.line_target_R, self.line_actual_R])
+        self.plot_job = self.root.after(PLOT_INTERVAL_MS, self.update_plot)
         
-    def update_plot(self, frame):
-        if len(self.time_data) > 0:
-            # Update data
-            self.line_target_L.set_data(list(self.time_data), list(self.target_L_data))
-            self.line_actual_L.set_data(list(self.time_data), list(self.actual_L_data))
-            self.line_target_R.set_data(list(self.time_data), list(self.target_R_data))
-            self.line_actual_R.set_data(list(self.time_data), list(self.actual_R_data))
-            
-            # Auto-scale x-axis
-            if len(self.time_data) > 0:
-                min_time = min(self.time_data)
-                max_time = max(self.time_data)
-                self.ax1.set_xlim(min_time, max_time + 1)
-                self.ax2.set_xlim(min_time, max_time + 1)
+    def update_plot(self):
+        if len(self.telemetry) > 0:
+            # View NumPy rút gọn min/max theo số pixel ngang của trục
+            seconds = PLOT_WINDOWS.get(self.window_combo.get())
+            times, values = self.telemetry.decimated(seconds, self.plotter.max_points())
+            self.plotter.update(times, values, span=seconds)
         
-        return self.line_target_L, self.line_actual_L, self.line_target_R, self.line_actual_R
+        self.plot_job = self.root.after(PLOT_INTERVAL_MS, self.update_plot)
         
     def refresh_ports(self):
         ports = serial.tools.list_ports.comports()
@@ -177,17 +195,19 @@ class MotorControlApp:
             return
             
         try:
-            self.ser = serial.Serial(port, 9600, timeout=0.1)
+            # Thread đọc của transport gọi on_serial_line ngay khi có dòng mới
+            self.transport = SerialTransport(port, 9600, read_timeout=0.1,
+                                             **binary_protocol.protocol_options(self.protocol_combo.get()))
+            self.transport.subscribe(self.on_serial_line)
+            self.transport.on_error(lambda e: print(f"Read error: {e}"))
+            self.transport.open()
+            self.command_queue = CommandQueue(self.transport,
+                                              on_error=lambda cmd, e: print(f"Send error: {e}"))
             time.sleep(2)  # Đợi Arduino reset
             self.is_connected = True
             self.status_label.config(text=f"Connected to {port}", fg="green")
             self.connect_btn.config(text="Disconnect", bg="red")
             
-            # Start reading thread
-            self.is_reading = True
-            self.read_thread = threading.Thread(target=self.read_serial, daemon=True)
-            self.read_thread.start()
-            
             # Enable start button
             self.start_btn.config(state="normal")
             
@@ -195,10 +215,13 @@ class MotorControlApp:
             tk.messagebox.showerror("Error", f"Cannot connect: {str(e)}")
             
     def disconnect(self):
-        self.is_reading = False
         self.is_sending = False  # Dừng gửi khi disconnect
-        if self.ser and self.ser.is_open:
-            self.ser.close()
+        if self.command_queue is not None:
+            self.command_queue.close()
+            self.command_queue = None
+        if self.transport is not None:
+            self.transport.close()
+            self.transport = None
         self.is_connected = False
         self.status_label.config(text="Disconnected", fg="red")
         self.connect_btn.config(text="Connect", bg="green")
@@ -241,8 +264,10 @@ class MotorControlApp:
                 # Tạo chuỗi gửi: "L_dir,L_rpm,R_dir,R_rpm#"
                 command = f"{L_dir},{L_rpm},{R_dir},{R_rpm}#\n"
                 
-                if self.ser and self.ser.is_open:
-                    self.ser.write(command.encode('utf-8'))
+                # Lệnh bánh xe cũ chưa kịp gửi sẽ được thay bằng lệnh mới nhất
+                command_queue = self.command_queue
+                if command_queue is not None:
+                    command_queue.submit(command)
                     
                 time.sleep(0.05)  # Gửi mỗi 50ms (20Hz) giống nano_1
             except Exception as e:
@@ -256,20 +281,20 @@ class MotorControlApp:
         # Dừng gửi dữ liệu
         self.is_sending = False
         
-        # Dừng đọc dữ liệu
-        self.is_reading = False
-        
-        # Đóng cổng serial
-        if self.ser and self.ser.is_open:
+        # Dừng thread ghi/đọc và đóng cổng serial
+        if self.command_queue is not None:
+            self.command_queue.close(flush_timeout=0.2)
+        if self.transport is not None:
             try:
-                self.ser.close()
+                self.transport.close()
                 print("Serial port closed")
             except Exception as e:
                 print(f"Error closing serial: {e}")
         
         # Dừng animation
-        if hasattr(self, 'ani'):
-            self.ani.event_source.stop()
+        if getattr(self, 'plot_job', None) is not None:
+            self.root.after_cancel(self.plot_job)
+            self.plot_job = None
         
         # Đợi một chút để threads kết thúc
         time.sleep(0.2)
@@ -278,42 +303,30 @@ class MotorControlApp:
         self.root.quit()
         self.root.destroy()
         
-    def read_serial(self):
-        while self.is_reading:
+    def on_serial_line(self, line, timestamp):
+        """Callback của SerialTransport cho mỗi dòng nhận được (chạy trên thread đọc)"""
+        # Parse data: "target_L actual_L actual_R"
+        parts = line.split()
+        if len(parts) >= 3:
             try:
-                if self.ser and self.ser.in_waiting > 0:
-                    line = self.ser.readline().decode('utf-8', errors='ignore').strip()
-                    if line:
-                        # Parse data: "target_L actual_L actual_R"
-                        parts = line.split()
-                        if len(parts) >= 3:
-                            try:
-                                # Bỏ qua target từ Arduino, lấy target từ GUI
-                                actual_L = float(parts[1])
-                                actual_R = float(parts[2])
-                                
-                                # Lấy target từ slider GUI
-                                target_L = float(self.L_rpm_scale.get())
-                                target_R = float(self.R_rpm_scale.get())
-                                
-                                # Update data
-                                current_time = time.time() - self.start_time
-                                self.time_data.append(current_time)
-                                self.target_L_data.append(target_L)
-                                self.actual_L_data.append(actual_L)
-                                self.target_R_data.append(target_R)
-                                self.actual_R_data.append(actual_R)
-                                
-                            except ValueError:
-                                pass
-                time.sleep(0.01)
-            except Exception as e:
-                print(f"Read error: {e}")
-                break
+                # Bỏ qua target từ Arduino, lấy target từ GUI
+                actual_L = float(parts[1])
+                actual_R = float(parts[2])
+                
+                # Lấy target từ slider GUI
+                target_L = float(self.L_rpm_scale.get())
+                target_R = float(self.R_rpm_scale.get())
+                
+                # Update data (thời điểm nhận byte, không phải lúc xử lý)
+                current_time = timestamp - self.start_time
+                self.telemetry.append(current_time, target_L, actual_L, target_R, actual_R)
+                
+            except ValueError:
+                pass
                 
     def send_control(self):
         """Gửi một lần (dùng cho test hoặc manual)"""
-        if not self.is_connected or not self.ser:
+        if not self.is_connected or not self.command_queue:
             return
             
         L_dir = self.L_dir_var.get()
@@ -328,11 +341,8 @@ class MotorControlApp:
         # Tạo chuỗi gửi: "L_dir,L_rpm,R_dir,R_rpm#"
         command = f"{L_dir},{L_rpm},{R_dir},{R_rpm}#\n"
         
-        try:
-            self.ser.write(command.encode('utf-8'))
-            print(f"Sent: {command.strip()}")
-        except Exception as e:
-            print(f"Send error: {e}")
+        self.command_queue.submit(command)
+        print(f"Sent: {command.strip()}")
 
 def main():
     root = tk.Tk()